@@ -14,11 +14,13 @@ import sys
 import logging
 import subprocess
 import json
-import requests
 from typing import Dict, List, Optional, Any
 import tempfile
 from pathlib import Path
 
+from services.ollama_client import generate_stream, OllamaStreamError
+from services.http_session import get_session
+
 logger = logging.getLogger(__name__)
 
 class FastWhisperIntegration:
@@ -39,37 +41,44 @@ class FastWhisperIntegration:
             logger.warning("⚠ Faster-Whisper not available")
             self.available = False
 
-    def load_model(self, model_size: str = "base"):
+    def load_model(self, model_size: str = "base", device: str = "cpu",
+                   device_index: int = 0, compute_type: str = "int8"):
         """تحميل نموذج Whisper"""
         if not self.available:
             raise ImportError("Faster-Whisper not available")
 
-        if model_size in self.model_cache:
-            return self.model_cache[model_size]
+        # مفتاح التخزين يشمل الجهاز لأن نفس النموذج قد يُحمّل على المعالج أو على GPU
+        cache_key = model_size if device == "cpu" else f"{model_size}@{device}:{device_index}"
+        if cache_key in self.model_cache:
+            return self.model_cache[cache_key]
 
         try:
             from faster_whisper import WhisperModel
 
             # تحميل النموذج
-            model = WhisperModel(model_size, device="cpu", compute_type="int8")
-            self.model_cache[model_size] = model
+            model = WhisperModel(model_size, device=device, device_index=device_index,
+                                 compute_type=compute_type)
+            self.model_cache[cache_key] = model
 
-            logger.info(f"✓ Loaded Whisper model: {model_size}")
+            logger.info(f"✓ Loaded Whisper model: {model_size} ({device})")
             return model
 
         except Exception as e:
             logger.error(f"❌ Failed to load model {model_size}: {str(e)}")
             return None
 
-    def transcribe_audio(self, audio_path: str, model_size: str = "base") -> Dict[str, Any]:
+    def transcribe_audio(self, audio_path: str, model_size: str = "base", device: str = "cpu",
+                         device_index: int = 0, compute_type: str = "int8",
+                         language: Optional[str] = None) -> Dict[str, Any]:
         """تحويل الصوت إلى نص"""
         try:
-            model = self.load_model(model_size)
+            model = self.load_model(model_size, device=device, device_index=device_index,
+                                    compute_type=compute_type)
             if not model:
                 return {"error": "Failed to load model"}
 
             # تنفيذ التحويل
-            segments, info = model.transcribe(audio_path, beam_size=5)
+            segments, info = model.transcribe(audio_path, beam_size=5, language=language)
 
             # تجميع النتائج
             text_segments = []
@@ -107,7 +116,7 @@ class OllamaIntegration:
     def _check_availability(self):
         """فحص توفر خدمة Ollama"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = get_session(self.base_url).get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 self.available = True
                 logger.info("✓ Ollama service available")
@@ -130,31 +139,29 @@ class OllamaIntegration:
             payload = {
                 "model": model,
                 "prompt": prompt,
-                "stream": False,
                 "options": {
                     "temperature": 0.3,
                     "top_p": 0.9,
-                    "max_tokens": 2000
+                    "num_predict": 2000
                 }
             }
 
-            response = requests.post(f"{self.base_url}/api/generate", 
-                                   json=payload, timeout=60)
-
-            if response.status_code == 200:
-                result = response.json()
-                translation = result.get('response', '').strip()
+            # البث يسمح بقطع التوليد الخارج عن السيطرة عند سقف الرموز
+            result = generate_stream(f"{self.base_url}/api/generate", payload,
+                                     timeout=60, max_tokens=2000)
+            translation = result['response'].strip()
 
-                return {
-                    "success": True,
-                    "translation": translation,
-                    "model": model,
-                    "source_language": "English",
-                    "target_language": target_language
-                }
-            else:
-                return {"error": f"Ollama API error: {response.status_code}"}
+            return {
+                "success": True,
+                "translation": translation,
+                "model": model,
+                "source_language": "English",
+                "target_language": target_language,
+                "truncated": result['stopped'] == 'token_limit'
+            }
 
+        except OllamaStreamError as e:
+            return {"error": str(e)}
         except Exception as e:
             logger.error(f"❌ Translation failed: {str(e)}")
             return {"error": str(e)}
@@ -165,7 +172,7 @@ class OllamaIntegration:
             return []
 
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+            response = get_session(self.base_url).get(f"{self.base_url}/api/tags", timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 models = [model['name'] for model in data.get('models', [])]
@@ -1,10 +1,7 @@
 #!/usr/bin/env python3
 import os
-import sys
 import json
 import time
-import glob
-import subprocess
 import threading
 import logging
 
@@ -13,14 +10,23 @@ logger = logging.getLogger(__name__)
 import math
 import psutil
 import shutil
-import requests
 from datetime import datetime
 from urllib.parse import urlparse
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, send_file
 from werkzeug.security import check_password_hash, generate_password_hash
-from models import db, Settings, MediaFile, Log, TranslationJob, Notification, UserSession, PasswordReset, TranslationHistory, DatabaseStats, TranslationLog
+from models import db, Settings, MediaFile, Log, TranslationJob, Notification, UserSession, PasswordReset, TranslationHistory, DatabaseStats, TranslationLog, media_file_list_options
 from translations import get_translation, t
 from services.remote_storage import setup_remote_mount, get_mount_status
+from services.http_session import get_session
+from media_stats import get_media_stats
+from pagination import keyset_page, ranked_page, cached_count, InvalidCursor
+from search_index import ranked_ids, like_filter
+from thumbnail_store import get_thumbnail_store, guess_mimetype, VARIANTS
+from log_writer import BufferedLogWriter
+from subtitle_index import SubtitleIndex
+from job_queue import (enqueue, cancel_job, cancel_active_jobs, list_jobs, read_job_status, is_file_claimed,
+                       PRIORITY_NORMAL, PRIORITY_HIGH)
+from task_registry import running_tasks, stop_tasks
 from gpu_manager import gpu_manager, get_gpu_environment_variables
 from system_monitor import get_system_monitor
 
@@ -153,12 +159,12 @@ def is_video_file_supported(file_path):
 def download_thumbnail(url, media_file_id):
     """Download and save thumbnail for media file"""
     try:
-        response = requests.get(url, timeout=10)
+        response = get_session(url).get(url, timeout=10)
         if response.status_code == 200:
-            # Save thumbnail data to database
+            # Save the image on disk; the database keeps only its content key
             media_file = MediaFile.query.get(media_file_id)
             if media_file:
-                media_file.thumbnail_data = response.content
+                media_file.thumbnail_key = get_thumbnail_store().put(response.content)
                 media_file.thumbnail_url = url
                 db.session.commit()
                 return True
@@ -191,18 +197,18 @@ def update_setting(key, value):
         log_to_db("ERROR", f"Failed to update setting {key}", str(e))
         return False
 
+def write_log_rows(rows):
+    """Insert a batch of buffered log records on a connection of its own"""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(Log.__table__.insert(), rows)
+
+# Buffered so request handlers and tasks never wait on a commit per message
+log_writer = BufferedLogWriter(write_log_rows)
+
 def log_to_db(level, message, details=""):
     """Log message to database"""
-    try:
-        log_entry = Log()
-        log_entry.level = level
-        log_entry.message = message
-        log_entry.details = details
-        log_entry.source = "web_app"
-        db.session.add(log_entry)
-        db.session.commit()
-    except Exception as e:
-        print(f"Failed to log to database: {e}")
+    log_writer.write(level, message, details, source="web_app")
 
 def log_to_file(message):
     """Log message to file"""
@@ -217,7 +223,7 @@ def log_translation_event(file_path, file_name, status, progress=0.0, error_mess
     """Log translation event to database"""
     try:
         # Check if log already exists for this file
-        existing_log = TranslationLog.query.filter_by(path=file_path).first()
+        existing_log = TranslationLog.query.filter_by(file_path=file_path).first()
         
         if existing_log:
             # Update existing log
@@ -315,8 +321,27 @@ def get_safe_file_path(relative_path):
     
     return None
 
-def get_current_status():
-    """Get current processing status"""
+def get_current_status(tasks=None):
+    """Get current processing status
+
+    While queued jobs run, each has its own status file; the most recently
+    updated one is returned at the top level and all of them under 'jobs'.
+    Otherwise status.json holds the last finished job.
+    """
+    try:
+        if tasks is None:
+            tasks = running_tasks()
+        jobs = []
+        for task in tasks:
+            job_status = read_job_status(task['job_id']) if task.get('job_id') else None
+            if job_status:
+                jobs.append(job_status)
+        if jobs:
+            status = dict(max(jobs, key=lambda job: job.get('updated_at') or 0))
+            status['jobs'] = jobs
+            return status
+    except Exception:
+        pass
     try:
         if os.path.exists(STATUS_FILE):
             with open(STATUS_FILE, 'r', encoding='utf-8') as f:
@@ -383,28 +408,22 @@ def remove_from_blacklist(path):
     return False
 
 def is_task_running():
-    """Check if any background task is running"""
+    """Check if any background task is running (from the task registry, no process scan)"""
     try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            cmdline = proc.info['cmdline']
-            if cmdline and any('background_tasks.py' in arg for arg in cmdline):
-                return True
-    except:
-        pass
-    return False
+        return bool(running_tasks())
+    except Exception:
+        return False
 
-def run_background_task(task_name, *args):
-    """Run a background task"""
-    if is_task_running():
-        return False, "مهمة أخرى قيد التشغيل حالياً"
-    
+def run_background_task(task_name, *args, priority=PRIORITY_NORMAL):
+    """Queue a background task; the job dispatcher runs it when a slot is free"""
     try:
-        cmd = [sys.executable, 'background_tasks.py', task_name] + list(args)
-        subprocess.Popen(cmd, cwd=PROJECT_DIR)
-        log_to_db("INFO", f"Started background task: {task_name}")
-        return True, f"تم بدء المهمة: {task_name}"
+        job_id, created = enqueue(task_name, args, priority=priority)
+        if created:
+            log_to_db("INFO", f"Queued background task: {task_name} (job {job_id})")
+            return True, f"تمت إضافة المهمة إلى الطابور: {task_name}"
+        return True, f"المهمة موجودة في الطابور بالفعل: {task_name}"
     except Exception as e:
-        log_to_db("ERROR", f"Failed to start task: {task_name}", str(e))
+        log_to_db("ERROR", f"Failed to queue task: {task_name}", str(e))
         return False, f"فشل في بدء المهمة: {str(e)}"
 
 # Routes - These will be registered by main.py
@@ -457,17 +476,12 @@ def dashboard():
     
     status = get_current_status()
     
-    # Get statistics
-    total_files = MediaFile.query.count()
-    translated_files = MediaFile.query.filter_by(translated=True).count()
-    blacklisted_files = MediaFile.query.filter_by(blacklisted=True).count()
-    
-    stats = {
-        'total_files': total_files,
-        'translated_files': translated_files,
-        'blacklisted_files': blacklisted_files,
-        'pending_files': total_files - translated_files - blacklisted_files
-    }
+    # Get statistics (one aggregate query, cached for a few seconds)
+    try:
+        ttl = float(get_setting('dashboard_stats_ttl', '10'))
+    except ValueError:
+        ttl = 10
+    stats = get_media_stats(ttl)
     
     return render_template('dashboard.html', status=status, stats=stats)
 
@@ -477,31 +491,10 @@ def file_management(status='all'):
     if not is_authenticated():
         return redirect(url_for('login'))
     
-    page = request.args.get('page', 1, type=int)
-    per_page = int(get_setting('items_per_page', '24'))
     search = request.args.get('search', '')
     media_type = request.args.get('type', '')
     
-    # Build query
-    query = MediaFile.query
-    
-    if search:
-        query = query.filter(MediaFile.title.contains(search))
-    
-    if media_type:
-        query = query.filter_by(media_type=media_type)
-    
-    if status == 'untranslated':
-        query = query.filter_by(translated=False, blacklisted=False)
-    elif status == 'translated':
-        query = query.filter_by(translated=True)
-    elif status == 'blacklisted':
-        query = query.filter_by(blacklisted=True)
-    
-    # Paginate results
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    files = pagination.items
-    
+    # The list itself is loaded page by page from /api/files with cursors
     # Set page title based on status
     if status == 'untranslated':
         page_title = t('files_to_translate')
@@ -513,8 +506,6 @@ def file_management(status='all'):
         page_title = t('all_files')
 
     return render_template('file_management.html', 
-                         files=files, 
-                         pagination=pagination,
                          status=status,
                          page_title=page_title,
                          search=search,
@@ -532,7 +523,7 @@ def blacklist_page():
         return redirect(url_for('login'))
     
     # Get blacklisted media files from database with full information
-    blacklisted_files = MediaFile.query.filter_by(blacklisted=True).all()
+    blacklisted_files = MediaFile.query.options(media_file_list_options()).filter_by(blacklisted=True).all()
     
     # Also read blacklist from file for paths not in database
     file_blacklist = read_blacklist()
@@ -1032,8 +1023,13 @@ def database_admin_page():
 # API Routes
 @app.route('/api/status')
 def api_status():
-    status = get_current_status()
-    status['is_running'] = is_task_running()
+    try:
+        tasks = running_tasks()
+    except Exception:
+        tasks = []
+    status = get_current_status(tasks)
+    status['is_running'] = bool(tasks)
+    status['running_tasks'] = [{'task': t.get('task'), 'job_id': t.get('job_id'), 'started_at': t.get('started_at')} for t in tasks]
     return jsonify(status)
 
 @app.route('/api/health-check')
@@ -1103,12 +1099,21 @@ def api_files():
     search = request.args.get('search', '', type=str)
     media_type = request.args.get('media_type', 'all', type=str)
     status = request.args.get('status', 'all', type=str)
+    cursor = request.args.get('cursor', '', type=str)
+    # paging=cursor (or any cursor) switches from OFFSET pages to keyset pages
+    use_cursor = bool(cursor) or request.args.get('paging') == 'cursor'
+    order = request.args.get('order', 'id', type=str)
     
-    query = MediaFile.query
+    query = MediaFile.query.options(media_file_list_options())
     
-    # Apply search filter
+    # Apply search filter (full-text index when available, ranked by relevance)
+    ranked = None
     if search:
-        query = query.filter(MediaFile.title.contains(search))
+        ranked = ranked_ids(search)
+        if ranked is None:
+            query = query.filter(like_filter(search))
+        else:
+            query = query.filter(MediaFile.id.in_(ranked))
     
     # Apply media type filter
     if media_type != 'all':
@@ -1117,16 +1122,83 @@ def api_files():
         elif media_type == 'tv':
             query = query.filter(MediaFile.media_type == 'episode')
     
-    # Apply status filter (translated/untranslated)
+    # Apply status filter (same meaning as the /files/<status> pages)
     if status == 'translated':
         query = query.filter(MediaFile.translated == True)
     elif status == 'untranslated':
-        query = query.filter(MediaFile.translated == False)
+        query = query.filter(MediaFile.translated == False, MediaFile.blacklisted == False)
+    elif status == 'blacklisted':
+        query = query.filter(MediaFile.blacklisted == True)
     
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    if ranked is not None:
+        # Search results are capped, so they are ordered by rank and paged in memory
+        position = {file_id: i for i, file_id in enumerate(ranked)}
+        matches = sorted(query.all(), key=lambda f: position[f.id])
+        if use_cursor:
+            try:
+                result = ranked_page(matches, per_page, cursor or None)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            items = result['items']
+            pagination_data = {
+                'mode': 'cursor',
+                'order': 'rank',
+                'per_page': per_page,
+                'total': len(matches),
+                'total_is_approximate': False,
+                'next_cursor': result['next_cursor'],
+                'prev_cursor': result['prev_cursor'],
+                'has_prev': result['has_prev'],
+                'has_next': result['has_next']
+            }
+        else:
+            pages = max(1, math.ceil(len(matches) / per_page))
+            items = matches[(page - 1) * per_page:page * per_page]
+            pagination_data = {
+                'page': page,
+                'pages': pages,
+                'total': len(matches),
+                'per_page': per_page,
+                'has_prev': page > 1,
+                'has_next': page < pages
+            }
+    elif use_cursor:
+        column = MediaFile.path if order == 'path' else MediaFile.id
+        try:
+            result = keyset_page(query, column, per_page, cursor or None)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        items = result['items']
+        try:
+            count_ttl = float(get_setting('files_count_cache_ttl', '60'))
+        except ValueError:
+            count_ttl = 60
+        total = cached_count(query, f"files:{search}:{media_type}:{status}", count_ttl)
+        pagination_data = {
+            'mode': 'cursor',
+            'order': column.key,
+            'per_page': per_page,
+            'total': total,
+            'total_is_approximate': True,
+            'next_cursor': result['next_cursor'],
+            'prev_cursor': result['prev_cursor'],
+            'has_prev': result['has_prev'],
+            'has_next': result['has_next']
+        }
+    else:
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        items = pagination.items
+        pagination_data = {
+            'page': pagination.page,
+            'pages': pagination.pages,
+            'total': pagination.total,
+            'per_page': pagination.per_page,
+            'has_prev': pagination.has_prev,
+            'has_next': pagination.has_next
+        }
     
     files_data = []
-    for file in pagination.items:
+    for file in items:
         files_data.append({
             'id': file.id,
             'path': file.path,
@@ -1134,6 +1206,7 @@ def api_files():
             'year': file.year,
             'media_type': file.media_type,
             'poster_url': file.poster_url,
+            'thumbnail': url_for('thumbnail', key=file.thumbnail_key, size='small') if file.thumbnail_key else None,
             'translated': file.translated,
             'blacklisted': file.blacklisted,
             'file_size': file.file_size,
@@ -1142,16 +1215,35 @@ def api_files():
     
     return jsonify({
         'files': files_data,
-        'pagination': {
-            'page': pagination.page,
-            'pages': pagination.pages,
-            'total': pagination.total,
-            'per_page': pagination.per_page,
-            'has_prev': pagination.has_prev,
-            'has_next': pagination.has_next
-        }
+        'pagination': pagination_data
     })
 
+@app.route('/thumbnail/<key>')
+def thumbnail(key):
+    """Serve a cached poster; keys are content hashes so responses never change"""
+    if not is_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    size = request.args.get('size')
+    variant = size if size in VARIANTS else None
+    resolved = get_thumbnail_store().resolve(key, variant)
+    if not resolved:
+        return jsonify({'error': 'Not found'}), 404
+    path, served = resolved
+    
+    # الوسم يصف الملف المُرسل فعلاً؛ الأصل المُرسل بدلاً من مقاس متعذر لا يُخزَّن كأنه المقاس
+    etag = f"{key}-{served or 'orig'}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = send_file(path, mimetype=guess_mimetype(path))
+    response.set_etag(etag)
+    if served == variant:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
 @app.route('/api/system-monitor')
 def api_system_monitor_stats():
     try:
@@ -2007,7 +2099,7 @@ def action_start_batch():
     if not is_authenticated():
         return jsonify({'error': translate_text('not_authenticated')}), 401
     
-    success, message = run_background_task('batch_translate')
+    success, message = run_background_task('batch_translate_task')
     
     if success:
         return jsonify({'success': True, 'message': translate_text('batch_translation_started')})
@@ -2020,13 +2112,9 @@ def action_stop():
         return jsonify({'error': translate_text('not_authenticated')}), 401
     
     try:
-        # Find and terminate background processes
-        terminated = False
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            cmdline = proc.info['cmdline']
-            if cmdline and any('background_tasks.py' in arg for arg in cmdline):
-                proc.terminate()
-                terminated = True
+        # إلغاء المهام المنتظرة، ثم إيقاف كل مهمة مسجلة (بما فيها المشغلة يدوياً خارج الطابور)
+        cancelled, signalled = cancel_active_jobs()
+        terminated = cancelled + stop_tasks(exclude_pids=signalled) > 0
         
         if terminated:
             log_to_db("INFO", "Background tasks stopped")
@@ -2042,13 +2130,52 @@ def action_sync_library():
     if not is_authenticated():
         return jsonify({'error': 'غير مصرح'}), 401
     
-    success, message = run_background_task('sync_library')
+    # mode=full يتجاهل علامة آخر مزامنة ويعيد جلب المكتبة كاملة
+    mode = 'full' if request.values.get('mode') == 'full' else 'auto'
+    success, message = run_background_task('sync_library_task', mode)
     
     if success:
         return jsonify({'success': True, 'message': message})
     else:
         return jsonify({'error': message}), 500
 
+@app.route('/action/single-translate', methods=['POST'])
+def action_single_translate():
+    if not is_authenticated():
+        return jsonify({'error': translate_text('not_authenticated')}), 401
+    
+    path = request.values.get('path')
+    if not path or not MediaFile.query.filter_by(path=path).first():
+        return jsonify({'error': 'مسار الملف غير موجود في المكتبة'}), 404
+    if is_file_claimed(path):
+        return jsonify({'error': 'الملف قيد الترجمة في مهمة أخرى'}), 409
+    
+    # ملف واحد عاجل يتقدم على المهام المنتظرة ولا ينتظر انتهاء الدفعة الجارية
+    success, message = run_background_task('single_file_translate_task', path, priority=PRIORITY_HIGH)
+    
+    if success:
+        return jsonify({'success': True, 'message': message})
+    else:
+        return jsonify({'error': message}), 500
+
+@app.route('/api/jobs')
+def api_jobs():
+    if not is_authenticated():
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({'jobs': list_jobs(limit)})
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    if not is_authenticated():
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    if cancel_job(job_id):
+        log_to_db("INFO", f"Cancelled background job {job_id}")
+        return jsonify({'success': True})
+    return jsonify({'error': 'المهمة غير موجودة أو انتهت'}), 404
+
 @app.route('/action/run-corrections', methods=['POST'])
 def action_run_corrections():
     if not is_authenticated():
@@ -2060,8 +2187,11 @@ def action_run_corrections():
         try:
             # Find and rename subtitle files
             corrections_made = 0
+            media_files = MediaFile.query.options(media_file_list_options()).filter_by(translated=True).all()
+            subtitles = SubtitleIndex()
+            subtitles.preload(media_file.path for media_file in media_files)
             
-            for media_file in MediaFile.query.filter_by(translated=True).all():
+            for media_file in media_files:
                 file_dir = os.path.dirname(media_file.path)
                 filename = os.path.splitext(os.path.basename(media_file.path))[0]
                 
@@ -2069,9 +2199,10 @@ def action_run_corrections():
                 hi_srt = os.path.join(file_dir, f"{filename}.hi.srt")
                 ar_srt = os.path.join(file_dir, f"{filename}.ar.srt")
                 
-                if os.path.exists(hi_srt) and not os.path.exists(ar_srt):
+                if subtitles.exists(hi_srt) and not subtitles.exists(ar_srt):
                     try:
                         os.rename(hi_srt, ar_srt)
+                        subtitles.record_rename(hi_srt, ar_srt)
                         corrections_made += 1
                         yield f"data: تم تصحيح: {filename}\n\n"
                         time.sleep(0.1)
@@ -2105,10 +2236,7 @@ def action_scan_translation_status():
     if not is_authenticated():
         return redirect(url_for('login'))
     
-    if is_task_running():
-        return jsonify({'error': translate_text('task_already_running')}), 400
-    
-    success = run_background_task("scan_translation_status_task")
+    success, message = run_background_task("scan_translation_status_task")
     
     if success:
         create_notification('scan_started', 'scan_translation_status_started', 'info')
@@ -2218,7 +2346,7 @@ def api_database_stats():
             db_size_mb = round(os.path.getsize(db_path) / (1024 * 1024), 2)
         
         # Query all tables with proper error handling
-        tables = ['settings', 'media_files', 'logs', 'translation_jobs', 'notifications', 'user_sessions', 'translation_history']
+        tables = ['settings', 'media_files', 'logs', 'translation_jobs', 'notifications', 'user_sessions', 'translation_history', 'translation_memory']
         tables_info = []
         total_records = 0
         
@@ -2257,6 +2385,17 @@ def api_database_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/translation-memory/stats')
+def api_translation_memory_stats():
+    if not is_authenticated():
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    try:
+        from translation_memory import get_translation_memory_stats
+        return jsonify(get_translation_memory_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/database/tables')
 def api_database_tables():
     if not is_authenticated():
@@ -2553,6 +2692,14 @@ with app.app_context():
     # Create all database tables
     db.create_all()
     
+    # Apply schema migrations (indexes/columns on existing tables)
+    try:
+        from migrations import run_migrations
+        run_migrations()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to apply database migrations: {e}")
+    
     # Initialize default settings if database is empty
     if not Settings.query.first():
         default_settings = [
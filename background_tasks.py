@@ -1,11 +1,12 @@
-import requests
 import os
 import sys
 import time
-import glob
 import sqlite3
-import subprocess
 import json
+import signal
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # استيراد العامل من نفس المجلد
 try:
@@ -14,6 +15,17 @@ except ImportError:
     print("FATAL: Could not import 'main' from process_video.py. It must be in the same directory.")
     sys.exit(1)
 
+from process_video import load_settings
+from batch_pipeline import BatchPipeline
+from whisper_worker import get_whisper_worker, shutdown_whisper_worker, is_worker_available
+from services.http_session import get_session, configure_http_pool
+from poster_prefetch import prefetch_posters
+from log_writer import BufferedLogWriter
+from subtitle_index import SubtitleIndex
+from library_scanner import scan_directories, get_mount_concurrency
+from task_registry import register_task
+from job_queue import write_job_status, claim_file, release_file
+
 # --- الإعدادات والمسارات ---
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(PROJECT_DIR, "library.db")
@@ -21,20 +33,34 @@ STATUS_FILE = os.path.join(PROJECT_DIR, "status.json")
 BLACKLIST_FILE = os.path.join(PROJECT_DIR, "blacklist.txt")
 PROCESS_LOG_FILE = os.path.join(PROJECT_DIR, "process.log")
 
+_status_lock = threading.Lock()
+# يضبطه مرسل الطابور لكل مهمة يشغّلها
+JOB_ID = os.environ.get('AI_TRANSLATOR_JOB_ID')
+CURRENT_TASK = sys.argv[1] if __name__ == "__main__" and len(sys.argv) > 1 else None
+
 # --- دوال مساعدة ---
 def get_db_connection():
     conn = sqlite3.connect(DB_FILE, timeout=10)
     conn.row_factory = sqlite3.Row
     return conn
 
-def log_to_db(level, message, details=""):
+def write_log_rows(rows):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
-        conn.execute("INSERT INTO logs (level, message, details) VALUES (?, ?, ?)", (level, message, str(details)))
+        conn.executemany(
+            "INSERT INTO logs (level, message, details, source, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(r['level'], r['message'], r['details'], r['source'], r['created_at'].strftime('%Y-%m-%d %H:%M:%S.%f'))
+             for r in rows]
+        )
         conn.commit()
+    finally:
         conn.close()
-    except Exception as e:
-        print(f"DB_LOG_ERROR: {e}")
+
+# السجلات تُكتب على دفعات من خيط منفصل، وما تبقى يُكتب عند خروج العملية
+_log_writer = BufferedLogWriter(write_log_rows)
+
+def log_to_db(level, message, details=""):
+    _log_writer.write(level, message, str(details))
 
 def log_to_file(message):
     try:
@@ -48,15 +74,35 @@ def get_settings_from_db():
     conn = get_db_connection()
     settings = {row['key']: row['value'] for row in conn.execute("SELECT key, value FROM settings").fetchall()}
     conn.close()
+    configure_http_pool(settings)
     return settings
 
 def update_status(progress, current_file, total_files=0, files_done=0):
+    status = {"progress": progress, "current_file": current_file, "total_files": total_files, "files_done": files_done}
     try:
-        with open(STATUS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"progress": progress, "current_file": current_file, "total_files": total_files, "files_done": files_done}, f, ensure_ascii=False)
+        # مراحل خط المعالجة تكتب الحالة من عدة خيوط
+        with _status_lock:
+            if JOB_ID:
+                # المهام المتزامنة من الطابور تكتب كل منها ملف حالتها
+                write_job_status(JOB_ID, dict(status, job_id=JOB_ID, task=CURRENT_TASK, updated_at=time.time()))
+            else:
+                with open(STATUS_FILE, 'w', encoding='utf-8') as f:
+                    json.dump(status, f, ensure_ascii=False)
     except Exception as e:
         print(f"WARN: Could not write status: {e}")
 
+def make_line_progress_reporter(describe, min_interval=1.0):
+    """Build a throttled progress callback for streamed translation lines"""
+    last_update = [0.0]
+    
+    def report(lines_done, lines_total):
+        now = time.time()
+        if now - last_update[0] < min_interval and lines_done < lines_total:
+            return
+        last_update[0] = now
+        describe(lines_done, lines_total)
+    return report
+
 def read_blacklist():
     try:
         if os.path.exists(BLACKLIST_FILE):
@@ -79,141 +125,455 @@ def map_path(path, config):
         return path.replace(remote_tv, local_tv, 1)
     return None
 
-def get_all_media_paths(config, media_type):
+# أحداث السجل التي تعني تغيّر ملف على القرص
+HISTORY_FILE_EVENTS = {
+    'sonarr': {'downloadFolderImported', 'seriesFolderImported', 'episodeFileDeleted', 'episodeFileRenamed'},
+    'radarr': {'downloadFolderImported', 'movieFolderImported', 'movieFileDeleted', 'movieFileRenamed'},
+}
+# هامش لفرق الساعة بين هذا الخادم وخادم Sonarr/Radarr
+HISTORY_CLOCK_MARGIN = timedelta(minutes=10)
+# بعد هذا العدد من العناصر المتغيرة يصبح الجلب الكامل أسرع من جلب كل عنصر وحده
+INCREMENTAL_MAX_CHANGED = 200
+
+def get_poster_url(item):
+    # remoteUrl رابط مطلق؛ url نسبي لخادم Sonarr/Radarr ولا يعمل في المتصفح مباشرة
+    poster = next((i for i in item.get('images', []) if i.get('coverType') == 'poster'), None)
+    return (poster.get('remoteUrl') or poster.get('url')) if poster else None
+
+def get_sonarr_concurrency(config):
+    try:
+        return max(1, int(config.get('sonarr_sync_concurrency') or 8))
+    except ValueError:
+        return 8
+
+def movie_path_data(item):
+    """Return (path, data) for a Radarr movie that has a file, else None"""
+    if item.get('hasFile') and item.get('movieFile') and item['movieFile'].get('path'):
+        return item['movieFile']['path'], {'type': 'movie', 'poster': get_poster_url(item), 'radarr_id': item.get('id')}
+    return None
+
+def fetch_series_files(session, api_url, headers, series):
+    """Return (path, poster, series_id) for every episode file of one Sonarr series"""
+    series_id = series.get('id')
+    poster = get_poster_url(series)
+    
+    # episodefile يعيد الملفات فقط، أخف بكثير من episode مع includeEpisodeFile
+    response = session.get(f"{api_url}/api/v3/episodefile?seriesId={series_id}", headers=headers, timeout=60)
+    if response.ok:
+        return [(f['path'], poster, series_id) for f in response.json() if f.get('path')]
+    
+    episode_endpoint = f"{api_url}/api/v3/episode?seriesId={series_id}&includeEpisodeFile=true"
+    ep_response = session.get(episode_endpoint, headers=headers, timeout=60)
+    # فشل الطلبين خطأ وليس مسلسلاً بلا ملفات، حتى لا تُعامل ملفاته كمحذوفة
+    ep_response.raise_for_status()
+    return [
+        (episode['episodeFile']['path'], poster, series_id)
+        for episode in ep_response.json()
+        if episode.get('hasFile') and episode.get('episodeFile') and episode['episodeFile'].get('path')
+    ]
+
+def arr_configured(config, arr_type):
+    """Whether the URL and API key for Sonarr/Radarr are set"""
+    return bool(config.get(f'{arr_type}_url') and config.get(f'{arr_type}_api_key'))
+
+def iter_all_media_paths(config, media_type, failed_ids, progress_callback=None):
+    """Yield {path: data} batches for the whole catalog; Sonarr batches are yielded as series arrive
+
+    IDs of series whose episode files could not be fetched are added to failed_ids.
+    """
     arr_type = 'sonarr' if media_type == 'series' else 'radarr'
     api_url = config.get(f'{arr_type}_url')
     api_key = config.get(f'{arr_type}_api_key')
     
-    if not api_url or not api_key:
+    if not arr_configured(config, arr_type):
         log_to_db("WARNING", f"API settings for {arr_type.capitalize()} are missing. Skipping sync.")
-        return {}
+        return
 
     log_to_db("INFO", f"Getting paths from {arr_type.capitalize()}...")
     headers = {"X-Api-Key": api_key}
-    paths_data = {}
+    session = get_session(api_url)
+    batch_size = get_sync_batch_size(config)
+    found = 0
 
     try:
         if media_type == "movies":
             endpoint = f"{api_url}/api/v3/movie"
-            response = requests.get(endpoint, headers=headers, timeout=300)
+            response = session.get(endpoint, headers=headers, timeout=300)
             response.raise_for_status()
+            paths_data = {}
             for item in response.json():
-                if item.get('hasFile') and item.get('movieFile'):
-                    path = item['movieFile'].get('path')
-                    poster = next((i.get('url') for i in item.get('images', []) if i.get('coverType') == 'poster'), None)
-                    if path: paths_data[path] = {'type': 'movie', 'poster': poster}
+                entry = movie_path_data(item)
+                if entry: paths_data[entry[0]] = entry[1]
+            found = len(paths_data)
+            yield paths_data
         elif media_type == "series":
             series_endpoint = f"{api_url}/api/v3/series"
-            series_response = requests.get(series_endpoint, headers=headers, timeout=120)
+            series_response = session.get(series_endpoint, headers=headers, timeout=120)
             series_response.raise_for_status()
-            for series in series_response.json():
-                series_id = series.get('id')
-                poster = next((i.get('url') for i in series.get('images', []) if i.get('coverType') == 'poster'), None)
-                episode_endpoint = f"{api_url}/api/v3/episode?seriesId={series_id}&includeEpisodeFile=true"
-                ep_response = requests.get(episode_endpoint, headers=headers, timeout=60)
-                if ep_response.ok:
-                    for episode in ep_response.json():
-                        if episode.get('hasFile') and episode.get('episodeFile'):
-                            path = episode['episodeFile'].get('path')
-                            if path: paths_data[path] = {'type': 'tv', 'poster': poster}
+            
+            # المسلسلات بدون ملفات لا تحتاج طلباً
+            series_list = [
+                series for series in series_response.json()
+                if (series.get('statistics') or {}).get('episodeFileCount', 1) > 0
+            ]
+            
+            # كل دفعة تُكتب في قاعدة البيانات قبل جمع التالية، فلا تُحمل ردود المكتبة كلها في الذاكرة
+            batch = {}
+            with ThreadPoolExecutor(max_workers=get_sonarr_concurrency(config)) as executor:
+                futures = {
+                    executor.submit(fetch_series_files, session, api_url, headers, series): series
+                    for series in series_list
+                }
+                try:
+                    for done, future in enumerate(as_completed(futures), 1):
+                        series = futures[future]
+                        try:
+                            for path, poster, series_id in future.result():
+                                batch[path] = {'type': 'tv', 'poster': poster, 'sonarr_id': series_id}
+                        except Exception as e:
+                            failed_ids.add(series.get('id'))
+                            log_to_db("WARNING", f"Failed to fetch episodes for {series.get('title')}", str(e))
+                        if progress_callback:
+                            progress_callback(done, len(series_list))
+                        if len(batch) >= batch_size:
+                            found += len(batch)
+                            yield batch
+                            batch = {}
+                finally:
+                    # توقف المستهلك: الطلبات التي لم تبدأ لا داعي لها
+                    for future in futures:
+                        future.cancel()
+            if batch:
+                found += len(batch)
+                yield batch
     except Exception as e:
         log_to_db("ERROR", f"Failed to fetch from {arr_type.capitalize()}", str(e))
     
-    log_to_db("INFO", f"Found {len(paths_data)} paths from {arr_type.capitalize()}.")
+    log_to_db("INFO", f"Found {found} paths from {arr_type.capitalize()}.")
+
+def get_changed_ids(config, arr_type, since):
+    """IDs of the series (Sonarr) or movies (Radarr) whose files changed since `since`"""
+    api_url = config.get(f'{arr_type}_url')
+    headers = {"X-Api-Key": config.get(f'{arr_type}_api_key')}
+    params = {'date': (since - HISTORY_CLOCK_MARGIN).strftime('%Y-%m-%dT%H:%M:%SZ')}
+    
+    response = get_session(api_url).get(f"{api_url}/api/v3/history/since", params=params, headers=headers, timeout=120)
+    response.raise_for_status()
+    
+    id_field = 'seriesId' if arr_type == 'sonarr' else 'movieId'
+    return {
+        record[id_field] for record in response.json()
+        if record.get('eventType') in HISTORY_FILE_EVENTS[arr_type] and record.get(id_field)
+    }
+
+def get_changed_media_paths(config, media_type, ids):
+    """{path: data} like one iter_all_media_paths batch, limited to the given series/movie IDs"""
+    arr_type = 'sonarr' if media_type == 'series' else 'radarr'
+    api_url = config.get(f'{arr_type}_url')
+    headers = {"X-Api-Key": config.get(f'{arr_type}_api_key')}
+    session = get_session(api_url)
+    paths_data = {}
+    
+    if media_type == "movies":
+        for movie_id in ids:
+            response = session.get(f"{api_url}/api/v3/movie/{movie_id}", headers=headers, timeout=60)
+            # 404 يعني أن الفيلم حُذف من Radarr، فتُحذف ملفاته من قاعدة البيانات
+            if response.status_code == 404:
+                continue
+            response.raise_for_status()
+            entry = movie_path_data(response.json())
+            if entry: paths_data[entry[0]] = entry[1]
+        return paths_data
+    
+    def fetch_series(series_id):
+        response = session.get(f"{api_url}/api/v3/series/{series_id}", headers=headers, timeout=60)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return fetch_series_files(session, api_url, headers, response.json())
+    
+    with ThreadPoolExecutor(max_workers=get_sonarr_concurrency(config)) as executor:
+        for files in executor.map(fetch_series, ids):
+            for path, poster, series_id in files:
+                paths_data[path] = {'type': 'tv', 'poster': poster, 'sonarr_id': series_id}
     return paths_data
 
-# --- الدوال الرئيسية للمهام ---
+def fetch_library_changes(config, media_type, last_sync, full, progress_callback=None):
+    """Return (batches, changed_ids, failed_ids); changed_ids is None when the whole catalog is fetched
 
-def sync_library_task():
-    log_to_db("INFO", "Library Sync task started.")
-    log_to_file("Starting library sync...")
-    update_status(0, "Fetching settings...")
-    config = get_settings_from_db()
+    batches is an iterable of {path: data}; failed_ids fills while it is consumed.
+    """
+    arr_type = 'sonarr' if media_type == 'series' else 'radarr'
+    failed_ids = set()
     
-    update_status(5, "Fetching paths from Sonarr...")
-    log_to_file("Fetching TV series from Sonarr...")
-    sonarr_files = get_all_media_paths(config, "series")
+    if not full and last_sync:
+        try:
+            changed_ids = get_changed_ids(config, arr_type, last_sync)
+            if len(changed_ids) <= INCREMENTAL_MAX_CHANGED:
+                log_to_db("INFO", f"{arr_type.capitalize()}: {len(changed_ids)} items changed since {last_sync:%Y-%m-%d %H:%M}.")
+                return [get_changed_media_paths(config, media_type, changed_ids)], changed_ids, failed_ids
+        except Exception as e:
+            log_to_db("WARNING", f"Incremental sync unavailable for {arr_type.capitalize()}, running full sync", str(e))
     
-    update_status(25, "Fetching paths from Radarr...")
-    log_to_file("Fetching movies from Radarr...")
-    radarr_files = get_all_media_paths(config, "movies")
-
-    all_api_files = {**sonarr_files, **radarr_files}
-    if not all_api_files:
-        update_status(100, "Sync finished: Could not retrieve media paths.")
-        log_to_file("Sync failed: No media paths retrieved.")
+    return iter_all_media_paths(config, media_type, failed_ids, progress_callback), None, failed_ids
+
+def full_sync_due(config):
+    """Whether library_full_sync_interval_hours has passed since the last full sync (0 disables)"""
+    try:
+        interval = float(config.get('library_full_sync_interval_hours') or 24)
+    except ValueError:
+        interval = 24
+    if interval <= 0:
+        return False
+    try:
+        last_full = datetime.fromisoformat(config.get('library_last_full_sync') or '')
+    except ValueError:
+        return True
+    return datetime.utcnow() - last_full >= timedelta(hours=interval)
+
+def get_sync_service(db, MediaService, arr_type, config):
+    """سجل الخدمة الذي يحفظ علامة آخر مزامنة لـ Sonarr أو Radarr"""
+    api_url = config.get(f'{arr_type}_url') or ''
+    service = MediaService.query.filter_by(service_type=arr_type).order_by(MediaService.id).first()
+    if not service:
+        service = MediaService(service_type=arr_type, service_name=arr_type.capitalize(), base_url=api_url)
+        db.session.add(service)
+    elif service.base_url != api_url:
+        # خادم مختلف: العلامة القديمة لا تنطبق عليه
+        service.base_url = api_url
+        service.last_sync = None
+    service.api_key = config.get(f'{arr_type}_api_key')
+    db.session.commit()
+    return service
+
+def get_sync_batch_size(config):
+    try:
+        return max(50, int(config.get('sync_batch_size') or 1000))
+    except ValueError:
+        return 1000
+
+def insert_media_rows(db, MediaFile, rows):
+    """Batched multi-row INSERT that skips rows already present (SQLite/PostgreSQL)"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        max_params = 65535
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        max_params = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+    else:
+        db.session.bulk_insert_mappings(MediaFile, rows)
         return
+    
+    # حد عدد المتغيرات في العبارة الواحدة
+    step = max(1, max_params // len(rows[0]))
+    for i in range(0, len(rows), step):
+        db.session.execute(insert(MediaFile.__table__).values(rows[i:i + step]).on_conflict_do_nothing())
+
+def apply_media_paths(db, MediaFile, api_files, config, progress_start=50, progress_span=40, scan_table=None):
+    """Insert or update MediaFile rows for the given API paths; returns the mapped local paths
+
+    scan_table loads every row in one pass instead of IN lookups (None decides by
+    size); progress_span=0 leaves the status to the caller.
+    """
+    batch_size = get_sync_batch_size(config)
+    mapped = {}
+    for api_path, data in api_files.items():
+        local_path = map_path(api_path, config)
+        if local_path:
+            mapped[local_path] = data
+    
+    # تحميل الصفوف الموجودة مرة واحدة بدلاً من استعلام لكل ملف
+    columns = (MediaFile.id, MediaFile.path, MediaFile.translated, MediaFile.has_subtitles,
+               MediaFile.poster_url, MediaFile.sonarr_id, MediaFile.radarr_id)
+    existing = {}
+    if scan_table is None:
+        scan_table = len(mapped) >= batch_size
+    if not scan_table:
+        local_paths = list(mapped)
+        for i in range(0, len(local_paths), 500):
+            for row in db.session.query(*columns).filter(MediaFile.path.in_(local_paths[i:i + 500])):
+                existing[row.path] = row
+    else:
+        for row in db.session.query(*columns).yield_per(5000):
+            existing[row.path] = row
+    
+    # قراءة كل مجلد مرة واحدة بدلاً من فحص ملف الترجمة لكل حلقة
+    subtitles = SubtitleIndex()
+    subtitles.preload(mapped)
+    
+    now = datetime.utcnow()
+    inserts, updates = [], []
+    for local_path, data in mapped.items():
+        has_translation = subtitles.has_subtitle(local_path)
+        row = existing.get(local_path)
         
+        if row is None:
+            inserts.append({
+                'path': local_path,
+                'media_type': data['type'],
+                'translated': has_translation,
+                'has_subtitles': has_translation,
+                'poster_url': data.get('poster'),
+                'sonarr_id': data.get('sonarr_id'),
+                'radarr_id': data.get('radarr_id'),
+                'service_source': 'radarr' if data['type'] == 'movie' else 'sonarr',
+                'created_at': now,
+                'updated_at': now,
+            })
+            continue
+        
+        poster_url = data.get('poster') or row.poster_url
+        changes = {
+            'translated': has_translation,
+            'has_subtitles': has_translation,
+            'poster_url': poster_url,
+            'sonarr_id': data.get('sonarr_id', row.sonarr_id),
+            'radarr_id': data.get('radarr_id', row.radarr_id),
+        }
+        # الصفوف التي لم يتغير فيها شيء لا تُكتب
+        if any(getattr(row, key) != value for key, value in changes.items()):
+            # تغير رابط الملصق يعني أن الصورة المخزنة قديمة؛ prefetch_posters في نهاية المزامنة ينزّل الجديدة
+            if poster_url != row.poster_url:
+                changes['thumbnail_key'] = None
+            changes.update(id=row.id, updated_at=now)
+            updates.append(changes)
+    
+    total = len(inserts) + len(updates)
+    log_to_file(f"Sync: {len(inserts)} new, {len(updates)} changed, {len(mapped) - total} unchanged files.")
+    done = 0
+    for pending, apply in ((inserts, lambda batch: insert_media_rows(db, MediaFile, batch)),
+                           (updates, lambda batch: db.session.bulk_update_mappings(MediaFile, batch))):
+        for i in range(0, len(pending), batch_size):
+            apply(pending[i:i + batch_size])
+            db.session.commit()
+            done += len(pending[i:i + batch_size])
+            if progress_span:
+                update_status(progress_start + int(done / total * progress_span), f"Syncing library ({done}/{total})...")
+    
+    return set(mapped)
+
+# --- الدوال الرئيسية للمهام ---
+def sync_library_task(mode='auto'):
+    """Sync the library with Sonarr/Radarr; 'auto' applies only what changed since the last sync"""
+    log_to_db("INFO", f"Library Sync task started ({mode}).")
+    log_to_file("Starting library sync...")
+    update_status(0, "Fetching settings...")
+    config = get_settings_from_db()
+    sync_started = datetime.utcnow()
+    full = mode == 'full' or full_sync_due(config)
+    
     try:
         from app import app, db
-        from models import MediaFile
-        from datetime import datetime
+        from models import MediaFile, MediaService, Settings
         
         with app.app_context():
-            # Get existing paths from database
-            existing_files = MediaFile.query.all()
-            db_paths = {file.path for file in existing_files}
-            api_local_paths = set()
-            total_api_files = len(all_api_files)
-            
-            log_to_db("INFO", f"Syncing {total_api_files} files with database...")
-            log_to_file(f"Processing {total_api_files} media files...")
-            
-            for i, (api_path, data) in enumerate(all_api_files.items()):
-                progress = 50 + int((i/total_api_files)*40)
-                update_status(progress, f"Syncing: {os.path.basename(api_path)}")
-                
-                local_path = map_path(api_path, config)
-                if not local_path: 
+            stages = [
+                ('sonarr', 'series', 5, 45, lambda done, total: update_status(5 + int(done / total * 40), f"Syncing episodes from Sonarr ({done}/{total} series)...")),
+                ('radarr', 'movies', 50, 90, None),
+            ]
+            all_fetched = True
+            for arr_type, media_type, progress, progress_end, progress_callback in stages:
+                # خدمة غير مهيأة لا تُجلب ولا تمنع تسجيل المزامنة الكاملة للخدمة الأخرى
+                if not arr_configured(config, arr_type):
+                    log_to_file(f"{arr_type.capitalize()} is not configured, skipping.")
                     continue
+                service = get_sync_service(db, MediaService, arr_type, config)
+                update_status(progress, f"Fetching paths from {arr_type.capitalize()}...")
+                log_to_file(f"Fetching {media_type} from {arr_type.capitalize()} ({'full' if full or not service.last_sync else 'incremental'})...")
+                batches, changed_ids, failed_ids = fetch_library_changes(config, media_type, service.last_sync, full, progress_callback)
                 
-                api_local_paths.add(local_path)
-                has_translation = os.path.exists(f"{os.path.splitext(local_path)[0]}.ar.srt")
+                # جلب Sonarr الكامل يصل دفعات مع اكتمال كل مسلسل وتُكتب كل دفعة فوراً؛ التقدم يأتي من الجلب
+                streamed = changed_ids is None and media_type == 'series'
+                service.sync_status = 'syncing'
+                api_local_paths = set()
+                fetched = 0
+                for paths_data in batches:
+                    fetched += len(paths_data)
+                    api_local_paths |= apply_media_paths(
+                        db, MediaFile, paths_data, config,
+                        progress_start=progress + 5, progress_span=0 if streamed else progress_end - progress - 5,
+                        scan_table=False if streamed else None,
+                    )
                 
-                # Check if file exists in database
-                existing_file = MediaFile.query.filter_by(path=local_path).first()
+                # جلب كامل فارغ يعني غالباً فشل الاتصال، فلا يُحذف شيء ولا تتقدم العلامة
+                if changed_ids is None and not fetched:
+                    all_fetched = False
+                    service.sync_status = 'failed'
+                    db.session.commit()
+                    continue
+                log_to_db("INFO", f"Synced {fetched} {arr_type.capitalize()} files with database.")
+                if failed_ids:
+                    # المزامنة الكاملة التالية تعيد جلب هذه المسلسلات
+                    all_fetched = False
+                    log_to_db("WARNING", f"Episode files of {len(failed_ids)} series could not be fetched; their records are kept.")
                 
-                if existing_file:
-                    # Update existing file
-                    existing_file.translated = has_translation
-                    existing_file.has_subtitles = has_translation
-                    existing_file.updated_at = datetime.utcnow()
-                    if data.get('poster'):
-                        existing_file.poster_url = data['poster']
-                else:
-                    # Create new file record
-                    new_file = MediaFile()
-                    new_file.path = local_path
-                    new_file.media_type = data['type']
-                    new_file.translated = has_translation
-                    new_file.has_subtitles = has_translation
-                    new_file.poster_url = data.get('poster')
-                    new_file.service_source = 'radarr' if data['type'] == 'movie' else 'sonarr'
-                    db.session.add(new_file)
-
-            # Delete stale records
-            paths_to_delete = db_paths - api_local_paths
-            if paths_to_delete:
-                log_to_db("INFO", f"Deleting {len(paths_to_delete)} stale records from DB.")
-                log_to_file(f"Removing {len(paths_to_delete)} stale records from database...")
-                MediaFile.query.filter(MediaFile.path.in_(paths_to_delete)).delete(synchronize_session=False)
-
-            db.session.commit()
+                # الملفات التي لم تعد موجودة: كل ملفات الخدمة عند الجلب الكامل، أو ملفات العناصر المتغيرة فقط
+                id_column = MediaFile.sonarr_id if arr_type == 'sonarr' else MediaFile.radarr_id
+                stale_query = db.session.query(MediaFile.path, id_column).filter(MediaFile.service_source == arr_type)
+                if changed_ids is not None:
+                    stale_query = stale_query.filter(id_column.in_(changed_ids)) if changed_ids else None
+                # غياب ملفات مسلسل فشل جلبه من الرد لا يعني أنها حُذفت
+                paths_to_delete = ({path for path, item_id in stale_query if item_id not in failed_ids}
+                                   if stale_query is not None else set()) - api_local_paths
+                if paths_to_delete:
+                    log_to_db("INFO", f"Deleting {len(paths_to_delete)} stale {arr_type.capitalize()} records from DB.")
+                    log_to_file(f"Removing {len(paths_to_delete)} stale records from database...")
+                    stale_paths = list(paths_to_delete)
+                    for i in range(0, len(stale_paths), 500):
+                        MediaFile.query.filter(MediaFile.path.in_(stale_paths[i:i + 500])).delete(synchronize_session=False)
+                
+                service.last_sync = sync_started
+                service.sync_status = 'completed'
+                service.error_message = None
+                service.media_count = MediaFile.query.filter_by(service_source=arr_type).count()
+                db.session.commit()
+            
+            if full and all_fetched:
+                last_full = Settings.query.filter_by(key='library_last_full_sync').first()
+                if not last_full:
+                    last_full = Settings(key='library_last_full_sync', section='SYSTEM', type='string',
+                                         description='Time of the last full library sync (set automatically)')
+                    db.session.add(last_full)
+                last_full.value = sync_started.isoformat()
+                db.session.commit()
     except Exception as e:
         log_to_db("ERROR", f"Sync library error: {str(e)}")
         log_to_file(f"Sync library error: {str(e)}")
+    
+    # الملصقات الجديدة تُنزّل الآن لكي لا تنتظر واجهة الملفات أي خادم خارجي
+    update_status(90, "Prefetching posters...")
+    run_poster_prefetch(config, 90, 10)
     update_status(100, "Library sync complete!")
     log_to_db("INFO", "Library Sync task finished.")
     log_to_file("Library sync completed successfully.")
 
+def run_poster_prefetch(config, progress_start=0, progress_span=100):
+    try:
+        stats = prefetch_posters(
+            config,
+            lambda done, total: update_status(progress_start + int(done / total * progress_span), f"Downloading posters ({done}/{total})...")
+        )
+        if stats['downloaded'] or stats['failed']:
+            log_to_db("INFO", f"Posters: {stats['downloaded']} downloaded for {stats['files']} files, "
+                              f"{stats['failed']} failed, {stats['skipped']} waiting for retry.")
+    except Exception as e:
+        log_to_db("ERROR", "Poster prefetch failed", str(e))
+
+def prefetch_posters_task():
+    log_to_db("INFO", "Poster prefetch task started.")
+    update_status(0, "Downloading posters...")
+    run_poster_prefetch(get_settings_from_db())
+    update_status(100, "Poster prefetch complete!")
+    log_to_db("INFO", "Poster prefetch task finished.")
+
 def corrections_task():
     log_to_db("INFO", "Corrections task started.")
     log_to_file("Starting subtitle corrections...")
     
     try:
         from app import app, db
-        from models import MediaFile, Settings
-        import glob
+        from models import MediaFile, Settings, media_file_list_options
         from datetime import datetime
         
         with app.app_context():
@@ -224,34 +584,39 @@ def corrections_task():
             rename_hi = rename_hi_setting.value.lower() == 'yes' if rename_hi_setting else True
             rename_generic = rename_generic_setting.value.lower() == 'yes' if rename_generic_setting else True
             
-            # Get all media files
-            media_files = MediaFile.query.all()
+            # Get all media files (list columns only, the rest stays deferred)
+            media_files = MediaFile.query.options(media_file_list_options()).all()
             total_files = len(media_files)
             fixed_count = 0
             
             log_to_file(f"Processing {total_files} media files for corrections...")
             
+            # كل أسئلة الوجود و glob تُجاب من قائمة المجلد المقروءة مرة واحدة
+            subtitles = SubtitleIndex()
+            subtitles.preload(media_file.path for media_file in media_files)
+            
             for i, media_file in enumerate(media_files):
                 file_path = media_file.path
                 progress = int((i / total_files) * 100) if total_files > 0 else 0
                 update_status(progress, f"Correcting: {os.path.basename(file_path)}")
                 
-                if not os.path.exists(file_path):
+                if not subtitles.exists(file_path):
                     continue
                     
                 base_path = os.path.splitext(file_path)[0]
                 target_srt = f"{base_path}.ar.srt"
                 
                 # Skip if Arabic subtitle already exists
-                if os.path.exists(target_srt):
+                if subtitles.exists(target_srt):
                     continue
                 
                 # Look for .hi.srt files
                 if rename_hi:
-                    hi_files = glob.glob(f"{base_path}*.hi.srt")
+                    hi_files = subtitles.sidecars(file_path, '.hi.srt')
                     for hi_file in hi_files:
                         try:
                             os.rename(hi_file, target_srt)
+                            subtitles.record_rename(hi_file, target_srt)
                             fixed_count += 1
                             log_to_file(f"Renamed {hi_file} to {target_srt}")
                             # Update database status
@@ -263,16 +628,17 @@ def corrections_task():
                             log_to_file(f"Failed to rename {hi_file}: {e}")
                 
                 # Look for generic .srt files (only if no other subtitles exist)
-                if rename_generic and not os.path.exists(target_srt):
+                if rename_generic and not subtitles.exists(target_srt):
                     generic_srt = f"{base_path}.srt"
-                    if os.path.exists(generic_srt):
+                    if subtitles.exists(generic_srt):
                         # Check if there are other subtitle files
-                        other_subs = glob.glob(f"{base_path}*.srt")
+                        other_subs = subtitles.sidecars(file_path, '.srt')
                         other_subs = [f for f in other_subs if not f.endswith('.ar.srt')]
                         
                         if len(other_subs) == 1:  # Only the generic one
                             try:
                                 os.rename(generic_srt, target_srt)
+                                subtitles.record_rename(generic_srt, target_srt)
                                 fixed_count += 1
                                 log_to_file(f"Renamed {generic_srt} to {target_srt}")
                                 # Update database status
@@ -284,8 +650,7 @@ def corrections_task():
             
             # Final database update - scan all files for actual subtitle existence
             for media_file in media_files:
-                srt_path = f"{os.path.splitext(media_file.path)[0]}.ar.srt"
-                has_sub = os.path.exists(srt_path)
+                has_sub = subtitles.has_subtitle(media_file.path)
                 media_file.has_subtitles = has_sub
                 media_file.translated = has_sub
                 
@@ -305,18 +670,20 @@ def batch_translate_task():
     
     try:
         from app import app, db
-        from models import MediaFile
+        from models import MediaFile, Settings
         
         with app.app_context():
             # Get untranslated files not in blacklist
             blacklist = read_blacklist()
             
             # Query untranslated files using SQLAlchemy
-            untranslated_files = MediaFile.query.filter_by(translated=False).order_by(MediaFile.path).all()
+            untranslated_files = db.session.query(MediaFile.path).filter_by(translated=False).order_by(MediaFile.path).all()
             
-            # Filter out blacklisted files and check file existence
-            files_to_process = [file.path for file in untranslated_files 
-                               if file.path not in blacklist and os.path.exists(file.path)]
+            # Filter out blacklisted files and check file existence (one listing per directory)
+            subtitles = SubtitleIndex()
+            candidates = [file.path for file in untranslated_files if file.path not in blacklist]
+            subtitles.preload(candidates)
+            files_to_process = [path for path in candidates if subtitles.exists(path)]
             
             total_files = len(files_to_process)
             
@@ -327,40 +694,66 @@ def batch_translate_task():
             
             log_to_file(f"Found {total_files} files to translate.")
             
-            for i, file_path in enumerate(files_to_process, 1):
-                progress = int((i / total_files) * 100) if total_files > 0 else 0
-                current_file_name = os.path.basename(file_path)
-                update_status(progress, f"({i}/{total_files}) {current_file_name}", total_files, i-1)
-                
-                log_to_file(f"Processing file {i}/{total_files}: {current_file_name}")
-                
-                try:
-                    # Find media file in database
-                    media_file = MediaFile.query.filter_by(path=file_path).first()
-                    if media_file:
-                        # Update status to processing
-                        media_file.has_subtitles = False
-                        db.session.commit()
+            # تشغيل عامل Whisper مرة واحدة ليبقى النموذج محملاً طوال الدفعة
+            worker_setting = Settings.query.filter_by(key='whisper_persistent_worker').first()
+            use_worker = worker_setting.value.lower() in ['true', '1', 'yes'] if worker_setting and worker_setting.value else True
+            if use_worker and is_worker_available():
+                get_whisper_worker().start()
+                log_to_file("Persistent Whisper worker started for this batch.")
+            
+            # خط معالجة مرحلي: تفريغ الملف التالي أثناء ترجمة الملف الحالي
+            completed = [0]
+            
+            def describe_file_progress(file_path):
+                def describe(lines_done, lines_total):
+                    progress = int(((completed[0] + lines_done / max(lines_total, 1)) / total_files) * 100)
+                    update_status(progress, f"({completed[0]}/{total_files}) {os.path.basename(file_path)} - {lines_done}/{lines_total} lines",
+                                  total_files, completed[0])
+                return describe
+            
+            reporters = {}
+            
+            def on_progress(file_path, lines_done, lines_total):
+                if file_path not in reporters:
+                    reporters[file_path] = make_line_progress_reporter(describe_file_progress(file_path))
+                reporters[file_path](lines_done, lines_total)
+            
+            pipeline = BatchPipeline.from_settings(load_settings(), on_progress=on_progress, subtitle_index=subtitles)
+            update_status(0, f"(0/{total_files}) {os.path.basename(files_to_process[0])}", total_files, 0)
+            
+            try:
+                for files_done, result in enumerate(pipeline.run(files_to_process), 1):
+                    completed[0] = files_done
+                    reporters.pop(result['path'], None)
+                    file_path = result['path']
+                    current_file_name = os.path.basename(file_path)
+                    progress = int((files_done / total_files) * 100)
+                    update_status(progress, f"({files_done}/{total_files}) {current_file_name}", total_files, files_done)
                     
-                    # Process single file
-                    process_single_file_task(file_path)
+                    try:
+                        # Check if translation was created
+                        srt_path = f"{os.path.splitext(file_path)[0]}.ar.srt"
+                        if os.path.exists(srt_path):
+                            media_file = MediaFile.query.filter_by(path=file_path).first()
+                            if media_file:
+                                media_file.translated = True
+                                media_file.has_subtitles = True
+                                from datetime import datetime
+                                media_file.translation_completed_at = datetime.utcnow()
+                                db.session.commit()
+                            log_to_file(f"Successfully translated: {current_file_name}")
+                        elif result.get('skipped'):
+                            log_to_file(f"Skipped: {current_file_name} ({result.get('error')})")
+                        else:
+                            log_to_file(f"Translation failed: {current_file_name} ({result.get('error')})")
                     
-                    # Check if translation was created
-                    srt_path = f"{os.path.splitext(file_path)[0]}.ar.srt"
-                    if os.path.exists(srt_path):
-                        if media_file:
-                            media_file.translated = True
-                            media_file.has_subtitles = True
-                            from datetime import datetime
-                            media_file.translation_completed_at = datetime.utcnow()
-                            db.session.commit()
-                        log_to_file(f"Successfully translated: {current_file_name}")
-                    else:
-                        log_to_file(f"Translation failed: {current_file_name}")
-                        
-                except Exception as e:
-                    log_to_file(f"Error processing {current_file_name}: {str(e)}")
-                    log_to_db("ERROR", f"Error processing {current_file_name}", str(e))
+                    except Exception as e:
+                        db.session.rollback()
+                        log_to_file(f"Error processing {current_file_name}: {str(e)}")
+                        log_to_db("ERROR", f"Error processing {current_file_name}", str(e))
+            finally:
+                # عند الإيقاف (SIGTERM) أو الخطأ لا يُغذّى الخط بملفات جديدة
+                pipeline.cancel()
             
             update_status(100, "Batch translation finished.", total_files, total_files)
             log_to_db("INFO", "Batch translate task finished.")
@@ -369,6 +762,8 @@ def batch_translate_task():
     except Exception as e:
         log_to_db("ERROR", f"Batch translate task error: {str(e)}")
         log_to_file(f"Batch translation error: {str(e)}")
+    finally:
+        shutdown_whisper_worker()
 
 def single_file_translate_task(file_path):
     log_to_db("INFO", f"Single file translate task started for: {file_path}")
@@ -376,34 +771,40 @@ def single_file_translate_task(file_path):
     
     update_status(0, f"Translating: {os.path.basename(file_path)}")
     
+    # ملف تترجمه مهمة أخرى الآن (دفعة جارية مثلاً) لا يُترجم مرتين
+    claim = claim_file(file_path)
+    if claim is None:
+        log_to_file(f"Already being translated by another job: {os.path.basename(file_path)}")
+        update_status(100, f"Already being translated by another job: {os.path.basename(file_path)}")
+        return
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Update status in database
-        cursor.execute("UPDATE media_files SET status = 'processing' WHERE local_path = ?", (file_path,))
-        conn.commit()
-        
         # Process the file
-        process_single_file_task(file_path)
+        file_name = os.path.basename(file_path)
+        process_single_file_task(file_path, make_line_progress_reporter(
+            lambda done, total: update_status(int(done / max(total, 1) * 100), f"Translating: {file_name} - {done}/{total} lines")
+        ))
         
         # Check if translation was created
         srt_path = f"{os.path.splitext(file_path)[0]}.ar.srt"
         if os.path.exists(srt_path):
-            cursor.execute("UPDATE media_files SET has_arabic_subtitle = 1, status = 'completed' WHERE local_path = ?", 
-                          (file_path,))
+            cursor.execute("UPDATE media_files SET translated = 1, has_subtitles = 1, translation_completed_at = ? WHERE path = ?",
+                          (datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f'), file_path))
             log_to_file(f"Successfully translated: {os.path.basename(file_path)}")
             update_status(100, f"Translation completed: {os.path.basename(file_path)}")
         else:
-            cursor.execute("UPDATE media_files SET status = 'failed' WHERE local_path = ?", (file_path,))
             log_to_file(f"Translation failed: {os.path.basename(file_path)}")
             update_status(100, f"Translation failed: {os.path.basename(file_path)}")
             
     except Exception as e:
-        cursor.execute("UPDATE media_files SET status = 'failed' WHERE local_path = ?", (file_path,))
         log_to_file(f"Error translating {os.path.basename(file_path)}: {str(e)}")
         log_to_db("ERROR", f"Error translating {os.path.basename(file_path)}", str(e))
         update_status(100, f"Translation error: {os.path.basename(file_path)}")
+    finally:
+        release_file(claim)
     
     conn.commit()
     conn.close()
@@ -414,52 +815,49 @@ def scan_translation_status_task():
     log_to_file("Starting translation status scan...")
     
     conn = get_db_connection()
-    cursor = conn.cursor()
     
     try:
-        # Get all media files
-        media_files = cursor.execute("SELECT id, path FROM media_files").fetchall()
+        config = get_settings_from_db()
+        
+        # تحميل الحالة الحالية مرة واحدة؛ المقارنة تتم في الذاكرة
+        media_files = conn.execute("SELECT id, path, translated, has_subtitles FROM media_files").fetchall()
         total_files = len(media_files)
-        updated_count = 0
         
         update_status(0, "Scanning translation status...", total_files, 0)
         
-        for i, row in enumerate(media_files):
-            file_id = row['id']
+        # قراءة المجلدات بالتوازي، بمجموعة خيوط مستقلة لكل نقطة تركيب
+        report = make_line_progress_reporter(
+            lambda done, total: update_status(int(done / max(total, 1) * 90), f"Scanning directories: {done}/{total}", total_files, 0),
+            min_interval=0.5
+        )
+        subtitles = scan_directories((row['path'] for row in media_files), get_mount_concurrency(config), report)
+        
+        completed_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+        changes = []
+        for row in media_files:
             file_path = row['path']
-            
-            if not file_path or not os.path.exists(file_path):
+            if not file_path or not subtitles.exists(file_path):
                 continue
-                
-            # Check if Arabic subtitle exists
-            video_dir = os.path.dirname(file_path)
-            video_name = os.path.splitext(os.path.basename(file_path))[0]
-            arabic_srt_path = os.path.join(video_dir, f"{video_name}.ar.srt")
             
-            has_translation = os.path.exists(arabic_srt_path)
-            
-            # Update database if status has changed
-            cursor.execute("SELECT translated FROM media_files WHERE id = ?", (file_id,))
-            current_status = cursor.fetchone()
-            
-            if current_status and current_status['translated'] != has_translation:
-                from datetime import datetime
-                cursor.execute("""
-                    UPDATE media_files 
-                    SET translated = ?, translation_completed_at = ? 
-                    WHERE id = ?
-                """, (has_translation, datetime.now().isoformat() if has_translation else None, file_id))
-                updated_count += 1
+            # Check if Arabic subtitle exists
+            has_translation = subtitles.has_subtitle(file_path)
+            if bool(row['translated']) != has_translation or bool(row['has_subtitles']) != has_translation:
+                changes.append((has_translation, has_translation, completed_at if has_translation else None, row['id']))
                 log_to_file(f"Updated translation status for: {os.path.basename(file_path)} -> {'Translated' if has_translation else 'Not Translated'}")
-            
-            # Update progress
-            progress = int((i / total_files) * 100) if total_files > 0 else 0
-            update_status(progress, f"Scanning: {os.path.basename(file_path)}", total_files, i + 1)
         
-        conn.commit()
+        update_status(95, f"Saving {len(changes)} changes...", total_files, total_files)
+        if changes:
+            with conn:
+                conn.executemany(
+                    "UPDATE media_files SET translated = ?, has_subtitles = ?, translation_completed_at = ? WHERE id = ?",
+                    changes
+                )
+        
+        updated_count = len(changes)
         update_status(100, f"Translation status scan complete! Updated {updated_count} files", total_files, total_files)
         log_to_db("INFO", f"Translation status scan completed. Updated {updated_count} files.")
-        log_to_file(f"Translation status scan completed successfully. Updated {updated_count} files.")
+        log_to_file(f"Translation status scan completed successfully. Updated {updated_count} files "
+                    f"({subtitles.directories_read} directories read).")
         
     except Exception as e:
         error_msg = f"Translation status scan error: {str(e)}"
@@ -470,9 +868,14 @@ def scan_translation_status_task():
 
 # --- نقطة الدخول الرئيسية ---
 if __name__ == "__main__":
+    # إيقاف المهمة من الواجهة يرسل SIGTERM؛ SystemExit يشغّل atexit فتُكتب السجلات المتبقية
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    
     if len(sys.argv) > 1:
         task_name = sys.argv[1]
         args = sys.argv[2:]
+        # ملف PID مع نبض دوري لكي تعرف الواجهة أن المهمة تعمل دون فحص كل العمليات
+        register_task(task_name, args)
         
         if task_name == "single_file_translate_task":
             if args:
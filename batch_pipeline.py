@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Batch Pipeline - Staged processing for batch translation
+خط معالجة الدفعات - تداخل مراحل التفريغ والترجمة بين الملفات
+
+File N+1 is extracted and transcribed while file N is being translated by the
+LLM. Stages are connected by bounded queues so a fast stage cannot run ahead
+of a slow one and fill the disk with pending transcripts.
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import queue
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional
+
+from job_queue import claim_file, release_file
+from process_video import (
+    log_message,
+    check_existing_translation,
+    prepare_subtitles,
+    translate_subtitles,
+)
+
+logger = logging.getLogger(__name__)
+
+# علامة نهاية الطابور
+_STOP = object()
+
+
+def get_pipeline_config(settings: Dict[str, str]) -> Dict[str, int]:
+    """قراءة إعدادات التوازي من جدول الإعدادات"""
+    def as_int(key, default):
+        try:
+            return max(1, int(settings.get(key, default)))
+        except (TypeError, ValueError):
+            return default
+
+    return {
+        'transcribe_workers': as_int('pipeline_transcribe_workers', 1),
+        'translate_workers': as_int('pipeline_translate_workers', 1),
+        'queue_size': as_int('pipeline_queue_size', 2),
+    }
+
+
+class BatchPipeline:
+    """خط معالجة من مرحلتين: (استخراج الصوت + التفريغ) ثم (الترجمة)"""
+
+    def __init__(self, settings: Dict[str, str], transcribe_workers: int = 1,
+                 translate_workers: int = 1, queue_size: int = 2,
+                 on_progress: Optional[Callable[[str, int, int], None]] = None,
+                 subtitle_index=None):
+        self.settings = settings
+        self.on_progress = on_progress
+        # فهرس SubtitleIndex اختياري من المهمة لتجنب فحص كل ملف عبر الشبكة
+        self.subtitle_index = subtitle_index
+        self.transcribe_workers = transcribe_workers
+        self.translate_workers = translate_workers
+        self._input = queue.Queue(maxsize=transcribe_workers)
+        self._transcribed = queue.Queue(maxsize=queue_size)
+        self._results = queue.Queue()
+        self._cancelled = threading.Event()
+        # المستهلك توقف عن قراءة النتائج: المراحل تفرغ طوابيرها دون معالجة وتحرر الحجوزات
+        self._abandoned = threading.Event()
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, str], on_progress=None, subtitle_index=None) -> "BatchPipeline":
+        return cls(settings, on_progress=on_progress, subtitle_index=subtitle_index, **get_pipeline_config(settings))
+
+    def cancel(self):
+        """إيقاف قبول ملفات جديدة؛ الملفات قيد المعالجة تكتمل"""
+        self._cancelled.set()
+
+    def run(self, file_paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """تشغيل الخط وإرجاع نتيجة كل ملف فور اكتماله"""
+        transcribers = [
+            threading.Thread(target=self._transcribe_stage, name=f"pipeline-transcribe-{i}", daemon=True)
+            for i in range(self.transcribe_workers)
+        ]
+        translators = [
+            threading.Thread(target=self._translate_stage, name=f"pipeline-translate-{i}", daemon=True)
+            for i in range(self.translate_workers)
+        ]
+        for thread in transcribers + translators:
+            thread.start()
+
+        feeder = threading.Thread(target=self._feed, args=(file_paths,), daemon=True)
+        feeder.start()
+
+        # عند انتهاء كل مرحلة تُرسل علامات التوقف للمرحلة التالية
+        def close_stages():
+            feeder.join()
+            for _ in transcribers:
+                self._input.put(_STOP)
+            for thread in transcribers:
+                thread.join()
+            for _ in translators:
+                self._transcribed.put(_STOP)
+            for thread in translators:
+                thread.join()
+            self._results.put(_STOP)
+
+        threading.Thread(target=close_stages, daemon=True).start()
+
+        finished = False
+        try:
+            while True:
+                result = self._results.get()
+                if result is _STOP:
+                    finished = True
+                    break
+                yield result
+        finally:
+            if not finished:
+                # خطأ عند المستدعي أو GeneratorExit: بدون هذا تبقى الخيوط محجوبة على طوابير ممتلئة
+                self._cancelled.set()
+                self._abandoned.set()
+                threading.Thread(target=self._drain_results, name="pipeline-drain", daemon=True).start()
+
+    def _drain_results(self):
+        while self._results.get() is not _STOP:
+            pass
+
+    def _feed(self, file_paths: Iterable[str]):
+        for file_path in file_paths:
+            if self._cancelled.is_set():
+                break
+            self._input.put(file_path)
+
+    def _transcribe_stage(self):
+        while True:
+            file_path = self._input.get()
+            if file_path is _STOP:
+                return
+            if self._abandoned.is_set():
+                continue
+
+            # أي استثناء هنا يجب أن ينتج نتيجة؛ وإلا ينتظر المُغذّي والمستهلك إلى الأبد
+            claim = work_dir = None
+            try:
+                if check_existing_translation(file_path, self.subtitle_index):
+                    log_message(f"Arabic subtitle already exists, skipping: {os.path.basename(file_path)}")
+                    self._results.put({'path': file_path, 'success': True, 'skipped': True})
+                    continue
+
+                # ملف تترجمه مهمة أخرى (ترجمة ملف عاجل مثلاً) يُتخطى؛ الحجز يبقى حتى نهاية الترجمة
+                claim = claim_file(file_path)
+                if claim is None:
+                    log_message(f"Already being translated by another job, skipping: {os.path.basename(file_path)}")
+                    self._results.put({'path': file_path, 'success': False, 'skipped': True,
+                                       'error': 'being translated by another job'})
+                    continue
+
+                work_dir = tempfile.mkdtemp(prefix="ai-translator-")
+                log_message(f"[pipeline] Transcribing: {os.path.basename(file_path)}")
+                srt_path = prepare_subtitles(file_path, self.settings, work_dir)
+                if not srt_path:
+                    self._results.put({'path': file_path, 'success': False, 'error': 'transcription failed'})
+                    continue
+
+                # put() يحجب عند امتلاء الطابور فيتوقف التفريغ حتى تلحق مرحلة الترجمة
+                self._transcribed.put((file_path, srt_path, work_dir, claim))
+                # مرحلة الترجمة تملك الحجز ومجلد العمل الآن
+                claim = work_dir = None
+            except Exception as e:
+                logger.error(f"Transcription stage failed for {file_path}: {e}")
+                self._results.put({'path': file_path, 'success': False, 'error': str(e)})
+            finally:
+                if work_dir:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                release_file(claim)
+
+    def _translate_stage(self):
+        while True:
+            item = self._transcribed.get()
+            if item is _STOP:
+                return
+
+            file_path, srt_path, work_dir, claim = item
+            if self._abandoned.is_set():
+                shutil.rmtree(work_dir, ignore_errors=True)
+                release_file(claim)
+                continue
+            try:
+                log_message(f"[pipeline] Translating: {os.path.basename(file_path)}")
+                progress = None
+                if self.on_progress:
+                    progress = lambda done, total, path=file_path: self.on_progress(path, done, total)
+                # قاعدة البيانات تُحدَّث من الخيط الرئيسي للمهمة عند وصول النتيجة، لا من هنا
+                success = translate_subtitles(file_path, srt_path, self.settings, progress, record_status=False)
+                error = None if success else 'translation failed'
+            except Exception as e:
+                success, error = False, str(e)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                release_file(claim)
+
+            self._results.put({'path': file_path, 'success': success, 'error': error})
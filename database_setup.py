@@ -22,9 +22,13 @@ def create_default_settings():
         # API section
         {'key': 'sonarr_url', 'value': 'http://localhost:8989', 'section': 'API', 'type': 'string', 'description': 'Sonarr server URL'},
         {'key': 'sonarr_api_key', 'value': '', 'section': 'API', 'type': 'string', 'description': 'Sonarr API key'},
+        {'key': 'poster_prefetch_concurrency', 'value': '8', 'section': 'API', 'type': 'number', 'description': 'Posters downloaded in parallel after library sync'},
+        {'key': 'sonarr_sync_concurrency', 'value': '8', 'section': 'API', 'type': 'number', 'description': 'Sonarr series whose episode files are fetched in parallel during library sync'},
         {'key': 'radarr_url', 'value': 'http://localhost:7878', 'section': 'API', 'type': 'string', 'description': 'Radarr server URL'},
         {'key': 'radarr_api_key', 'value': '', 'section': 'API', 'type': 'string', 'description': 'Radarr API key'},
         {'key': 'ollama_url', 'value': 'http://localhost:11434', 'section': 'API', 'type': 'string', 'description': 'Ollama server URL'},
+        {'key': 'ollama_api_urls', 'value': '', 'section': 'API', 'type': 'string', 'description': 'Additional Ollama generate endpoints (comma separated) used for parallel chunk translation'},
+        {'key': 'ollama_concurrency', 'value': '4', 'section': 'API', 'type': 'number', 'description': 'Subtitle chunks translated in parallel'},
         
         # PATHS section
         {'key': 'remote_movies_path', 'value': '/volume1/movies', 'section': 'PATHS', 'type': 'string', 'description': 'Remote movies directory path'},
@@ -37,6 +41,12 @@ def create_default_settings():
         {'key': 'ollama_model', 'value': 'llama3', 'section': 'MODELS', 'type': 'select', 'options': 'llama3:Llama 3,llama2:Llama 2,codellama:Code Llama,mistral:Mistral', 'description': 'Ollama translation model'},
         {'key': 'whisper_model_gpu', 'value': 'auto', 'section': 'MODELS', 'type': 'select', 'options': 'auto:تلقائي,cpu:المعالج فقط', 'description': 'GPU allocation for Whisper'},
         {'key': 'ollama_model_gpu', 'value': 'auto', 'section': 'MODELS', 'type': 'select', 'options': 'auto:تلقائي,cpu:المعالج فقط', 'description': 'GPU allocation for Ollama'},
+        {'key': 'ollama_context_tokens', 'value': '', 'section': 'MODELS', 'type': 'number', 'description': 'Context window in tokens for the Ollama model (empty = detect from model name)'},
+        {'key': 'chunk_fill_ratio', 'value': '0.75', 'section': 'MODELS', 'type': 'string', 'description': 'Fraction of the context window each translation request may fill'},
+        {'key': 'chunk_context_cues', 'value': '2', 'section': 'MODELS', 'type': 'number', 'description': 'Previous subtitle lines sent with each chunk as context'},
+        {'key': 'translation_memory_enabled', 'value': 'true', 'section': 'MODELS', 'type': 'select', 'options': 'true:نعم,false:لا', 'description': 'Reuse stored translations of repeated subtitle lines'},
+        {'key': 'translation_memory_max_entries', 'value': '100000', 'section': 'MODELS', 'type': 'number', 'description': 'Maximum translation memory entries before least recently used lines are evicted'},
+        {'key': 'whisper_persistent_worker', 'value': 'true', 'section': 'MODELS', 'type': 'select', 'options': 'true:نعم,false:لا', 'description': 'Keep the Whisper model loaded in a persistent worker process'},
         
         # CORRECTIONS section
         {'key': 'auto_correct_filenames', 'value': 'true', 'section': 'CORRECTIONS', 'type': 'select', 'options': 'true:نعم,false:لا', 'description': 'Automatically correct subtitle filenames'},
@@ -65,6 +75,23 @@ def create_default_settings():
         # SYSTEM section
         {'key': 'enable_monitoring', 'value': 'true', 'section': 'SYSTEM', 'type': 'select', 'options': 'true:نعم,false:لا', 'description': 'Enable system monitoring'},
         {'key': 'log_level', 'value': 'INFO', 'section': 'SYSTEM', 'type': 'select', 'options': 'DEBUG:Debug,INFO:Info,WARNING:Warning,ERROR:Error', 'description': 'Application log level'},
+        {'key': 'http_pool_size', 'value': '10', 'section': 'SYSTEM', 'type': 'number', 'description': 'Keep-alive connections pooled per server (Ollama, Radarr, Sonarr, Plex, Jellyfin)'},
+        {'key': 'http_max_retries', 'value': '3', 'section': 'SYSTEM', 'type': 'number', 'description': 'Retries for failed HTTP requests to external services'},
+        {'key': 'http_retry_backoff', 'value': '0.5', 'section': 'SYSTEM', 'type': 'string', 'description': 'Exponential backoff factor in seconds between HTTP retries'},
+        {'key': 'dashboard_stats_ttl', 'value': '10', 'section': 'SYSTEM', 'type': 'number', 'description': 'Seconds the dashboard library counters are cached between refreshes'},
+        {'key': 'files_count_cache_ttl', 'value': '60', 'section': 'SYSTEM', 'type': 'number', 'description': 'Seconds the approximate file list total is cached in cursor pagination'},
+        {'key': 'library_full_sync_interval_hours', 'value': '24', 'section': 'SYSTEM', 'type': 'number', 'description': 'Hours between full Sonarr/Radarr library syncs; other syncs only apply changes since the last one (0 disables periodic full syncs)'},
+        {'key': 'sync_batch_size', 'value': '1000', 'section': 'SYSTEM', 'type': 'number', 'description': 'Rows written per bulk INSERT/UPDATE statement during library sync'},
+        {'key': 'scan_mount_concurrency', 'value': '8', 'section': 'SYSTEM', 'type': 'number', 'description': 'Directories listed in parallel per mount point during status scans'},
+        {'key': 'job_queue_workers', 'value': '3', 'section': 'SYSTEM', 'type': 'number', 'description': 'Background jobs the dispatcher runs at the same time'},
+        {'key': 'job_type_limits', 'value': 'translate_batch:1,translate_file:1,library:1', 'section': 'SYSTEM', 'type': 'string', 'description': 'Concurrent jobs per type (translate_batch, translate_file, library)'},
+        {'key': 'library_watch_enabled', 'value': 'false', 'section': 'SYSTEM', 'type': 'select', 'options': 'true:نعم,false:لا', 'description': 'Watch the local media mounts and update translation status as subtitle files appear or disappear'},
+        {'key': 'library_watch_debounce', 'value': '5', 'section': 'SYSTEM', 'type': 'number', 'description': 'Seconds of quiet before collected file changes are applied'},
+        {'key': 'library_watch_poll_interval', 'value': '300', 'section': 'SYSTEM', 'type': 'number', 'description': 'Seconds between polls of network mounts (NFS/SMB/SSHFS), which do not deliver inotify events'},
+        {'key': 'library_last_full_sync', 'value': '', 'section': 'SYSTEM', 'type': 'string', 'description': 'Time of the last full library sync (set automatically)'},
+        {'key': 'pipeline_transcribe_workers', 'value': '1', 'section': 'SYSTEM', 'type': 'number', 'description': 'Files extracted and transcribed in parallel during batch translation'},
+        {'key': 'pipeline_translate_workers', 'value': '1', 'section': 'SYSTEM', 'type': 'number', 'description': 'Files translated by the LLM in parallel during batch translation'},
+        {'key': 'pipeline_queue_size', 'value': '2', 'section': 'SYSTEM', 'type': 'number', 'description': 'Transcribed files allowed to wait for the translation stage'},
         
         # DEVELOPMENT section
         {'key': 'debug_mode', 'value': 'false', 'section': 'DEVELOPMENT', 'type': 'select', 'options': 'true:نعم,false:لا', 'description': 'Enable debug mode'},
@@ -100,6 +127,12 @@ def setup_database():
         db.create_all()
         print("✓ Database tables created")
         
+        # Schema changes to existing tables (create_all never alters them)
+        from migrations import run_migrations
+        applied = run_migrations()
+        if applied:
+            print(f"✓ Applied migrations: {', '.join(applied)}")
+        
         # Create default settings
         create_default_settings()
         
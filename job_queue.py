@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Job Queue - Persistent background job queue with a dispatcher process
+طابور المهام - مهام خلفية محفوظة في قاعدة البيانات مع أولويات وحدود تزامن
+
+Jobs are rows in background_jobs. A single dispatcher process (started on
+demand, one instance per host through a lock file) runs each job as its own
+"background_tasks.py <task> <args>" process, highest priority first, with a
+concurrency limit per job type, so a quick status scan or one urgent file
+does not wait for a 2,000-file batch. Jobs left running by a crash are
+restarted when the dispatcher starts again; every task is written to resume
+from the database state (batch translation skips finished files).
+
+Runs as its own process: python job_queue.py
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import logging
+import threading
+import hashlib
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from task_registry import STALE_AFTER, is_task_alive, pid_alive
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCK_FILE = os.path.join(PROJECT_DIR, "job_queue.lock")
+STATUS_FILE = os.path.join(PROJECT_DIR, "status.json")
+# حالة كل مهمة قيد التشغيل في ملف خاص بها؛ status.json يحتفظ بحالة آخر مهمة انتهت
+JOB_STATUS_DIR = os.path.join(PROJECT_DIR, "run", "status")
+# ملف مقفل (flock) لكل فيديو تترجمه مهمة الآن، يُحرر تلقائياً إذا ماتت العملية
+CLAIMS_DIR = os.path.join(PROJECT_DIR, "run", "claims")
+
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+
+# مجموعة التزامن لكل مهمة؛ مهام المكتبة تكتب في media_files فتعمل واحدة تلو الأخرى
+JOB_TYPES = {
+    'batch_translate_task': 'translate_batch',
+    'single_file_translate_task': 'translate_file',
+    'sync_library_task': 'library',
+    'scan_translation_status_task': 'library',
+    'corrections_task': 'library',
+    'prefetch_posters_task': 'library',
+}
+DEFAULT_TYPE_LIMITS = {'translate_batch': 1, 'translate_file': 1, 'library': 1}
+DEFAULT_WORKERS = 3
+
+ACTIVE_STATUSES = ('queued', 'running')
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+# المرسل ينتهي بعد هذه المدة دون مهام، ويُشغَّل من جديد عند إضافة مهمة
+IDLE_TIMEOUT = 60.0
+
+
+def _app():
+    sys.path.append(PROJECT_DIR)
+    from app import app, db
+    from models import BackgroundJob
+    return app, db, BackgroundJob
+
+
+def parse_type_limits(value: Optional[str]) -> Dict[str, int]:
+    """'translate_batch:1,library:1' → {'translate_batch': 1, 'library': 1}"""
+    limits = dict(DEFAULT_TYPE_LIMITS)
+    for item in (value or '').split(','):
+        job_type, _, limit = item.partition(':')
+        try:
+            limits[job_type.strip()] = max(1, int(limit))
+        except ValueError:
+            continue
+    return limits
+
+
+def _is_locked() -> bool:
+    try:
+        with open(LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
+    except OSError:
+        return True
+
+
+def ensure_dispatcher_running():
+    """تشغيل المرسل إذا لم يكن يعمل؛ النسخة الزائدة تخرج فوراً بسبب القفل"""
+    if not _is_locked():
+        subprocess.Popen([sys.executable, os.path.join(PROJECT_DIR, 'job_queue.py')], cwd=PROJECT_DIR,
+                         start_new_session=True)
+
+
+def enqueue(task_name: str, args: Sequence[str] = (), priority: int = PRIORITY_NORMAL,
+            max_attempts: int = 3) -> Tuple[int, bool]:
+    """إضافة مهمة إلى الطابور؛ يعيد (رقم المهمة، أُضيفت جديدة؟)
+
+    An identical job (same task and arguments) that is still queued or
+    running is returned instead of adding a duplicate.
+    """
+    if task_name not in JOB_TYPES:
+        raise ValueError(f"Unknown task: {task_name}")
+    app, db, BackgroundJob = _app()
+    encoded_args = json.dumps([str(arg) for arg in args], ensure_ascii=False)
+
+    with app.app_context():
+        existing = BackgroundJob.query.filter(
+            BackgroundJob.task_name == task_name,
+            BackgroundJob.args == encoded_args,
+            BackgroundJob.status.in_(ACTIVE_STATUSES),
+        ).first()
+        if existing:
+            # طلب عاجل لمهمة موجودة يرفع أولويتها
+            if existing.status == 'queued' and priority > (existing.priority or 0):
+                existing.priority = priority
+                db.session.commit()
+            job_id, created = existing.id, False
+        else:
+            job = BackgroundJob(task_name=task_name, args=encoded_args, job_type=JOB_TYPES[task_name],
+                                priority=priority, max_attempts=max_attempts)
+            db.session.add(job)
+            db.session.commit()
+            job_id, created = job.id, True
+
+    ensure_dispatcher_running()
+    return job_id, created
+
+
+def job_status_path(job_id) -> str:
+    return os.path.join(JOB_STATUS_DIR, f"{job_id}.json")
+
+
+def write_job_status(job_id, status: Dict):
+    """كتابة ذرية (os.replace) لكي لا تقرأ الواجهة ملفاً نصف مكتوب"""
+    os.makedirs(JOB_STATUS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=JOB_STATUS_DIR, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(tmp_path, job_status_path(job_id))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_job_status(job_id) -> Optional[Dict]:
+    try:
+        with open(job_status_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish_final_status(job_id):
+    """نقل آخر حالة للمهمة المنتهية إلى status.json وحذف ملفها"""
+    path = job_status_path(job_id)
+    if os.path.exists(path):
+        try:
+            os.replace(path, STATUS_FILE)
+        except OSError as e:
+            logger.warning(f"Could not publish status of job {job_id}: {e}")
+
+
+def _claim_path(file_path: str) -> str:
+    return os.path.join(CLAIMS_DIR, hashlib.sha1(file_path.encode('utf-8')).hexdigest() + '.lock')
+
+
+def claim_file(file_path: str):
+    """حجز فيديو للترجمة؛ يعيد مقبض القفل أو None إذا كانت مهمة أخرى تترجمه"""
+    os.makedirs(CLAIMS_DIR, exist_ok=True)
+    handle = open(_claim_path(file_path), 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def release_file(handle):
+    if handle is None:
+        return
+    try:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    finally:
+        handle.close()
+
+
+def is_file_claimed(file_path: str) -> bool:
+    if not os.path.exists(_claim_path(file_path)):
+        return False
+    handle = claim_file(file_path)
+    if handle is None:
+        return True
+    release_file(handle)
+    return False
+
+
+def _terminate(pid: Optional[int]):
+    if not pid:
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def cancel_job(job_id: int) -> bool:
+    """إلغاء مهمة في الطابور، أو إيقاف مهمة قيد التشغيل (SIGTERM)"""
+    app, db, BackgroundJob = _app()
+    with app.app_context():
+        job = db.session.get(BackgroundJob, job_id)
+        if not job or job.status not in ACTIVE_STATUSES:
+            return False
+        pid = job.worker_pid if job.status == 'running' else None
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    _terminate(pid)
+    return True
+
+
+def cancel_active_jobs() -> Tuple[int, List[int]]:
+    """إلغاء كل المهام المنتظرة وقيد التشغيل؛ يعيد (عددها، أرقام العمليات التي أُرسل لها SIGTERM)"""
+    app, db, BackgroundJob = _app()
+    with app.app_context():
+        jobs = BackgroundJob.query.filter(BackgroundJob.status.in_(ACTIVE_STATUSES)).all()
+        pids = [job.worker_pid for job in jobs if job.status == 'running']
+        now = datetime.utcnow()
+        for job in jobs:
+            job.status = 'cancelled'
+            job.finished_at = now
+        db.session.commit()
+    pids = [pid for pid in pids if pid]
+    for pid in pids:
+        _terminate(pid)
+    return len(jobs), pids
+
+
+def resume_pending_jobs() -> bool:
+    """عند بدء التطبيق: تشغيل المرسل إذا بقيت مهام من تشغيل سابق"""
+    app, db, BackgroundJob = _app()
+    with app.app_context():
+        pending = db.session.query(BackgroundJob.id).filter(BackgroundJob.status.in_(ACTIVE_STATUSES)).first()
+    if pending is None:
+        return False
+    ensure_dispatcher_running()
+    return True
+
+
+def job_to_dict(job) -> Dict:
+    return {
+        'id': job.id,
+        'task_name': job.task_name,
+        'args': json.loads(job.args or '[]'),
+        'job_type': job.job_type,
+        'priority': job.priority,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error_message': job.error_message,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class Dispatcher:
+    """تشغيل المهام المنتظرة كعمليات منفصلة ضمن حدود التزامن"""
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.app, self.db, self.BackgroundJob = _app()
+        self.children: Dict[int, subprocess.Popen] = {}
+        # مهام قيد التشغيل من مرسل سابق ما زالت عملياتها حية: رقم المهمة → pid
+        self.adopted: Dict[int, int] = {}
+        self.stop_event = threading.Event()
+        self.last_heartbeat = 0.0
+
+    def load_limits(self) -> Tuple[int, Dict[str, int]]:
+        from models import Settings
+        settings = {s.key: s.value for s in Settings.query.filter(
+            Settings.key.in_(('job_queue_workers', 'job_type_limits'))
+        )}
+        try:
+            workers = max(1, int(settings.get('job_queue_workers') or DEFAULT_WORKERS))
+        except ValueError:
+            workers = DEFAULT_WORKERS
+        return workers, parse_type_limits(settings.get('job_type_limits'))
+
+    def recover(self):
+        """المهام التي بقيت 'running' بعد توقف مفاجئ تُعاد إلى الطابور أو تُتابع إن كانت حية"""
+        now = datetime.utcnow()
+        for job in self.BackgroundJob.query.filter_by(status='running'):
+            # عملية حية ومسجلة (أو بدأت للتو ولم تسجل نفسها بعد) تُتابع ولا تُشغَّل مرة ثانية
+            just_started = job.started_at and (now - job.started_at).total_seconds() < STALE_AFTER
+            if is_task_alive(job.worker_pid) or (just_started and pid_alive(job.worker_pid)):
+                self.adopted[job.id] = job.worker_pid
+            elif (job.attempts or 0) < (job.max_attempts or 1):
+                logger.info(f"Requeueing interrupted job {job.id} ({job.task_name})")
+                job.status = 'queued'
+                job.worker_pid = None
+            else:
+                job.status = 'failed'
+                job.error_message = 'Interrupted too many times'
+                job.finished_at = now
+        self.db.session.commit()
+
+    def finish(self, job_id: int, returncode: Optional[int]):
+        publish_final_status(job_id)
+        job = self.db.session.get(self.BackgroundJob, job_id)
+        if not job or job.status != 'running':
+            return  # أُلغيت من الواجهة
+        now = datetime.utcnow()
+        job.worker_pid = None
+        if returncode == 0:
+            job.status = 'completed'
+            job.finished_at = now
+        elif returncode is None:
+            job.status = 'completed'
+            job.error_message = 'Exit status unknown (dispatcher restarted)'
+            job.finished_at = now
+        elif (job.attempts or 0) < (job.max_attempts or 1):
+            job.status = 'queued'
+            job.error_message = f"Exited with code {returncode}, retrying"
+        else:
+            job.status = 'failed'
+            job.error_message = f"Exited with code {returncode}"
+            job.finished_at = now
+
+    def reap(self):
+        for job_id, process in list(self.children.items()):
+            returncode = process.poll()
+            if returncode is not None:
+                del self.children[job_id]
+                self.finish(job_id, returncode)
+        for job_id, pid in list(self.adopted.items()):
+            if not pid_alive(pid):
+                del self.adopted[job_id]
+                self.finish(job_id, None)
+        self.db.session.commit()
+
+    def heartbeat(self):
+        if time.monotonic() - self.last_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self.last_heartbeat = time.monotonic()
+        running = list(self.children) + list(self.adopted)
+        if running:
+            self.BackgroundJob.query.filter(self.BackgroundJob.id.in_(running)).update(
+                {'heartbeat_at': datetime.utcnow()}, synchronize_session=False
+            )
+            self.db.session.commit()
+
+    def start_jobs(self) -> int:
+        workers, limits = self.load_limits()
+        running = self.BackgroundJob.query.filter_by(status='running').all()
+        free = workers - len(running)
+        if free <= 0:
+            return 0
+        per_type: Dict[str, int] = {}
+        for job in running:
+            per_type[job.job_type] = per_type.get(job.job_type, 0) + 1
+
+        started = 0
+        queued = self.BackgroundJob.query.filter_by(status='queued').order_by(
+            self.BackgroundJob.priority.desc(), self.BackgroundJob.id.asc()
+        ).all()
+        for job in queued:
+            if started >= free:
+                break
+            if per_type.get(job.job_type, 0) >= limits.get(job.job_type, 1):
+                continue
+            self.launch(job)
+            per_type[job.job_type] = per_type.get(job.job_type, 0) + 1
+            started += 1
+        self.db.session.commit()
+        return started
+
+    def launch(self, job):
+        cmd = [sys.executable, os.path.join(PROJECT_DIR, 'background_tasks.py'), job.task_name] + json.loads(job.args or '[]')
+        env = dict(os.environ, AI_TRANSLATOR_JOB_ID=str(job.id))
+        try:
+            process = subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env)
+        except OSError as e:
+            job.status = 'failed'
+            job.error_message = f"Could not start: {e}"
+            job.finished_at = datetime.utcnow()
+            return
+        now = datetime.utcnow()
+        job.status = 'running'
+        job.worker_pid = process.pid
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = now
+        job.heartbeat_at = now
+        self.children[job.id] = process
+        logger.info(f"Started job {job.id}: {job.task_name} (pid {process.pid}, priority {job.priority})")
+
+    def has_queued(self) -> bool:
+        return self.db.session.query(self.BackgroundJob.id).filter_by(status='queued').first() is not None
+
+    def release_or_continue(self) -> bool:
+        """تحرير القفل قبل الخروج ثم إعادة الفحص، لكي لا تضيع مهمة أُضيفت في اللحظة نفسها"""
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.db.session.commit()
+        if not self.has_queued():
+            return False
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False  # مرسل جديد تولى الطابور
+
+    def run(self):
+        with self.app.app_context():
+            self.recover()
+            idle_since = None
+            while True:
+                try:
+                    self.reap()
+                    self.heartbeat()
+                    if not self.stop_event.is_set():
+                        self.start_jobs()
+                except Exception as e:
+                    self.db.session.rollback()
+                    logger.error(f"Dispatcher error: {e}")
+
+                busy = bool(self.children or self.adopted)
+                if self.stop_event.is_set() and not busy:
+                    return
+                if busy or self.has_queued():
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since >= IDLE_TIMEOUT:
+                    if not self.release_or_continue():
+                        return
+                    idle_since = None
+                self.db.session.commit()
+                self.stop_event.wait(POLL_INTERVAL)
+
+    def shutdown(self):
+        """عند إيقاف المرسل تتوقف المهام أيضاً وتعود إلى الطابور ليكملها التشغيل التالي"""
+        self.stop_event.set()
+        for process in self.children.values():
+            process.terminate()
+
+
+def list_jobs(limit: int = 50) -> List[Dict]:
+    app, db, BackgroundJob = _app()
+    with app.app_context():
+        jobs = BackgroundJob.query.order_by(BackgroundJob.id.desc()).limit(limit).all()
+        return [job_to_dict(job) for job in jobs]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    lock = open(LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        logger.info("Job dispatcher is already running")
+        return
+
+    dispatcher = Dispatcher(lock)
+    signal.signal(signal.SIGTERM, lambda signum, frame: dispatcher.shutdown())
+    signal.signal(signal.SIGINT, lambda signum, frame: dispatcher.shutdown())
+    dispatcher.run()
+
+
+if __name__ == "__main__":
+    main()
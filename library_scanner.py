@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Library Scanner - Parallel directory scanning grouped by mount point
+ماسح المكتبة - قراءة المجلدات بالتوازي مع مجموعة خيوط مستقلة لكل نقطة تركيب
+
+Directories are grouped by the filesystem they live on and every mount gets
+its own thread pool, so a slow NAS does not hold up a local disk. The result
+is a SubtitleIndex that callers compare against flags already loaded from the
+database; nothing here touches the database.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from subtitle_index import SubtitleIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MOUNT_CONCURRENCY = 8
+
+# أنظمة ملفات الشبكة: كل عملية قراءة تكلف رحلة عبر الشبكة ولا تصل منها أحداث inotify
+NETWORK_FSTYPES = {
+    'nfs', 'nfs4', 'cifs', 'smb', 'smbfs', 'smb3', 'fuse.sshfs', 'sshfs',
+    'fuse.rclone', 'afpfs', 'davfs', 'fuse.davfs2', '9p',
+}
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    psutil = None
+    PSUTIL_AVAILABLE = False
+
+
+def get_mounts() -> List[Tuple[str, str]]:
+    """[(نقطة التركيب, نوع النظام)] مرتبة من الأطول للأقصر لمطابقة أطول بادئة"""
+    mounts = []
+    if PSUTIL_AVAILABLE:
+        try:
+            mounts = [(p.mountpoint, p.fstype.lower()) for p in psutil.disk_partitions(all=True)]
+        except Exception as e:
+            logger.warning(f"Could not read mount table: {e}")
+    if not any(mountpoint == os.sep for mountpoint, _ in mounts):
+        mounts.append((os.sep, ''))
+    return sorted(mounts, key=lambda m: len(m[0]), reverse=True)
+
+
+def mount_for(path: str, mounts: List[Tuple[str, str]]) -> Tuple[str, str]:
+    path = os.path.abspath(path)
+    for mountpoint, fstype in mounts:
+        if path == mountpoint or path.startswith(mountpoint.rstrip(os.sep) + os.sep):
+            return mountpoint, fstype
+    return os.sep, ''
+
+
+def is_network_path(path: str, mounts: Optional[List[Tuple[str, str]]] = None) -> bool:
+    return mount_for(path, mounts or get_mounts())[1] in NETWORK_FSTYPES
+
+
+def get_mount_concurrency(config: Dict[str, str]) -> int:
+    try:
+        return max(1, int(config.get('scan_mount_concurrency') or DEFAULT_MOUNT_CONCURRENCY))
+    except ValueError:
+        return DEFAULT_MOUNT_CONCURRENCY
+
+
+def group_by_mount(directories: Iterable[str], mounts: List[Tuple[str, str]]) -> Dict[str, List[str]]:
+    groups: Dict[str, List[str]] = {}
+    for directory in directories:
+        groups.setdefault(mount_for(directory, mounts)[0], []).append(directory)
+    return groups
+
+
+def scan_directories(paths: Iterable[str], concurrency: int = DEFAULT_MOUNT_CONCURRENCY,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> SubtitleIndex:
+    """قراءة مجلدات كل المسارات؛ يعيد فهرساً جاهزاً للأسئلة دون وصول جديد للقرص
+
+    progress_callback(directories_done, directories_total) is called from the
+    scanning threads, once per directory.
+    """
+    index = SubtitleIndex()
+    directories = {os.path.normpath(os.path.dirname(p)) for p in paths if p}
+    if not directories:
+        return index
+
+    groups = group_by_mount(directories, get_mounts())
+    total = len(directories)
+    done = [0]
+    lock = threading.Lock()
+
+    def scan_one(directory):
+        index.load(directory)
+        if progress_callback:
+            with lock:
+                done[0] += 1
+                current = done[0]
+            progress_callback(current, total)
+
+    # مجموعة خيوط لكل نقطة تركيب، وكل المجموعات تعمل في الوقت نفسه
+    executors = [
+        ThreadPoolExecutor(max_workers=min(concurrency, len(group)), thread_name_prefix=f"scan-{i}")
+        for i, group in enumerate(groups.values())
+    ]
+    try:
+        futures = [
+            executor.submit(scan_one, directory)
+            for executor, group in zip(executors, groups.values())
+            for directory in group
+        ]
+        for future in futures:
+            future.result()
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+    logger.info(f"Scanned {total} directories on {len(groups)} mount(s)")
+    return index
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Library Watcher - Live subtitle changes for the media mounts
+مراقب المكتبة - تحديث حالة الترجمة فور ظهور ملفات الترجمة أو اختفائها
+
+Watches local_movies_mount and local_tv_mount and updates translated /
+has_subtitles for the affected directories only, so a full status scan is
+rarely needed. Local disks use inotify through the optional watchdog package;
+network mounts (NFS, SMB, SSHFS...) do not deliver inotify events for changes
+made by other machines and are polled instead, re-listing only directories
+whose mtime changed. Events are coalesced for a few seconds before the
+database is touched. New or vanished videos are left to library sync, which
+has the Sonarr/Radarr metadata.
+
+Runs as its own process: python library_watcher.py
+"""
+
+import os
+import sys
+import time
+import fcntl
+import signal
+import logging
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from subtitle_index import SubtitleIndex, SUBTITLE_EXTENSIONS
+from library_scanner import get_mounts, is_network_path
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCK_FILE = os.path.join(PROJECT_DIR, "library_watcher.lock")
+
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_POLL_INTERVAL = 300
+# حد أقصى للانتظار حتى لا يؤجل تدفق مستمر من الأحداث التحديث إلى ما لا نهاية
+MAX_DELAY = 60.0
+
+try:
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    Observer = None
+    WATCHDOG_AVAILABLE = False
+
+
+class ChangeCoalescer:
+    """تجميع المجلدات المتغيرة وتسليمها دفعة واحدة بعد فترة هدوء"""
+
+    def __init__(self, apply_changes, debounce: float = DEFAULT_DEBOUNCE, max_delay: float = MAX_DELAY):
+        self.apply_changes = apply_changes
+        self.debounce = debounce
+        self.max_delay = max_delay
+        # مجلد → True إذا تغيرت شجرته كاملة (نقل أو حذف مجلد)
+        self._pending: Dict[str, bool] = {}
+        self._first_change = None
+        self._last_change = None
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def add(self, directory: str, recursive: bool = False):
+        directory = os.path.normpath(directory)
+        with self._cond:
+            now = time.monotonic()
+            self._pending[directory] = self._pending.get(directory, False) or recursive
+            self._first_change = self._first_change or now
+            self._last_change = now
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._pending:
+                        now = time.monotonic()
+                        due = min(self._last_change + self.debounce, self._first_change + self.max_delay)
+                        if now >= due:
+                            break
+                        self._cond.wait(due - now)
+                    else:
+                        self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+                self._first_change = self._last_change = None
+            try:
+                self.apply_changes(pending)
+            except Exception as e:
+                logger.error(f"Failed to apply library changes: {e}")
+            if self._stopped:
+                return
+
+
+class _EventHandler:
+    """معالج أحداث watchdog؛ يكفي أن يوفر dispatch()"""
+
+    def __init__(self, coalescer: ChangeCoalescer):
+        self.coalescer = coalescer
+
+    def dispatch(self, event):
+        # فتح الملفات وتعديل محتواها لا يغير وجود الترجمة
+        if event.event_type not in ('created', 'deleted', 'moved'):
+            return
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if not path:
+                continue
+            if isinstance(path, bytes):
+                path = os.fsdecode(path)
+            if event.is_directory:
+                self.coalescer.add(path, recursive=True)
+            elif path.lower().endswith(SUBTITLE_EXTENSIONS):
+                self.coalescer.add(os.path.dirname(path))
+
+
+class DirectoryPoller:
+    """مراقبة بالاستطلاع لأنظمة ملفات الشبكة: stat لكل مجلد، وإعادة القراءة عند تغير mtime فقط"""
+
+    def __init__(self, root: str, coalescer: ChangeCoalescer):
+        self.root = os.path.normpath(root)
+        self.coalescer = coalescer
+        # مجلد → (mtime_ns, أسماء الترجمات, المجلدات الفرعية)
+        self._snapshot: Dict[str, Tuple[int, frozenset, Tuple[str, ...]]] = {}
+
+    def _walk(self, report: bool) -> Dict[str, Tuple[int, frozenset, Tuple[str, ...]]]:
+        snapshot = {}
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            previous = self._snapshot.get(directory)
+            if previous and previous[0] == mtime:
+                entry = previous
+            else:
+                subtitles, subdirs = set(), []
+                try:
+                    with os.scandir(directory) as entries:
+                        for item in entries:
+                            if item.is_dir(follow_symlinks=False):
+                                subdirs.append(item.path)
+                            elif item.name.lower().endswith(SUBTITLE_EXTENSIONS):
+                                subtitles.add(item.name)
+                except OSError as e:
+                    logger.warning(f"Could not list {directory}: {e}")
+                    continue
+                entry = (mtime, frozenset(subtitles), tuple(subdirs))
+                if report and (previous is None or previous[1] != entry[1]):
+                    self.coalescer.add(directory)
+            snapshot[directory] = entry
+            stack.extend(entry[2])
+
+        if report:
+            for directory in set(self._snapshot) - set(snapshot):
+                self.coalescer.add(directory, recursive=True)
+        return snapshot
+
+    def poll(self, report: bool = True):
+        # الاستطلاع الأول يبني الصورة فقط؛ حالة قاعدة البيانات تُضبط بالفحص الكامل
+        self._snapshot = self._walk(report and bool(self._snapshot))
+
+
+def apply_subtitle_changes(pending: Dict[str, bool]) -> int:
+    """إعادة فحص المجلدات المتغيرة وتحديث الصفوف التي اختلفت حالتها فقط"""
+    sys.path.append(PROJECT_DIR)
+    from app import app, db
+    from models import MediaFile
+
+    with app.app_context():
+        rows = []
+        columns = (MediaFile.id, MediaFile.path, MediaFile.translated, MediaFile.has_subtitles)
+        for directory, recursive in pending.items():
+            prefix = directory.rstrip(os.sep) + os.sep
+            for row in db.session.query(*columns).filter(MediaFile.path.startswith(prefix, autoescape=True)):
+                if recursive or os.path.dirname(row.path) == directory:
+                    rows.append(row)
+        if not rows:
+            return 0
+
+        subtitles = SubtitleIndex()
+        subtitles.preload(row.path for row in rows)
+        now = datetime.utcnow()
+        updates = []
+        for row in rows:
+            if not subtitles.exists(row.path):
+                continue
+            has_translation = subtitles.has_subtitle(row.path)
+            if bool(row.translated) != has_translation or bool(row.has_subtitles) != has_translation:
+                updates.append({
+                    'id': row.id,
+                    'translated': has_translation,
+                    'has_subtitles': has_translation,
+                    'translation_completed_at': now if has_translation else None,
+                })
+
+        if updates:
+            db.session.bulk_update_mappings(MediaFile, updates)
+            db.session.commit()
+            logger.info(f"Updated translation status for {len(updates)} files in {len(pending)} directories")
+        return len(updates)
+
+
+def load_watch_settings() -> Dict[str, str]:
+    sys.path.append(PROJECT_DIR)
+    from app import app
+    from models import Settings
+
+    with app.app_context():
+        return {s.key: s.value for s in Settings.query.all()}
+
+
+def get_watch_roots(settings: Dict[str, str]) -> List[str]:
+    roots = []
+    for key in ('local_movies_mount', 'local_tv_mount'):
+        root = (settings.get(key) or '').strip()
+        if root and os.path.isdir(root) and root not in roots:
+            roots.append(root)
+    return roots
+
+
+def _as_float(value: Optional[str], default: float) -> float:
+    try:
+        return max(0.5, float(value)) if value else default
+    except ValueError:
+        return default
+
+
+def run_watcher(stop_event: Optional[threading.Event] = None):
+    """تشغيل المراقب حتى إشارة الإيقاف"""
+    stop_event = stop_event or threading.Event()
+    settings = load_watch_settings()
+    roots = get_watch_roots(settings)
+    if not roots:
+        logger.warning("No existing local_movies_mount/local_tv_mount to watch")
+        return
+
+    coalescer = ChangeCoalescer(apply_subtitle_changes, _as_float(settings.get('library_watch_debounce'), DEFAULT_DEBOUNCE))
+    poll_interval = _as_float(settings.get('library_watch_poll_interval'), DEFAULT_POLL_INTERVAL)
+    worker = threading.Thread(target=coalescer.run, name="library-watcher-apply", daemon=True)
+    worker.start()
+
+    mounts = get_mounts()
+    # مراقب مستقل لكل جذر: watchdog ينشئ مراقبات inotify عند start()، فيُعالج فشل كل جذر وحده
+    observers = []
+    pollers = []
+    for root in roots:
+        if WATCHDOG_AVAILABLE and not is_network_path(root, mounts):
+            observer = Observer()
+            try:
+                observer.schedule(_EventHandler(coalescer), root, recursive=True)
+                observer.start()
+                observers.append(observer)
+                logger.info(f"Watching {root} with inotify")
+                continue
+            except OSError as e:
+                # مثل تجاوز fs.inotify.max_user_watches (ENOSPC) في المكتبات الكبيرة
+                logger.warning(f"Cannot watch {root} with inotify, polling instead: {e}")
+                try:
+                    observer.unschedule_all()
+                except Exception:
+                    pass
+        pollers.append(DirectoryPoller(root, coalescer))
+        logger.info(f"Polling {root} every {poll_interval:.0f}s")
+
+    try:
+        while not stop_event.is_set():
+            for poller in pollers:
+                poller.poll()
+            stop_event.wait(poll_interval if pollers else 3600)
+    finally:
+        for observer in observers:
+            observer.stop()
+            observer.join()
+        coalescer.stop()
+        worker.join()
+
+
+def is_watcher_enabled(settings: Dict[str, str]) -> bool:
+    return (settings.get('library_watch_enabled') or '').lower() in ('true', '1', 'yes')
+
+
+def ensure_watcher_running(settings: Dict[str, str]) -> bool:
+    """تشغيل عملية المراقب إذا كانت مفعلة؛ قفل الملف يمنع تشغيل نسختين"""
+    if not is_watcher_enabled(settings):
+        return False
+    try:
+        with open(LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    except OSError:
+        return True
+    subprocess.Popen([sys.executable, os.path.join(PROJECT_DIR, 'library_watcher.py')], cwd=PROJECT_DIR,
+                     start_new_session=True)
+    return True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    lock = open(LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        logger.info("Library watcher is already running")
+        return
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    run_watcher(stop_event)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Buffered Log Writer - Batched inserts for the logs table
+كاتب السجلات المؤقت - إدراج السجلات على دفعات بدلاً من commit لكل رسالة
+
+log_to_db() only appends to an in-memory buffer. A daemon thread writes the
+buffer with one executemany per batch when it reaches max_batch records or
+every flush_interval seconds, and whatever is left is flushed at process exit.
+Each record keeps the time it was logged, not the time it was written.
+"""
+
+import os
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_MAX_BATCH = 200
+DEFAULT_FLUSH_INTERVAL = 2.0
+# عند تعطل قاعدة البيانات تُحذف أقدم السجلات بدلاً من استهلاك الذاكرة بلا حد
+DEFAULT_MAX_BUFFER = 10000
+
+
+class BufferedLogWriter:
+    """تجميع سجلات {level, message, details, source, created_at} وكتابتها على دفعات"""
+
+    def __init__(self, write_rows: Callable[[List[Dict]], None], max_batch: int = DEFAULT_MAX_BATCH,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, max_buffer: int = DEFAULT_MAX_BUFFER):
+        self.write_rows = write_rows
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        # بعد fork (مثل gunicorn --preload) لا ينتقل الخيط إلى العملية الجديدة
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, level: str, message: str, details: str = "", source: Optional[str] = None):
+        self._buffer.append({
+            'level': level,
+            'message': message,
+            'details': details,
+            'source': source,
+            'created_at': datetime.utcnow(),
+        })
+        if self._stopped:
+            self.flush()
+            return
+        self._ensure_thread()
+        if len(self._buffer) >= self.max_batch:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """كتابة كل ما في الذاكرة الآن"""
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.max_batch:
+                    batch.append(self._buffer.popleft())
+                try:
+                    self.write_rows(batch)
+                except Exception as e:
+                    print(f"DB_LOG_ERROR: {e}")
+                    # تُعاد الدفعة إلى أول الطابور لتُجرب في الدورة التالية
+                    self._buffer.extendleft(reversed(batch))
+                    return
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
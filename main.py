@@ -63,6 +63,22 @@ try:
     from app import app
     logger.info("✓ Successfully imported original AI Translator v2.2.5")
     
+    # استئناف المهام التي بقيت في الطابور بعد إعادة تشغيل أو توقف مفاجئ
+    try:
+        from job_queue import resume_pending_jobs
+        if resume_pending_jobs():
+            logger.info("✓ Resumed pending background jobs")
+    except Exception as e:
+        logger.warning(f"⚠ Could not resume background jobs: {e}")
+    
+    # تشغيل مراقب المكتبة (عملية مستقلة) إذا كان مفعلاً في الإعدادات
+    try:
+        from library_watcher import ensure_watcher_running, load_watch_settings
+        if ensure_watcher_running(load_watch_settings()):
+            logger.info("✓ Library watcher running")
+    except Exception as e:
+        logger.warning(f"⚠ Could not start library watcher: {e}")
+    
     # فحص إضافي للبرامج المساعدة المتقدمة
     logger.info("🔧 Checking advanced components...")
     
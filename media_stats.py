@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Media Statistics - Cached library counters for the dashboard
+إحصائيات المكتبة - عدادات لوحة التحكم مع تخزين مؤقت قصير
+
+All counters come from one GROUP BY over (translated, blacklisted), which the
+composite index answers without touching the table rows. The result is
+cached for a few seconds and dropped as soon as MediaFile rows change in
+this process, or when a background task rewrites status.json.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+from models import db, MediaFile
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATUS_FILE = os.path.join(PROJECT_DIR, "status.json")
+# كل كتابة لملف حالة مهمة تتم بـ os.replace فتتغير mtime المجلد
+JOB_STATUS_DIR = os.path.join(PROJECT_DIR, "run", "status")
+
+DEFAULT_TTL = 10
+
+_cache = {'stats': None, 'expires': 0.0, 'status_mtime': None}
+_cache_lock = threading.Lock()
+
+
+def _status_mtime() -> Optional[float]:
+    # المهام الخلفية تعمل في عمليات منفصلة وتحدّث status.json (أو ملف حالتها في run/status) أثناء تغيير حالة الملفات
+    mtimes = []
+    for path in (STATUS_FILE, JOB_STATUS_DIR):
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            pass
+    return max(mtimes) if mtimes else None
+
+
+def invalidate_media_stats():
+    """إلغاء العدادات المخزنة بعد أي تغيير في حالة الملفات"""
+    with _cache_lock:
+        _cache['stats'] = None
+
+
+def compute_media_stats() -> Dict[str, int]:
+    """استعلام تجميعي واحد بدلاً من عدة COUNT(*) منفصلة"""
+    rows = (
+        db.session.query(MediaFile.translated, MediaFile.blacklisted, db.func.count(MediaFile.id))
+        .group_by(MediaFile.translated, MediaFile.blacklisted)
+        .all()
+    )
+    stats = {'total_files': 0, 'translated_files': 0, 'blacklisted_files': 0, 'pending_files': 0}
+    for translated, blacklisted, count in rows:
+        stats['total_files'] += count
+        if translated:
+            stats['translated_files'] += count
+        if blacklisted:
+            stats['blacklisted_files'] += count
+        if not translated and not blacklisted:
+            stats['pending_files'] += count
+    return stats
+
+
+def get_media_stats(ttl: float = DEFAULT_TTL) -> Dict[str, int]:
+    """العدادات من الذاكرة إذا كانت حديثة، وإلا من قاعدة البيانات"""
+    now = time.monotonic()
+    mtime = _status_mtime()
+    with _cache_lock:
+        if _cache['stats'] is not None and now < _cache['expires'] and mtime == _cache['status_mtime']:
+            return dict(_cache['stats'])
+
+    stats = compute_media_stats()
+    with _cache_lock:
+        _cache.update(stats=stats, expires=now + ttl, status_mtime=mtime)
+    return dict(stats)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _invalidate_on_media_change(session, flush_context):
+    if any(isinstance(obj, MediaFile) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        invalidate_media_stats()
+
+
+@event.listens_for(db.session, 'after_bulk_delete')
+def _invalidate_on_bulk_delete(delete_context):
+    if delete_context.mapper.class_ is MediaFile:
+        invalidate_media_stats()
+
+
+@event.listens_for(db.session, 'after_bulk_update')
+def _invalidate_on_bulk_update(update_context):
+    if update_context.mapper.class_ is MediaFile:
+        invalidate_media_stats()
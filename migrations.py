@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations for AI Translator
+ترحيل مخطط قاعدة البيانات للترجمان الآلي
+
+db.create_all() only creates missing tables, so every change to an existing
+table (indexes, columns) is a numbered revision here. Applied revisions are
+recorded in schema_migrations and each revision runs exactly once per
+database. On PostgreSQL indexes are built with CREATE INDEX CONCURRENTLY so
+media_files stays writable while they are created.
+"""
+
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, select, text
+
+from models import db, SchemaMigration
+from search_index import PG_SEARCH_VECTOR, FTS_TABLE
+from thumbnail_store import get_thumbnail_store
+
+logger = logging.getLogger(__name__)
+
+# مفتاح القفل الاستشاري في PostgreSQL، يمنع عمليتين من تطبيق الترحيلات معاً
+ADVISORY_LOCK_KEY = 72310013
+
+MIGRATIONS: List[Tuple[str, str, Callable]] = []
+
+
+def migration(revision: str, description: str):
+    """تسجيل دالة ترحيل؛ الترتيب هو ترتيب التعريف في هذا الملف"""
+    def register(func):
+        MIGRATIONS.append((revision, description, func))
+        return func
+    return register
+
+
+class MigrationContext:
+    """اتصال AUTOCOMMIT مع أدوات مساعدة تراعي نوع قاعدة البيانات"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+
+    def execute(self, sql: str, **params):
+        return self.connection.execute(text(sql), params)
+
+    @contextmanager
+    def transaction(self):
+        """سياق على اتصال منفصل داخل معاملة واحدة؛ أي خطأ يلغي كل خطواتها
+
+        For data changes that must not be left half-done. Index builds stay on
+        the AUTOCOMMIT connection because CREATE INDEX CONCURRENTLY cannot run
+        inside a transaction.
+        """
+        with self.connection.engine.begin() as connection:
+            yield MigrationContext(connection)
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.connection).has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in {c['name'] for c in inspect(self.connection).get_columns(table)}
+
+    def add_column(self, table: str, column: str, ddl: str):
+        """إضافة عمود إذا لم يكن موجوداً، ddl مثل 'VARCHAR(64)'"""
+        if not self.has_column(table, column):
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    def create_index(self, name: str, table: str, columns: List[str], unique: bool = False,
+                     using: Optional[str] = None):
+        """columns may also be SQL expressions; using selects the index method (PostgreSQL)"""
+        unique_sql = "UNIQUE " if unique else ""
+        columns_sql = ", ".join(columns)
+        if using:
+            columns_sql = f"USING {using} ({columns_sql})"
+        else:
+            columns_sql = f"({columns_sql})"
+
+        if self.dialect == 'postgresql':
+            # بناء CONCURRENTLY فاشل يترك فهرساً غير صالح يتجاوزه IF NOT EXISTS
+            invalid = self.execute(
+                "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND NOT i.indisvalid", name=name
+            ).first()
+            if invalid:
+                self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            self.execute(f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns_sql}")
+        else:
+            self.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} {columns_sql}")
+
+
+# --- الترحيلات ---
+
+@migration('0001', 'Unique media_files.path, filter and created_at indexes')
+def add_hot_path_indexes(ctx):
+    # دمج المسارات المكررة قبل الفهرس الفريد: يبقى الصف الأقدم وتنتقل إليه المراجع
+    # الدمج كله في معاملة واحدة حتى لا يترك انقطاعٌ في منتصفه صفوفاً نصف مدموجة
+    with ctx.transaction() as tx:
+        duplicates = tx.execute(
+            "SELECT path, MIN(id) FROM media_files GROUP BY path HAVING COUNT(*) > 1"
+        ).fetchall()
+        for path, keep_id in duplicates:
+            rows = tx.execute(
+                "SELECT id, blacklisted FROM media_files WHERE path = :path AND id != :keep_id",
+                path=path, keep_id=keep_id
+            ).fetchall()
+            # القائمة السوداء اختيار المستخدم، فلا تضيع مع الصف المحذوف
+            if any(row.blacklisted for row in rows):
+                tx.execute("UPDATE media_files SET blacklisted = :flag WHERE id = :keep_id", flag=True, keep_id=keep_id)
+            for row in rows:
+                for table in ('translation_jobs', 'translation_history'):
+                    tx.execute(f"UPDATE {table} SET media_file_id = :keep_id WHERE media_file_id = :id",
+                               keep_id=keep_id, id=row.id)
+                tx.execute("DELETE FROM media_files WHERE id = :id", id=row.id)
+    if duplicates:
+        logger.info(f"Merged duplicate media_files rows for {len(duplicates)} paths")
+
+    ctx.create_index('ix_media_files_path', 'media_files', ['path'], unique=True)
+    ctx.create_index('ix_media_files_translated_blacklisted', 'media_files', ['translated', 'blacklisted'])
+    ctx.create_index('ix_media_files_media_type_translated', 'media_files', ['media_type', 'translated'])
+    ctx.create_index('ix_logs_created_at', 'logs', ['created_at'])
+    ctx.create_index('ix_translation_logs_created_at', 'translation_logs', ['created_at'])
+    ctx.create_index('ix_notifications_created_at', 'notifications', ['created_at'])
+
+
+@migration('0002', 'Full-text search over media_files title and path')
+def add_media_search_index(ctx):
+    if ctx.dialect == 'sqlite':
+        # بعض نسخ SQLite مبنية بدون FTS5؛ البحث يرجع حينها إلى LIKE
+        try:
+            ctx.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            ctx.execute("DROP TABLE temp.fts5_probe")
+        except Exception as e:
+            logger.warning(f"SQLite FTS5 is not available, search will use LIKE: {e}")
+            return
+
+        ctx.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, path, content='media_files', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        # المشغلات تبقي الفهرس متزامناً مع كل كتابة، بما فيها الإدراج المجمّع أثناء المزامنة
+        ctx.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON media_files BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, path) VALUES (new.id, new.title, new.path); END"
+        )
+        ctx.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON media_files BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, path) VALUES ('delete', old.id, old.title, old.path); END"
+        )
+        ctx.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, path ON media_files BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, path) VALUES ('delete', old.id, old.title, old.path); "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, path) VALUES (new.id, new.title, new.path); END"
+        )
+        ctx.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    elif ctx.dialect == 'postgresql':
+        # فهرس تعبيري: PostgreSQL يحدّثه تلقائياً مع كل إدراج أو تعديل
+        ctx.create_index('ix_media_files_search', 'media_files', [PG_SEARCH_VECTOR], using='gin')
+        try:
+            ctx.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as e:
+            logger.warning(f"pg_trgm extension unavailable, fuzzy title search disabled: {e}")
+            return
+        ctx.create_index('ix_media_files_title_trgm', 'media_files', ['title gin_trgm_ops'], using='gin')
+        ctx.create_index('ix_media_files_path_trgm', 'media_files', ['path gin_trgm_ops'], using='gin')
+
+
+@migration('0003', 'Move thumbnail blobs out of media_files into the thumbnail store')
+def move_thumbnails_to_store(ctx):
+    ctx.add_column('media_files', 'thumbnail_key', 'VARCHAR(64)')
+
+    store = get_thumbnail_store()
+    moved = 0
+    last_id = 0
+    while True:
+        # دفعات صغيرة لأن كل صف يحمل صورة كاملة
+        rows = ctx.execute(
+            "SELECT id, thumbnail_data FROM media_files "
+            "WHERE thumbnail_data IS NOT NULL AND id > :last_id ORDER BY id LIMIT 100",
+            last_id=last_id
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            key = store.put(bytes(row.thumbnail_data))
+            ctx.execute("UPDATE media_files SET thumbnail_key = :key, thumbnail_data = NULL WHERE id = :id",
+                        key=key, id=row.id)
+        last_id = rows[-1].id
+        moved += len(rows)
+
+    if moved:
+        logger.info(f"Moved {moved} thumbnails to {store.root}")
+        # SQLite لا يعيد المساحة المحررة إلى نظام الملفات بدون VACUUM
+        if ctx.dialect == 'sqlite':
+            ctx.execute("VACUUM")
+
+
+# --- المشغّل ---
+
+def get_applied_revisions(connection) -> set:
+    return {row[0] for row in connection.execute(select(SchemaMigration.revision))}
+
+
+def run_migrations(engine=None) -> List[str]:
+    """تطبيق الترحيلات المعلقة بالترتيب وإرجاع أرقامها"""
+    engine = engine or db.engine
+    # جلسة ORM مفتوحة تجعل CREATE INDEX CONCURRENTLY ينتظرها إلى الأبد
+    db.session.remove()
+
+    applied_now = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        ctx = MigrationContext(connection)
+        SchemaMigration.__table__.create(bind=connection, checkfirst=True)
+
+        if ctx.dialect == 'postgresql':
+            ctx.execute("SELECT pg_advisory_lock(:key)", key=ADVISORY_LOCK_KEY)
+        try:
+            applied = get_applied_revisions(connection)
+            for revision, description, upgrade in MIGRATIONS:
+                if revision in applied:
+                    continue
+                logger.info(f"Applying migration {revision}: {description}")
+                upgrade(ctx)
+                connection.execute(SchemaMigration.__table__.insert().values(
+                    revision=revision, description=description, applied_at=datetime.utcnow()
+                ))
+                applied_now.append(revision)
+        finally:
+            if ctx.dialect == 'postgresql':
+                ctx.execute("SELECT pg_advisory_unlock(:key)", key=ADVISORY_LOCK_KEY)
+
+    if applied_now:
+        logger.info(f"Applied migrations: {', '.join(applied_now)}")
+    return applied_now
+
+
+def get_migration_status() -> List[dict]:
+    """حالة كل ترحيل معروف، للعرض أو للتشخيص"""
+    applied = {row.revision: row.applied_at for row in SchemaMigration.query.all()}
+    return [
+        {'revision': revision, 'description': description, 'applied_at': applied.get(revision)}
+        for revision, description, _ in MIGRATIONS
+    ]
+
+
+if __name__ == "__main__":
+    import sys
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        # app.py يطبق الترحيلات عند بدء التشغيل؛ upgrade للتطبيق اليدوي دون تشغيل الخادم
+        if len(sys.argv) > 1 and sys.argv[1] == 'upgrade':
+            run_migrations()
+        for entry in get_migration_status():
+            state = entry['applied_at'].isoformat() if entry['applied_at'] else 'pending'
+            print(f"{entry['revision']}  {state:<26}  {entry['description']}")
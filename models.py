@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import deferred, load_only
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -26,29 +27,47 @@ class MediaFile(db.Model):
     media_type = db.Column(db.String(20))  # 'movie' or 'episode'
     poster_url = db.Column(db.Text)
     thumbnail_url = db.Column(db.Text)
-    thumbnail_data = db.Column(db.LargeBinary)  # Store thumbnail as binary data
-    imdb_id = db.Column(db.String(20))
-    tmdb_id = db.Column(db.Integer)
+    thumbnail_data = deferred(db.Column(db.LargeBinary))  # Legacy: moved to the thumbnail store by migration 0003
+    thumbnail_key = db.Column(db.String(64))  # sha256 key in thumbnail_store
+    # Columns below marked deferred are only loaded when accessed, so list queries stay narrow
+    imdb_id = deferred(db.Column(db.String(20)), group='details')
+    tmdb_id = deferred(db.Column(db.Integer), group='details')
     sonarr_id = db.Column(db.Integer)
     radarr_id = db.Column(db.Integer)
-    plex_id = db.Column(db.String(50))  # Plex media ID
-    jellyfin_id = db.Column(db.String(50))  # Jellyfin media ID
-    emby_id = db.Column(db.String(50))  # Emby media ID
-    kodi_id = db.Column(db.String(50))  # Kodi media ID
+    plex_id = deferred(db.Column(db.String(50)), group='details')  # Plex media ID
+    jellyfin_id = deferred(db.Column(db.String(50)), group='details')  # Jellyfin media ID
+    emby_id = deferred(db.Column(db.String(50)), group='details')  # Emby media ID
+    kodi_id = deferred(db.Column(db.String(50)), group='details')  # Kodi media ID
     service_source = db.Column(db.String(20), default='radarr')  # Source service: radarr, sonarr, plex, jellyfin, emby, kodi
     has_subtitles = db.Column(db.Boolean, default=False)
     translated = db.Column(db.Boolean, default=False)
     blacklisted = db.Column(db.Boolean, default=False)
     file_size = db.Column(db.BigInteger)
-    duration = db.Column(db.Integer)  # in seconds
+    duration = deferred(db.Column(db.Integer), group='details')  # in seconds
     quality = db.Column(db.String(20))
-    video_codec = db.Column(db.String(50))
-    audio_codec = db.Column(db.String(50))
-    resolution = db.Column(db.String(20))
+    video_codec = deferred(db.Column(db.String(50)), group='details')
+    audio_codec = deferred(db.Column(db.String(50)), group='details')
+    resolution = deferred(db.Column(db.String(20)), group='details')
     subtitle_language = db.Column(db.String(10), default='ar')  # Target translation language
     translation_completed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_media_files_path', 'path', unique=True),  # lookup key for sync, batch and blacklist
+        db.Index('ix_media_files_translated_blacklisted', 'translated', 'blacklisted'),
+        db.Index('ix_media_files_media_type_translated', 'media_type', 'translated'),
+    )
+
+# Columns needed by list and batch code paths (file grid, sync, corrections, batch)
+MEDIA_FILE_LIST_COLUMNS = (
+    'id', 'path', 'title', 'year', 'media_type', 'poster_url', 'thumbnail_key',
+    'translated', 'blacklisted', 'has_subtitles', 'file_size', 'quality',
+)
+
+def media_file_list_options():
+    """Query option restricting MediaFile loads to MEDIA_FILE_LIST_COLUMNS"""
+    return load_only(*(getattr(MediaFile, name) for name in MEDIA_FILE_LIST_COLUMNS))
 
 class Log(db.Model):
     __tablename__ = 'logs'
@@ -58,7 +77,7 @@ class Log(db.Model):
     message = db.Column(db.Text, nullable=False)
     details = db.Column(db.Text)
     source = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class TranslationJob(db.Model):
     __tablename__ = 'translation_jobs'
@@ -87,7 +106,7 @@ class Notification(db.Model):
     type = db.Column(db.String(20), default='info')  # info, success, warning, error
     read = db.Column(db.Boolean, default=False)
     translation_params = db.Column(db.Text)  # JSON string for translation parameters
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class UserSession(db.Model):
     __tablename__ = 'user_sessions'
@@ -131,6 +150,52 @@ class TranslationHistory(db.Model):
     
     media_file = db.relationship('MediaFile', backref='translation_history')
 
+class TranslationMemory(db.Model):
+    __tablename__ = 'translation_memory'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of normalized source + model + target language
+    source_text = db.Column(db.Text, nullable=False)
+    translated_text = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(50))
+    target_language = db.Column(db.String(10), default='ar')
+    hit_count = db.Column(db.Integer, default=0)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # LRU eviction order
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PosterFailure(db.Model):
+    __tablename__ = 'poster_failures'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the poster URL
+    url = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_retry_at = db.Column(db.DateTime, index=True)  # exponential backoff between attempts
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_name = db.Column(db.String(100), nullable=False)  # function name in background_tasks.py
+    args = db.Column(db.Text, default='[]')  # JSON list of string arguments
+    job_type = db.Column(db.String(50), nullable=False)  # concurrency group, see job_queue.JOB_TYPES
+    priority = db.Column(db.Integer, default=0)  # higher runs first
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed, cancelled
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)  # restarts after a crash before giving up
+    worker_pid = db.Column(db.Integer)
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_background_jobs_status_priority', 'status', 'priority', 'id'),
+    )
+
 class TranslationLog(db.Model):
     __tablename__ = 'translation_logs'
     
@@ -147,10 +212,17 @@ class TranslationLog(db.Model):
     ollama_model = db.Column(db.String(50))
     subtitle_path = db.Column(db.Text)  # Path to generated subtitle file
     quality_score = db.Column(db.Float)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
 
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    revision = db.Column(db.String(64), primary_key=True)
+    description = db.Column(db.Text)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class DatabaseStats(db.Model):
     __tablename__ = 'database_stats'
     
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Keyset Pagination - Cursor-based paging for large tables
+ترقيم الصفحات بالمؤشر - تصفح الجداول الكبيرة دون OFFSET
+
+Each page is fetched with WHERE key > last_key ORDER BY key LIMIT n, so the
+cost of a page does not grow with how far the operator has scrolled. Cursors
+are opaque url-safe tokens; totals are counted once per filter combination
+and cached for a short time instead of on every request.
+"""
+
+import json
+import time
+import base64
+import threading
+from typing import Any, Dict, List, Optional
+
+DEFAULT_COUNT_TTL = 60
+
+_count_cache: Dict[str, tuple] = {}
+_count_lock = threading.Lock()
+
+
+class InvalidCursor(ValueError):
+    """مؤشر تالف أو لا يطابق الترتيب المطلوب"""
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    if not isinstance(payload, dict) or payload.get('d') not in ('next', 'prev') or 'v' not in payload:
+        raise InvalidCursor("Invalid cursor")
+    return payload
+
+
+def keyset_page(query, column, per_page: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """صفحة واحدة مرتبة حسب عمود فريد (id أو path) مع مؤشرات التالي والسابق
+
+    Returns {'items', 'next_cursor', 'prev_cursor', 'has_next', 'has_prev'}.
+    Cursors are bound to the column name, so a token from one sort order is
+    rejected by another.
+    """
+    key = column.key
+    direction = 'next'
+    if cursor:
+        payload = decode_cursor(cursor)
+        if payload.get('k') != key:
+            raise InvalidCursor("Cursor does not match the requested order")
+        direction = payload['d']
+        if direction == 'next':
+            query = query.filter(column > payload['v'])
+        else:
+            query = query.filter(column < payload['v'])
+
+    if direction == 'next':
+        rows = query.order_by(column.asc()).limit(per_page + 1).all()
+    else:
+        rows = query.order_by(column.desc()).limit(per_page + 1).all()
+
+    # الصف الإضافي يكشف وجود صفحة أخرى دون استعلام COUNT
+    has_more = len(rows) > per_page
+    items: List[Any] = rows[:per_page]
+    if direction == 'prev':
+        items.reverse()
+
+    if direction == 'next':
+        has_next, has_prev = has_more, cursor is not None
+    else:
+        has_next, has_prev = True, has_more
+
+    return {
+        'items': items,
+        'next_cursor': encode_cursor({'k': key, 'd': 'next', 'v': getattr(items[-1], key)}) if items and has_next else None,
+        'prev_cursor': encode_cursor({'k': key, 'd': 'prev', 'v': getattr(items[0], key)}) if items and has_prev else None,
+        'has_next': bool(items) and has_next,
+        'has_prev': bool(items) and has_prev,
+    }
+
+
+def ranked_page(items: List[Any], per_page: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """ترقيم قائمة نتائج محدودة مرتبة مسبقاً (نتائج البحث حسب الصلة) بمؤشر موضع"""
+    offset = 0
+    if cursor:
+        payload = decode_cursor(cursor)
+        if payload.get('k') != 'rank' or not isinstance(payload['v'], int):
+            raise InvalidCursor("Cursor does not match the requested order")
+        offset = max(0, payload['v'])
+
+    page_items = items[offset:offset + per_page]
+    has_next = offset + per_page < len(items)
+    has_prev = offset > 0
+    return {
+        'items': page_items,
+        'next_cursor': encode_cursor({'k': 'rank', 'd': 'next', 'v': offset + per_page}) if has_next else None,
+        'prev_cursor': encode_cursor({'k': 'rank', 'd': 'prev', 'v': max(0, offset - per_page)}) if has_prev else None,
+        'has_next': has_next,
+        'has_prev': has_prev,
+    }
+
+
+def cached_count(query, cache_key: str, ttl: float = DEFAULT_COUNT_TTL) -> int:
+    """عدد تقريبي: يُحسب مرة لكل مجموعة فلاتر ويُعاد استخدامه حتى انتهاء المدة"""
+    now = time.monotonic()
+    with _count_lock:
+        entry = _count_cache.get(cache_key)
+        if entry and entry[1] > now:
+            return entry[0]
+
+    total = query.order_by(None).count()
+    with _count_lock:
+        # حذف المنتهية لكي لا تكبر الذاكرة مع عمليات البحث المختلفة
+        for key in [k for k, (_, expires) in _count_cache.items() if expires <= now]:
+            del _count_cache[key]
+        _count_cache[cache_key] = (total, now + ttl)
+    return total
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Poster Prefetch - Concurrent download of missing posters into the thumbnail store
+جلب الملصقات مسبقاً - تنزيل الملصقات الناقصة بالتوازي إلى مخزن الصور المصغرة
+
+Runs after library sync so the file grid only ever serves local thumbnails.
+Each distinct URL is downloaded once (all episodes of a series share one
+poster), with a bounded number of parallel downloads. Failed URLs are kept in
+poster_failures and retried with exponential backoff instead of on every run.
+"""
+
+import sys
+import os
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, Tuple
+
+from services.http_session import get_session
+from thumbnail_store import get_thumbnail_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DOWNLOAD_TIMEOUT = 15
+RETRY_BASE = timedelta(minutes=30)
+RETRY_MAX = timedelta(days=7)
+MAX_POSTER_BYTES = 10 * 1024 * 1024
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def resolve_poster_url(url: str, service_source: Optional[str], settings: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+    """الروابط النسبية (/MediaCover/...) تُجلب من خادم Sonarr/Radarr مع مفتاح API"""
+    if not url.startswith('/') or service_source not in ('sonarr', 'radarr'):
+        return url, {}
+    base_url = (settings.get(f'{service_source}_url') or '').rstrip('/')
+    api_key = settings.get(f'{service_source}_api_key')
+    return f"{base_url}{url}", ({'X-Api-Key': api_key} if api_key else {})
+
+
+def download_poster(url: str, headers: Dict[str, str]) -> str:
+    """تنزيل صورة واحدة وحفظها في المخزن (مع المقاس الصغير)؛ يعيد المفتاح"""
+    response = get_session(url).get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    content_type = response.headers.get('Content-Type', '')
+    if content_type and not content_type.startswith('image/'):
+        raise ValueError(f"Unexpected content type {content_type}")
+    if not response.content or len(response.content) > MAX_POSTER_BYTES:
+        raise ValueError(f"Unexpected poster size {len(response.content)} bytes")
+    return get_thumbnail_store().put(response.content)
+
+
+def prefetch_posters(settings: Dict[str, str], progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """تنزيل الملصقات الناقصة؛ يعيد {'downloaded', 'failed', 'skipped', 'files'}"""
+    sys.path.append(os.path.dirname(__file__))
+    from app import app, db
+    from models import MediaFile, PosterFailure
+
+    try:
+        concurrency = max(1, int(settings.get('poster_prefetch_concurrency') or DEFAULT_CONCURRENCY))
+    except ValueError:
+        concurrency = DEFAULT_CONCURRENCY
+
+    stats = {'downloaded': 0, 'failed': 0, 'skipped': 0, 'files': 0}
+    with app.app_context():
+        now = datetime.utcnow()
+
+        # رابط واحد → كل الملفات التي تستخدمه
+        pending: Dict[str, list] = {}
+        sources: Dict[str, Optional[str]] = {}
+        rows = (
+            db.session.query(MediaFile.id, MediaFile.poster_url, MediaFile.service_source)
+            .filter(MediaFile.poster_url.isnot(None), MediaFile.poster_url != '', MediaFile.thumbnail_key.is_(None))
+        )
+        for file_id, poster_url, service_source in rows:
+            pending.setdefault(poster_url, []).append(file_id)
+            sources.setdefault(poster_url, service_source)
+        if not pending:
+            return stats
+
+        failures = {f.url_hash: f for f in PosterFailure.query.all()}
+        urls = []
+        for url in pending:
+            failure = failures.get(_url_hash(url))
+            if failure and failure.next_retry_at and failure.next_retry_at > now:
+                stats['skipped'] += 1
+            else:
+                urls.append(url)
+
+        logger.info(f"Prefetching {len(urls)} posters for {sum(len(pending[u]) for u in urls)} files "
+                    f"({stats['skipped']} waiting for retry)")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(download_poster, *resolve_poster_url(url, sources[url], settings)): url
+                for url in urls
+            }
+            # الكتابة في قاعدة البيانات من الخيط الرئيسي فقط، مع وصول كل نتيجة
+            for done, future in enumerate(as_completed(futures), 1):
+                url = futures[future]
+                url_hash = _url_hash(url)
+                failure = failures.get(url_hash)
+                try:
+                    key = future.result()
+                except Exception as e:
+                    if not failure:
+                        failure = PosterFailure(url_hash=url_hash, url=url, attempts=0)
+                        db.session.add(failure)
+                        failures[url_hash] = failure
+                    failure.attempts = (failure.attempts or 0) + 1
+                    failure.last_error = str(e)[:500]
+                    failure.next_retry_at = datetime.utcnow() + min(RETRY_BASE * (2 ** (failure.attempts - 1)), RETRY_MAX)
+                    stats['failed'] += 1
+                else:
+                    # ملصق مسلسل طويل مشترك بين آلاف الحلقات؛ القائمة تُقسم لتبقى تحت حد متغيرات SQLite
+                    file_ids = pending[url]
+                    for i in range(0, len(file_ids), 500):
+                        MediaFile.query.filter(MediaFile.id.in_(file_ids[i:i + 500])).update(
+                            {'thumbnail_key': key}, synchronize_session=False
+                        )
+                    if failure:
+                        db.session.delete(failure)
+                    stats['downloaded'] += 1
+                    stats['files'] += len(file_ids)
+
+                if done % 50 == 0 or done == len(futures):
+                    db.session.commit()
+                if progress_callback:
+                    progress_callback(done, len(futures))
+
+        db.session.commit()
+
+    logger.info(f"Poster prefetch finished: {stats}")
+    return stats
@@ -4,10 +4,23 @@ import sys
 import subprocess
 import time
 import tempfile
+import threading
 import json
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from whisper_worker import get_whisper_worker, is_worker_available
+from translation_memory import TranslationMemoryStore
+from subtitles import (
+    parse_srt, serialize_srt, cue_to_prompt_line, parse_prompt_lines, LINE_BREAK_MARKER,
+    chunk_cues, estimate_tokens, get_context_window, completed_prompt_ids,
+    PROMPT_LINE_RE, OUTPUT_EXPANSION,
+)
+from services.ollama_client import generate_stream, OllamaStreamError
+from services.http_session import configure_http_pool
+
+# Generation is aborted once output exceeds this multiple of the expected tokens
+RUNAWAY_TOKEN_FACTOR = 3
 
 def log_message(message):
     """Log message to console and process log file"""
@@ -56,8 +69,12 @@ def get_settings():
             'whisper_model': os.environ.get('WHISPER_MODEL', 'medium.en')
         }
 
-def check_existing_translation(video_path):
+def check_existing_translation(video_path, subtitle_index=None):
     """Check if Arabic subtitle file already exists"""
+    # في المهام الجماعية يُجاب من فهرس المجلدات بدلاً من فحص الملف عبر الشبكة
+    if subtitle_index is not None:
+        return subtitle_index.has_subtitle(video_path)
+    
     video_dir = os.path.dirname(video_path)
     video_name = os.path.splitext(os.path.basename(video_path))[0]
     
@@ -121,7 +138,25 @@ def extract_audio(video_path, audio_path):
         return False
 
 def transcribe_with_whisper(audio_path, settings):
-    """Transcribe audio using Whisper"""
+    """Transcribe audio using the persistent Whisper worker, falling back to the CLI"""
+    use_worker = str(settings.get('whisper_persistent_worker', 'true')).lower() in ['true', '1', 'yes']
+    
+    if use_worker and is_worker_available():
+        log_message("Starting Whisper transcription (persistent worker)...")
+        model = settings.get('whisper_model', 'medium.en')
+        gpu_id = settings.get('whisper_gpu_id', 'auto')
+        
+        result = get_whisper_worker().transcribe(audio_path, model, gpu_id=gpu_id, language='en')
+        if result.get('success') and os.path.exists(result['srt_path']):
+            log_message("Whisper transcription completed successfully")
+            return result['srt_path']
+        
+        log_message(f"Whisper worker failed: {result.get('error', 'no SRT produced')}, falling back to CLI")
+    
+    return transcribe_with_whisper_cli(audio_path, settings)
+
+def transcribe_with_whisper_cli(audio_path, settings):
+    """Transcribe audio using the whisper command line tool"""
     log_message("Starting Whisper transcription...")
     
     model = settings.get('whisper_model', 'medium.en')
@@ -183,9 +218,31 @@ def transcribe_with_whisper(audio_path, settings):
         log_message(f"Whisper transcription failed: {str(e)}")
         return None
 
-def translate_with_ollama(text, settings):
-    """Translate text using Ollama API"""
-    api_url = settings.get('ollama_api_url', 'http://localhost:11434/api/generate')
+def get_ollama_endpoints(settings):
+    """Return the list of Ollama generate endpoints chunks can be dispatched to"""
+    endpoints = [settings.get('ollama_api_url', 'http://localhost:11434/api/generate')]
+    
+    # نقاط إضافية مفصولة بفواصل لتوزيع المقاطع على أكثر من خادم
+    for url in (settings.get('ollama_api_urls') or '').split(','):
+        url = url.strip()
+        if url and url not in endpoints:
+            endpoints.append(url)
+    return endpoints
+
+def get_ollama_concurrency(settings):
+    """Number of chunks sent to Ollama at the same time"""
+    try:
+        return max(1, int(settings.get('ollama_concurrency', 4)))
+    except (TypeError, ValueError):
+        return 4
+
+def translate_with_ollama(text, settings, api_url=None, context=None, on_progress=None):
+    """Translate text using the Ollama streaming API
+
+    Generation stops as soon as every input line has been returned, or when
+    the output runs past a ceiling derived from the input size.
+    """
+    api_url = api_url or settings.get('ollama_api_url', 'http://localhost:11434/api/generate')
     model = settings.get('ollama_model', 'llama3')
     gpu_id = settings.get('ollama_gpu_id', 'auto')
     
@@ -201,46 +258,104 @@ def translate_with_ollama(text, settings):
         except ValueError:
             log_message(f"Invalid GPU ID: {gpu_id}, using auto selection")
     
-    prompt = f"""Please translate the following English subtitle text to Arabic. Keep the timing format intact and translate only the text content:
+    context_section = ""
+    if context:
+        context_section = f"""Previous lines, for context only (do not translate or repeat them):
+
+{context}
+
+"""
+    
+    prompt = f"""{context_section}Translate the following English subtitle lines to Arabic. Each line starts with an ID in square brackets:
 
 {text}
 
 Important instructions:
-- Maintain all SRT formatting (timestamps, line numbers)
-- Translate only the dialogue text, not the timestamps
-- Keep the same structure and line breaks
+- Return exactly one line per input line, starting with the same [ID]
+- Translate only the text after the ID
+- Keep {LINE_BREAK_MARKER} markers where they appear, they are line breaks inside one subtitle
+- Do not merge, split, skip or add lines, and do not add any explanation
 - Use natural, fluent Arabic
 - For proper nouns (names, places), use appropriate Arabic transliteration"""
 
+    # Size the context explicitly; Ollama otherwise truncates to its small default window
+    num_ctx = get_context_window(model, settings.get('ollama_context_tokens'))
+    
+    # Runaway generations (repeating lines, commentary) are cut at a multiple of the expected output
+    expected_ids = {int(m.group(1)) for m in (PROMPT_LINE_RE.match(line) for line in text.split('\n')) if m}
+    expected_tokens = int(estimate_tokens(text) * OUTPUT_EXPANSION)
+    token_ceiling = min(max(256, num_ctx - estimate_tokens(prompt)), expected_tokens * RUNAWAY_TOKEN_FACTOR + 128)
+    
     payload = {
         "model": model,
         "prompt": prompt,
-        "stream": False,
         "options": {
             "temperature": 0.3,
             "top_p": 0.9,
-            "max_tokens": 4000
+            "num_ctx": num_ctx,
+            "num_predict": token_ceiling
         }
     }
     
+    def report(partial, tokens):
+        if on_progress:
+            on_progress(len(completed_prompt_ids(partial) & expected_ids), len(expected_ids))
+    
+    def all_lines_returned(partial):
+        return bool(expected_ids) and expected_ids <= completed_prompt_ids(partial)
+    
     try:
-        response = requests.post(api_url, json=payload, timeout=300)
-        response.raise_for_status()
-        
-        result = response.json()
-        if 'response' in result:
-            return result['response'].strip()
-        else:
-            raise Exception("No response field in Ollama API result")
-            
-    except requests.exceptions.Timeout:
-        raise Exception("Ollama API request timed out")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Ollama API request failed: {str(e)}")
-    except Exception as e:
-        raise Exception(f"Ollama translation error: {str(e)}")
+        result = generate_stream(api_url, payload, timeout=300, max_tokens=token_ceiling,
+                                 on_token=report, should_stop=all_lines_returned)
+    except OllamaStreamError as e:
+        raise Exception(str(e))
+    
+    if result['stopped'] == 'token_limit':
+        log_message(f"Ollama output exceeded {token_ceiling} tokens, generation aborted")
+    if not result['response'].strip():
+        raise Exception("Empty response from Ollama API")
+    
+    report(result['response'] + '\n', result['tokens'])
+    return result['response'].strip()
+
+def translate_chunks(chunks, settings, contexts=None, progress_callback=None):
+    """Translate chunks with a bounded worker pool spread across the Ollama endpoints
 
-def process_srt_file(srt_path, settings):
+    progress_callback(lines_done, lines_total) is called as translated lines
+    stream in from any of the chunks.
+    """
+    endpoints = get_ollama_endpoints(settings)
+    concurrency = min(get_ollama_concurrency(settings), len(chunks)) or 1
+    contexts = contexts or [None] * len(chunks)
+    
+    lines_done = [0] * len(chunks)
+    lines_total = sum(len([l for l in chunk.split('\n') if l.strip()]) for chunk in chunks)
+    progress_lock = threading.Lock()
+    
+    def chunk_progress(i):
+        def update(done, total):
+            with progress_lock:
+                lines_done[i] = done
+                completed = sum(lines_done)
+            if progress_callback:
+                progress_callback(completed, lines_total)
+        return update
+    
+    def translate_chunk(i):
+        log_message(f"Translating chunk {i+1}/{len(chunks)}...")
+        try:
+            return translate_with_ollama(chunks[i], settings, api_url=endpoints[i % len(endpoints)],
+                                         context=contexts[i], on_progress=chunk_progress(i))
+        except Exception as e:
+            log_message(f"Failed to translate chunk {i+1}: {str(e)}")
+            # Use original chunk if translation fails
+            return chunks[i]
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # map() يعيد النتائج بترتيب المقاطع الأصلي مهما كان ترتيب اكتمالها
+        return list(executor.map(translate_chunk, range(len(chunks))))
+
+def process_srt_file(srt_path, settings, progress_callback=None):
     """Process SRT file and translate it to Arabic"""
     log_message("Starting SRT translation with Ollama...")
     
@@ -262,54 +377,120 @@ def process_srt_file(srt_path, settings):
     if not original_content.strip():
         raise Exception("SRT file is empty")
     
-    # Split content into chunks if it's too long
-    max_chunk_size = 2000  # Characters
-    chunks = []
+    cues = parse_srt(original_content)
+    if not cues:
+        raise Exception("SRT file contains no valid subtitle cues")
     
-    if len(original_content) <= max_chunk_size:
-        chunks = [original_content]
-    else:
-        # Split by subtitle blocks
-        blocks = original_content.split('\n\n')
-        current_chunk = ""
-        
-        for block in blocks:
-            if len(current_chunk + block) <= max_chunk_size:
-                current_chunk += block + '\n\n'
+    # Consult the translation memory before any LLM call
+    memory = TranslationMemoryStore.from_settings(settings)
+    cached = memory.lookup([cue.text for cue in cues]) if memory else {}
+    pending = [cue for cue in cues if cue.text.strip() and cue.text not in cached]
+    if memory:
+        log_message(f"Translation memory: {len(cues) - len(pending)} cached, {len(pending)} to translate")
+    
+    # Pack pending cues into chunks sized for the model's context window
+    context_window = get_context_window(settings.get('ollama_model', 'llama3'), settings.get('ollama_context_tokens'))
+    try:
+        fill_ratio = min(0.95, max(0.1, float(settings.get('chunk_fill_ratio', 0.75))))
+        overlap = max(0, int(settings.get('chunk_context_cues', 2)))
+    except (TypeError, ValueError):
+        fill_ratio, overlap = 0.75, 2
+    
+    packed = chunk_cues(pending, context_window, fill_ratio, overlap)
+    chunks = [chunk for chunk, _ in packed]
+    log_message(f"Packed {len(pending)} cues into {len(chunks)} chunks ({context_window} token context)")
+    
+    # Translate chunks concurrently, keeping the original order; only the cue text with its ID is sent
+    translated_chunks = translate_chunks(
+        ['\n'.join(cue_to_prompt_line(cue) for cue in chunk) for chunk in chunks],
+        settings,
+        contexts=['\n'.join(cue_to_prompt_line(cue) for cue in context) for _, context in packed],
+        progress_callback=progress_callback
+    )
+    
+    translations = {}
+    for chunk, translated_chunk in zip(chunks, translated_chunks):
+        returned = parse_prompt_lines(translated_chunk)
+        missing = 0
+        for cue in chunk:
+            if returned.get(cue.id):
+                translations[cue.id] = returned[cue.id]
             else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = block + '\n\n'
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+                missing += 1
+        if missing:
+            log_message(f"Model skipped {missing} of {len(chunk)} lines, keeping the original text for them")
     
-    # Translate each chunk
-    translated_chunks = []
-    for i, chunk in enumerate(chunks):
-        log_message(f"Translating chunk {i+1}/{len(chunks)}...")
-        try:
-            translated_chunk = translate_with_ollama(chunk, settings)
-            translated_chunks.append(translated_chunk)
-        except Exception as e:
-            log_message(f"Failed to translate chunk {i+1}: {str(e)}")
-            # Use original chunk if translation fails
-            translated_chunks.append(chunk)
+    if memory and translations:
+        memory.store([(cue.text, translations[cue.id]) for cue in pending if cue.id in translations])
     
-    # Combine translated chunks
-    final_translation = '\n\n'.join(translated_chunks)
+    # Rebuild the SRT with the original timings
+    for cue in cues:
+        if cue.id in translations:
+            cue.text = translations[cue.id]
+        elif cue.text in cached:
+            cue.text = cached[cue.text]
     
-    return final_translation
+    return serialize_srt(cues)
 
-def main(video_path):
-    """Main processing function"""
-    if not os.path.exists(video_path):
-        log_message(f"Error: Video file does not exist: {video_path}")
-        return False
+def get_arabic_srt_path(video_path):
+    """Return the path of the Arabic subtitle file for a video"""
+    return f"{os.path.splitext(video_path)[0]}.ar.srt"
+
+def prepare_subtitles(video_path, settings, work_dir):
+    """Stages 1-2: extract audio and transcribe it; returns the English SRT path or None"""
+    audio_path = os.path.join(work_dir, "audio.wav")
     
-    log_message(f"Starting processing of: {os.path.basename(video_path)}")
+    # Step 1: Extract audio
+    if not extract_audio(video_path, audio_path):
+        log_message("Failed to extract audio")
+        return None
     
-    # Get settings
+    # Step 2: Transcribe with Whisper
+    srt_path = transcribe_with_whisper(audio_path, settings)
+    if not srt_path:
+        log_message("Failed to transcribe audio")
+        return None
+    
+    # الملف الصوتي لم يعد مطلوباً، حذفه يقلل استهلاك القرص أثناء انتظار مرحلة الترجمة
+    try:
+        os.remove(audio_path)
+    except OSError:
+        pass
+    
+    return srt_path
+
+def translate_subtitles(video_path, srt_path, settings, progress_callback=None, record_status=True):
+    """Stage 3: translate an English SRT to Arabic and save it next to the video
+
+    With record_status=False the caller updates the database itself (the
+    batch pipeline does it on the task's main thread as results arrive).
+    """
+    arabic_srt_path = get_arabic_srt_path(video_path)
+    
+    try:
+        arabic_content = process_srt_file(srt_path, settings, progress_callback)
+        
+        # Save Arabic subtitle
+        with open(arabic_srt_path, 'w', encoding='utf-8') as f:
+            f.write(arabic_content)
+        
+        log_message(f"Successfully created Arabic subtitle: {os.path.basename(arabic_srt_path)}")
+        
+        # Update translation status in database
+        if record_status:
+            update_translation_status(video_path, translated=True)
+        
+        return True
+        
+    except Exception as e:
+        log_message(f"Failed to translate subtitles: {str(e)}")
+        # Update status to indicate failure
+        if record_status:
+            update_translation_status(video_path, translated=False)
+        return False
+
+def load_settings():
+    """Load settings, falling back to defaults when the database is unavailable"""
     settings = get_settings()
     if not settings:
         log_message("Warning: Could not load settings, using defaults")
@@ -318,50 +499,33 @@ def main(video_path):
             'ollama_api_url': 'http://localhost:11434/api/generate',
             'ollama_model': 'llama3'
         }
+    configure_http_pool(settings)
+    return settings
+
+def main(video_path, progress_callback=None):
+    """Main processing function"""
+    if not os.path.exists(video_path):
+        log_message(f"Error: Video file does not exist: {video_path}")
+        return False
     
-    # Check if Arabic subtitle already exists
-    base_path = os.path.splitext(video_path)[0]
-    arabic_srt_path = f"{base_path}.ar.srt"
+    log_message(f"Starting processing of: {os.path.basename(video_path)}")
+    
+    # Get settings
+    settings = load_settings()
     
-    if os.path.exists(arabic_srt_path):
+    # Check if Arabic subtitle already exists
+    if os.path.exists(get_arabic_srt_path(video_path)):
         log_message("Arabic subtitle already exists, skipping...")
         return True
     
     # Create temporary directory for processing
     with tempfile.TemporaryDirectory() as temp_dir:
-        audio_path = os.path.join(temp_dir, "audio.wav")
-        
-        # Step 1: Extract audio
-        if not extract_audio(video_path, audio_path):
-            log_message("Failed to extract audio")
-            return False
-        
-        # Step 2: Transcribe with Whisper
-        srt_path = transcribe_with_whisper(audio_path, settings)
+        srt_path = prepare_subtitles(video_path, settings, temp_dir)
         if not srt_path:
-            log_message("Failed to transcribe audio")
             return False
         
         # Step 3: Translate SRT to Arabic
-        try:
-            arabic_content = process_srt_file(srt_path, settings)
-            
-            # Save Arabic subtitle
-            with open(arabic_srt_path, 'w', encoding='utf-8') as f:
-                f.write(arabic_content)
-            
-            log_message(f"Successfully created Arabic subtitle: {os.path.basename(arabic_srt_path)}")
-            
-            # Update translation status in database
-            update_translation_status(video_path, translated=True)
-            
-            return True
-            
-        except Exception as e:
-            log_message(f"Failed to translate subtitles: {str(e)}")
-            # Update status to indicate failure
-            update_translation_status(video_path, translated=False)
-            return False
+        return translate_subtitles(video_path, srt_path, settings, progress_callback)
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
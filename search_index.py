@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Search Index - Ranked full-text search over media titles and paths
+فهرس البحث - بحث نصي كامل مرتب حسب الصلة في العناوين والمسارات
+
+SQLite uses an FTS5 table kept in sync by triggers, PostgreSQL a GIN index on
+a weighted tsvector (plus pg_trgm for fuzzy title matches). Both are created
+by migration 0002. Every search term is a prefix, so results narrow while the
+operator types. Without either backend, search falls back to LIKE.
+"""
+
+import re
+import logging
+import threading
+from typing import List, Optional
+
+from sqlalchemy import or_, text
+
+from models import db, MediaFile
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'media_files_fts'
+
+# نقاط وشرطات أسماء الملفات تتحول لمسافات، وإلا اعتبرها محلل PostgreSQL اسم ملف أو مضيف واحد
+PG_SEARCH_VECTOR = (
+    "(setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', translate(coalesce(path, ''), '/._-[]()', '         ')), 'B'))"
+)
+
+SEARCH_RESULT_LIMIT = 500
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend() -> str:
+    """'fts5' أو 'postgres' أو 'postgres_trgm' أو 'like' حسب ما أنشأته الترحيلات"""
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            return _backend
+
+        backend = 'like'
+        try:
+            dialect = db.engine.dialect.name
+            if dialect == 'sqlite':
+                found = db.session.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+                ).first()
+                backend = 'fts5' if found else 'like'
+            elif dialect == 'postgresql':
+                found = db.session.execute(
+                    text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_media_files_search'")
+                ).first()
+                trgm = db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+                if found:
+                    backend = 'postgres_trgm' if trgm else 'postgres'
+        except Exception as e:
+            logger.warning(f"Could not detect search backend, using LIKE: {e}")
+
+        _backend = backend
+        return backend
+
+
+def search_tokens(search: str) -> List[str]:
+    return [token.lower() for token in _TOKEN_RE.findall(search or '')]
+
+
+def ranked_ids(search: str, limit: int = SEARCH_RESULT_LIMIT) -> Optional[List[int]]:
+    """معرّفات الملفات المطابقة مرتبة حسب الصلة، أو None إذا لم يتوفر فهرس بحث"""
+    tokens = search_tokens(search)
+    backend = get_search_backend()
+    if backend == 'like':
+        return None
+    if not tokens:
+        return []
+
+    if backend == 'fts5':
+        # كل كلمة بادئة، والعنوان أثقل وزناً من المسار
+        match = ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+        rows = db.session.execute(
+            text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+                 f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT :limit"),
+            {'match': match, 'limit': limit}
+        )
+        return [row[0] for row in rows]
+
+    tsquery = ' & '.join(f"{token}:*" for token in tokens)
+    rows = db.session.execute(
+        text(f"SELECT id FROM media_files WHERE {PG_SEARCH_VECTOR} @@ to_tsquery('simple', :query) "
+             f"ORDER BY ts_rank({PG_SEARCH_VECTOR}, to_tsquery('simple', :query)) DESC, id LIMIT :limit"),
+        {'query': tsquery, 'limit': limit}
+    ).fetchall()
+
+    # لا تطابق دقيق: بحث تقريبي بالمقاطع الثلاثية يتحمل الأخطاء الإملائية
+    if not rows and backend == 'postgres_trgm':
+        rows = db.session.execute(
+            text("SELECT id FROM media_files WHERE title % :search OR path ILIKE :pattern "
+                 "ORDER BY similarity(coalesce(title, ''), :search) DESC, id LIMIT :limit"),
+            {'search': search, 'pattern': f"%{search}%", 'limit': limit}
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def like_filter(search: str):
+    """الفلتر البديل عند غياب الفهرس: LIKE على العنوان والمسار"""
+    pattern = f"%{search}%"
+    return or_(MediaFile.title.ilike(pattern), MediaFile.path.ilike(pattern))
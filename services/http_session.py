@@ -0,0 +1,97 @@
+"""
+Pooled HTTP Sessions for AI Translator
+جلسات HTTP مشتركة للترجمان الآلي
+
+One requests.Session per host (scheme://host:port) with keep-alive, a bounded
+connection pool, retry with exponential backoff and gzip. Every Ollama and
+media-service client goes through get_session() so repeated calls to the same
+server reuse their TCP (and TLS) connections.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+_config = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'max_retries': DEFAULT_MAX_RETRIES,
+    'backoff': DEFAULT_BACKOFF,
+}
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _build_session() -> requests.Session:
+    # طلبات POST لا تُعاد إلا عند فشل الاتصال، لأن allowed_methods يستثنيها من إعادة القراءة
+    retry = Retry(
+        total=_config['max_retries'],
+        backoff_factor=_config['backoff'],
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_config['pool_size'], max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """الحصول على الجلسة المشتركة للخادم الذي يستضيف هذا الرابط"""
+    key = _host_key(url)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _build_session()
+            _sessions[key] = session
+        return session
+
+
+def configure_http_pool(settings: Optional[Dict[str, str]] = None):
+    """تطبيق إعدادات http_pool_size و http_max_retries و http_retry_backoff"""
+    settings = settings or {}
+    try:
+        new_config = {
+            'pool_size': max(1, int(settings.get('http_pool_size') or DEFAULT_POOL_SIZE)),
+            'max_retries': max(0, int(settings.get('http_max_retries') or DEFAULT_MAX_RETRIES)),
+            'backoff': max(0.0, float(settings.get('http_retry_backoff') or DEFAULT_BACKOFF)),
+        }
+    except (TypeError, ValueError):
+        logger.warning("Invalid HTTP pool settings, keeping current configuration")
+        return
+
+    with _lock:
+        if new_config == _config:
+            return
+        _config.update(new_config)
+        # الجلسات القديمة تُغلق لتُبنى من جديد بالإعدادات الحالية
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def close_all_sessions():
+    """إغلاق كل الاتصالات المفتوحة"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -8,6 +8,8 @@ import logging
 from typing import Dict, List, Optional, Any
 import json
 
+from .http_session import get_session
+
 logger = logging.getLogger(__name__)
 
 class MediaServicesManager:
@@ -42,13 +44,14 @@ class PlexMediaServer:
     
     def __init__(self, url: str, token: str):
         self.url = url.rstrip('/')
+        self.session = get_session(self.url)
         self.token = token
         self.headers = {'X-Plex-Token': token}
     
     def test_connection(self) -> bool:
         """Test Plex server connection"""
         try:
-            response = requests.get(f"{self.url}/status/sessions", 
+            response = self.session.get(f"{self.url}/status/sessions", 
                                   headers=self.headers, timeout=10)
             return response.status_code == 200
         except Exception as e:
@@ -58,7 +61,7 @@ class PlexMediaServer:
     def get_libraries(self) -> List[Dict]:
         """Get Plex libraries"""
         try:
-            response = requests.get(f"{self.url}/library/sections", 
+            response = self.session.get(f"{self.url}/library/sections", 
                                   headers=self.headers, timeout=10)
             if response.status_code == 200:
                 return response.json().get('MediaContainer', {}).get('Directory', [])
@@ -72,13 +75,14 @@ class JellyfinServer:
     
     def __init__(self, url: str, api_key: str):
         self.url = url.rstrip('/')
+        self.session = get_session(self.url)
         self.api_key = api_key
         self.headers = {'X-Emby-Authorization': f'MediaBrowser Token={api_key}'}
     
     def test_connection(self) -> bool:
         """Test Jellyfin server connection"""
         try:
-            response = requests.get(f"{self.url}/System/Info", 
+            response = self.session.get(f"{self.url}/System/Info", 
                                   headers=self.headers, timeout=10)
             return response.status_code == 200
         except Exception as e:
@@ -88,7 +92,7 @@ class JellyfinServer:
     def get_libraries(self) -> List[Dict]:
         """Get Jellyfin libraries"""
         try:
-            response = requests.get(f"{self.url}/Library/VirtualFolders", 
+            response = self.session.get(f"{self.url}/Library/VirtualFolders", 
                                   headers=self.headers, timeout=10)
             if response.status_code == 200:
                 return response.json()
@@ -102,13 +106,14 @@ class RadarrAPI:
     
     def __init__(self, url: str, api_key: str):
         self.url = url.rstrip('/')
+        self.session = get_session(self.url)
         self.api_key = api_key
         self.headers = {'X-Api-Key': api_key}
     
     def test_connection(self) -> bool:
         """Test Radarr connection"""
         try:
-            response = requests.get(f"{self.url}/api/v3/system/status", 
+            response = self.session.get(f"{self.url}/api/v3/system/status", 
                                   headers=self.headers, timeout=10)
             return response.status_code == 200
         except Exception as e:
@@ -118,7 +123,7 @@ class RadarrAPI:
     def get_movies(self) -> List[Dict]:
         """Get movies from Radarr"""
         try:
-            response = requests.get(f"{self.url}/api/v3/movie", 
+            response = self.session.get(f"{self.url}/api/v3/movie", 
                                   headers=self.headers, timeout=30)
             if response.status_code == 200:
                 return response.json()
@@ -130,7 +135,7 @@ class RadarrAPI:
     def get_quality_profiles(self) -> List[Dict]:
         """Get quality profiles from Radarr"""
         try:
-            response = requests.get(f"{self.url}/api/v3/qualityprofile", 
+            response = self.session.get(f"{self.url}/api/v3/qualityprofile", 
                                   headers=self.headers, timeout=10)
             
             # تحقق من نوع المحتوى المُستلم
@@ -175,13 +180,14 @@ class SonarrAPI:
     
     def __init__(self, url: str, api_key: str):
         self.url = url.rstrip('/')
+        self.session = get_session(self.url)
         self.api_key = api_key
         self.headers = {'X-Api-Key': api_key}
     
     def test_connection(self) -> bool:
         """Test Sonarr connection"""
         try:
-            response = requests.get(f"{self.url}/api/v3/system/status", 
+            response = self.session.get(f"{self.url}/api/v3/system/status", 
                                   headers=self.headers, timeout=10)
             return response.status_code == 200
         except Exception as e:
@@ -191,7 +197,7 @@ class SonarrAPI:
     def get_series(self) -> List[Dict]:
         """Get TV series from Sonarr"""
         try:
-            response = requests.get(f"{self.url}/api/v3/series", 
+            response = self.session.get(f"{self.url}/api/v3/series", 
                                   headers=self.headers, timeout=30)
             if response.status_code == 200:
                 return response.json()
@@ -203,7 +209,7 @@ class SonarrAPI:
     def get_quality_profiles(self) -> List[Dict]:
         """Get quality profiles from Sonarr"""
         try:
-            response = requests.get(f"{self.url}/api/v3/qualityprofile", 
+            response = self.session.get(f"{self.url}/api/v3/qualityprofile", 
                                   headers=self.headers, timeout=10)
             
             # تحقق من نوع المحتوى المُستلم
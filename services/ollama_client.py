@@ -0,0 +1,108 @@
+"""
+Ollama Streaming Client for AI Translator
+عميل Ollama بنمط البث للترجمان الآلي
+
+Consumes the NDJSON stream of /api/generate so callers can report progress
+while tokens arrive and stop a generation as soon as it has produced what
+was asked for, or when it runs past a token ceiling. Closing the HTTP
+response makes Ollama cancel the generation on the server side.
+"""
+
+import json
+import time
+import logging
+import requests
+from typing import Callable, Dict, Any, Optional
+
+from .http_session import get_session
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaStreamError(Exception):
+    """خطأ أثناء بث الرد من Ollama"""
+
+
+def generate_stream(api_url: str, payload: Dict[str, Any], timeout: int = 300,
+                    max_tokens: Optional[int] = None,
+                    on_token: Optional[Callable[[str, int], None]] = None,
+                    should_stop: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+    """بث رد /api/generate وإرجاع النص الكامل مع سبب التوقف
+
+    `timeout` bounds the whole generation, not just the gap between tokens.
+    on_token and should_stop are called each time a line is completed.
+    Returns {'response', 'tokens', 'done', 'stopped'} where `stopped` is
+    None, 'complete' (should_stop returned True) or 'token_limit'. After an
+    early 'complete' stop the response ends at the last completed line.
+    """
+    payload = dict(payload, stream=True)
+    deadline = time.monotonic() + timeout
+    parts = []
+    tokens = 0
+    stopped = None
+    done = False
+
+    try:
+        response = get_session(api_url).post(api_url, json=payload, stream=True, timeout=(10, timeout))
+    except requests.exceptions.Timeout:
+        raise OllamaStreamError("Ollama API request timed out")
+    except requests.exceptions.RequestException as e:
+        raise OllamaStreamError(f"Ollama API request failed: {str(e)}")
+
+    try:
+        response.raise_for_status()
+
+        for line in response.iter_lines():
+            if not line:
+                continue
+            if time.monotonic() > deadline:
+                raise OllamaStreamError("Ollama API request timed out")
+
+            try:
+                chunk = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring malformed Ollama stream line: {line[:200]!r}")
+                continue
+
+            if chunk.get('error'):
+                raise OllamaStreamError(f"Ollama error: {chunk['error']}")
+
+            piece = chunk.get('response', '')
+            if piece:
+                parts.append(piece)
+                tokens += 1
+
+            if chunk.get('done'):
+                done = True
+                break
+
+            # التقدم وشرط التوقف لا يتغيران إلا عند اكتمال سطر
+            if '\n' in piece and (on_token or should_stop):
+                text = ''.join(parts)
+                if on_token:
+                    on_token(text, tokens)
+                if should_stop and should_stop(text):
+                    stopped = 'complete'
+                    break
+            if max_tokens and tokens >= max_tokens:
+                stopped = 'token_limit'
+                logger.warning(f"Ollama generation aborted after {tokens} tokens (ceiling reached)")
+                break
+
+    except requests.exceptions.RequestException as e:
+        raise OllamaStreamError(f"Ollama API request failed: {str(e)}")
+    finally:
+        # إغلاق الاتصال يوقف التوليد على خادم Ollama عند الإيقاف المبكر
+        response.close()
+
+    text = ''.join(parts)
+    if stopped == 'complete':
+        # ما بعد آخر سطر مكتمل بداية سطر زائد، ولو بقي لالتصق بآخر ترجمة
+        text = text[:text.rfind('\n') + 1]
+
+    return {
+        'response': text,
+        'tokens': tokens,
+        'done': done,
+        'stopped': stopped,
+    }
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Subtitle Index - Directory listings for sidecar subtitle lookups
+فهرس الترجمات - قراءة كل مجلد مرة واحدة بدلاً من فحص كل ملف على حدة
+
+On SMB/NFS/SSHFS mounts every os.path.exists() is a network round-trip. The
+index lists each media directory once with os.scandir() and answers existence
+and "base*.srt" questions from memory, so a scan over a whole library costs one
+read per directory instead of several stats per file. An index describes the
+directories at the time they were listed; tasks create one per run.
+"""
+
+import os
+import bisect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SUBTITLE_EXTENSIONS = ('.srt', '.ass', '.ssa', '.vtt', '.sub')
+DEFAULT_PRELOAD_WORKERS = 8
+
+
+class _Listing:
+    """محتوى مجلد واحد: كل الأسماء، وأسماء الترجمات مرتبة للبحث بالبادئة"""
+
+    __slots__ = ('names', 'subtitles')
+
+    def __init__(self, names: Set[str]):
+        self.names = names
+        self.subtitles = sorted(n for n in names if n.lower().endswith(SUBTITLE_EXTENSIONS))
+
+    def add(self, name: str):
+        if name in self.names:
+            return
+        self.names.add(name)
+        if name.lower().endswith(SUBTITLE_EXTENSIONS):
+            bisect.insort(self.subtitles, name)
+
+    def discard(self, name: str):
+        if name not in self.names:
+            return
+        self.names.discard(name)
+        i = bisect.bisect_left(self.subtitles, name)
+        if i < len(self.subtitles) and self.subtitles[i] == name:
+            del self.subtitles[i]
+
+
+class SubtitleIndex:
+    """فهرس مجلدات الوسائط؛ يُقرأ كل مجلد عند أول سؤال عنه"""
+
+    def __init__(self):
+        # None = تعذر قراءة المجلد (صلاحيات)، فيُستخدم os.path.exists كبديل
+        self._listings: Dict[str, Optional[_Listing]] = {}
+        self._lock = threading.Lock()
+        self.directories_read = 0
+
+    def _read_directory(self, directory: str) -> Optional[_Listing]:
+        try:
+            with os.scandir(directory) as entries:
+                names = {entry.name for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            names = set()
+        except OSError as e:
+            logger.warning(f"Could not list {directory}, falling back to per-file checks: {e}")
+            return None
+        return _Listing(names)
+
+    def _listing(self, directory: str) -> Optional[_Listing]:
+        directory = os.path.normpath(directory)
+        with self._lock:
+            if directory in self._listings:
+                return self._listings[directory]
+        listing = self._read_directory(directory)
+        with self._lock:
+            self.directories_read += 1
+            return self._listings.setdefault(directory, listing)
+
+    def load(self, directory: str):
+        """قراءة مجلد واحد الآن إذا لم يكن مقروءاً"""
+        self._listing(directory)
+
+    def preload(self, paths: Iterable[str], max_workers: int = DEFAULT_PRELOAD_WORKERS) -> int:
+        """قراءة مجلدات كل المسارات مسبقاً وبالتوازي؛ يعيد عدد المجلدات الجديدة"""
+        with self._lock:
+            directories = {os.path.normpath(os.path.dirname(p)) for p in paths if p} - set(self._listings)
+        if not directories:
+            return 0
+        if max_workers <= 1 or len(directories) == 1:
+            for directory in directories:
+                self.load(directory)
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(directories))) as executor:
+                list(executor.map(self.load, directories))
+        return len(directories)
+
+    def exists(self, path: str) -> bool:
+        listing = self._listing(os.path.dirname(path))
+        if listing is None:
+            return os.path.exists(path)
+        return os.path.basename(path) in listing.names
+
+    def sidecars(self, video_path: str, suffix: str = '.srt') -> List[str]:
+        """ما يطابق glob("<base>*<suffix>") بجانب الفيديو، مرتباً"""
+        directory = os.path.dirname(video_path)
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        listing = self._listing(directory)
+        if listing is None:
+            import glob
+            return sorted(glob.glob(os.path.join(glob.escape(directory), glob.escape(stem) + '*' + suffix)))
+
+        names = listing.subtitles if suffix.lower().endswith(SUBTITLE_EXTENSIONS) else sorted(listing.names)
+        matches = []
+        for i in range(bisect.bisect_left(names, stem), len(names)):
+            name = names[i]
+            if not name.startswith(stem):
+                break
+            if name.endswith(suffix) and len(name) >= len(stem) + len(suffix):
+                matches.append(os.path.join(directory, name))
+        return matches
+
+    def languages(self, video_path: str, suffix: str = '.srt') -> Dict[str, str]:
+        """{'ar': ..., 'en.hi': ..., '': <الترجمة العامة base.srt>} للترجمات المطابقة للاسم تماماً"""
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        result = {}
+        for path in self.sidecars(video_path, suffix):
+            middle = os.path.basename(path)[len(stem):-len(suffix)]
+            if middle == '':
+                result[''] = path
+            elif middle.startswith('.'):
+                result[middle[1:]] = path
+        return result
+
+    def has_subtitle(self, video_path: str, language: str = 'ar', suffix: str = '.srt') -> bool:
+        base = os.path.splitext(video_path)[0]
+        return self.exists(f"{base}.{language}{suffix}" if language else f"{base}{suffix}")
+
+    def add(self, path: str):
+        """تسجيل ملف أنشأته المهمة نفسها دون إعادة قراءة المجلد"""
+        listing = self._listing(os.path.dirname(path))
+        if listing is not None:
+            with self._lock:
+                listing.add(os.path.basename(path))
+
+    def discard(self, path: str):
+        listing = self._listing(os.path.dirname(path))
+        if listing is not None:
+            with self._lock:
+                listing.discard(os.path.basename(path))
+
+    def record_rename(self, source: str, target: str):
+        self.discard(source)
+        self.add(target)
+
+    def invalidate(self, directory: Optional[str] = None):
+        """نسيان مجلد واحد (أو كل المجلدات) لتُقرأ من جديد عند السؤال التالي"""
+        with self._lock:
+            if directory is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.normpath(directory), None)
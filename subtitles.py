@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Subtitles - SRT parsing and serialization
+الترجمات - تحليل ملفات SRT وإعادة بنائها
+
+Only cue text is ever sent to the LLM. Indexes and timestamps stay in the
+Cue objects and the SRT is rebuilt deterministically afterwards, so a model
+can no longer corrupt the timing lines.
+"""
+
+import re
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TIMING_RE = re.compile(
+    r'(\d{1,2}):(\d{2}):(\d{2})[,.](\d{1,3})\s*-->\s*(\d{1,2}):(\d{2}):(\d{2})[,.](\d{1,3})'
+)
+PROMPT_LINE_RE = re.compile(r'^\s*\[(\d+)\]\s?(.*)$')
+
+# فاصل الأسطر داخل الترجمة الواحدة عند إرسالها كسطر واحد للنموذج
+LINE_BREAK_MARKER = '<br>'
+
+# نوافذ السياق (بالرموز) لعائلات النماذج الشائعة على Ollama، الأطول تطابقاً أولاً
+MODEL_CONTEXT_WINDOWS = [
+    ('llama3.1', 131072), ('llama3.2', 131072), ('llama3.3', 131072), ('llama3', 8192),
+    ('llama2', 4096), ('codellama', 16384), ('mistral-nemo', 131072), ('mistral', 32768),
+    ('mixtral', 32768), ('qwen2.5', 32768), ('qwen2', 32768), ('gemma2', 8192), ('gemma', 8192),
+    ('phi3', 4096), ('aya', 8192), ('command-r', 131072),
+]
+DEFAULT_CONTEXT_WINDOW = 4096
+# النوافذ الكبيرة جداً تستهلك ذاكرة GPU دون فائدة لمقاطع الترجمة
+MAX_AUTO_CONTEXT_WINDOW = 8192
+
+# تقديرات تقريبية: ~4 أحرف إنجليزية لكل رمز، والنص العربي الناتج يحتاج رموزاً أكثر
+CHARS_PER_TOKEN = 4.0
+LINE_OVERHEAD_TOKENS = 4
+OUTPUT_EXPANSION = 1.5
+PROMPT_OVERHEAD_TOKENS = 200
+
+
+class Cue:
+    """ترجمة واحدة: رقم ثابت، بداية ونهاية بالميلي ثانية، والنص"""
+
+    __slots__ = ('id', 'start', 'end', 'text')
+
+    def __init__(self, id: int, start: int, end: int, text: str):
+        self.id = id
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"Cue({self.id}, {format_timestamp(self.start)} --> {format_timestamp(self.end)}, {self.text!r})"
+
+
+def _to_millis(hours: str, minutes: str, seconds: str, millis: str) -> int:
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis.ljust(3, '0'))
+
+
+def format_timestamp(millis: int) -> str:
+    """تحويل الميلي ثانية إلى تنسيق SRT"""
+    hours, millis = divmod(max(0, int(millis)), 3600000)
+    minutes, millis = divmod(millis, 60000)
+    seconds, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+
+
+def parse_srt(content: str) -> List[Cue]:
+    """تحليل محتوى SRT إلى قائمة Cue؛ الكتل بدون سطر توقيت صالح تُتجاهل"""
+    content = content.lstrip('\ufeff').replace('\r\n', '\n').replace('\r', '\n')
+    cues = []
+
+    for block in re.split(r'\n\s*\n', content.strip()):
+        lines = block.split('\n')
+        for i, line in enumerate(lines):
+            match = TIMING_RE.search(line)
+            if match:
+                g = match.groups()
+                text = '\n'.join(l.strip() for l in lines[i + 1:] if l.strip())
+                cues.append(Cue(len(cues) + 1, _to_millis(*g[:4]), _to_millis(*g[4:]), text))
+                break
+
+    return cues
+
+
+def serialize_srt(cues: Iterable[Cue]) -> str:
+    """إعادة بناء ملف SRT بترقيم متسلسل"""
+    blocks = []
+    for index, cue in enumerate(cues, 1):
+        blocks.append(f"{index}\n{format_timestamp(cue.start)} --> {format_timestamp(cue.end)}\n{cue.text}")
+    return '\n\n'.join(blocks) + '\n' if blocks else ''
+
+
+def cue_to_prompt_line(cue: Cue) -> str:
+    """تمثيل الترجمة كسطر واحد بمعرّفها: [12] نص <br> نص"""
+    text = f" {LINE_BREAK_MARKER} ".join(line.strip() for line in cue.text.split('\n'))
+    return f"[{cue.id}] {text}"
+
+
+def parse_prompt_lines(response: str) -> Dict[int, str]:
+    """استخراج {المعرّف: النص} من رد النموذج؛ الأسطر بدون معرّف تُلحق بالسطر السابق"""
+    translations = {}
+    current_id = None
+
+    for line in response.replace('\r\n', '\n').split('\n'):
+        match = PROMPT_LINE_RE.match(line)
+        if match:
+            current_id = int(match.group(1))
+            translations[current_id] = match.group(2).strip()
+        elif current_id is not None and line.strip():
+            translations[current_id] += f" {LINE_BREAK_MARKER} {line.strip()}"
+
+    return {
+        cue_id: '\n'.join(part.strip() for part in text.split(LINE_BREAK_MARKER) if part.strip())
+        for cue_id, text in translations.items()
+    }
+
+
+def completed_prompt_ids(response: str) -> set:
+    """المعرّفات التي اكتمل سطرها في رد جزئي؛ السطر الأخير قد يكون ما زال قيد التوليد"""
+    complete = response[:response.rfind('\n') + 1]
+    return {
+        int(match.group(1))
+        for match in (PROMPT_LINE_RE.match(line) for line in complete.split('\n'))
+        if match
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """تقدير عدد الرموز دون الحاجة لمحلل النموذج"""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def get_context_window(model: str, override: Optional[str] = None) -> int:
+    """نافذة السياق المستخدمة للنموذج: الإعداد الصريح أولاً ثم جدول العائلات المعروفة"""
+    try:
+        if override:
+            return max(512, int(override))
+    except (TypeError, ValueError):
+        pass
+
+    name = (model or '').lower().split('/')[-1]
+    for prefix, window in MODEL_CONTEXT_WINDOWS:
+        if name.startswith(prefix):
+            return min(window, MAX_AUTO_CONTEXT_WINDOW)
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def chunk_cues(cues: List[Cue], context_window: int, fill_ratio: float = 0.75,
+               overlap: int = 0) -> List[Tuple[List[Cue], List[Cue]]]:
+    """تجميع الترجمات بشكل جشع حتى نسبة الامتلاء المطلوبة من نافذة السياق
+
+    Each cue costs its input tokens plus the estimated tokens of its
+    translation. Returns (cues, context_cues) pairs where context_cues are the
+    last `overlap` cues of the previous chunk, sent for continuity only.
+    """
+    budget = int(context_window * fill_ratio) - PROMPT_OVERHEAD_TOKENS
+    chunks = []
+    current, used = [], 0
+    context = []
+    context_cost = 0
+
+    for cue in cues:
+        line_tokens = estimate_tokens(cue_to_prompt_line(cue)) + LINE_OVERHEAD_TOKENS
+        cost = line_tokens + int(math.ceil(line_tokens * OUTPUT_EXPANSION))
+
+        if current and used + cost > budget - context_cost:
+            chunks.append((current, context))
+            context = current[-overlap:] if overlap > 0 else []
+            context_cost = sum(
+                estimate_tokens(cue_to_prompt_line(c)) + LINE_OVERHEAD_TOKENS for c in context
+            )
+            current, used = [], 0
+
+        current.append(cue)
+        used += cost
+
+    if current:
+        chunks.append((current, context))
+    return chunks
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Task Registry - PID files with heartbeats for running background tasks
+سجل المهام - ملف لكل مهمة قيد التشغيل مع نبض دوري بدلاً من فحص كل عمليات النظام
+
+Every background_tasks.py process writes run/tasks/<pid>.json when it starts,
+touches it every few seconds and removes it at exit. Checking whether a task
+is running reads that small directory instead of walking every process on
+the host. An entry whose process is gone or whose heartbeat stopped (killed
+with SIGKILL, or the PID reused by something else) is stale and is removed
+the next time the registry is read.
+"""
+
+import os
+import json
+import time
+import atexit
+import signal
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR = os.path.join(PROJECT_DIR, "run", "tasks")
+
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = 60.0
+
+_registered_path = None
+
+
+def _entry_path(pid: int) -> str:
+    return os.path.join(REGISTRY_DIR, f"{pid}.json")
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def register_task(task_name: str, args: Sequence[str] = ()) -> str:
+    """تسجيل العملية الحالية وبدء النبض؛ يُحذف الملف تلقائياً عند الخروج"""
+    global _registered_path
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    pid = os.getpid()
+    path = _entry_path(pid)
+    entry = {
+        'pid': pid,
+        'task': task_name,
+        'args': list(args),
+        'job_id': os.environ.get('AI_TRANSLATOR_JOB_ID'),
+        'started_at': datetime.utcnow().isoformat(),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _registered_path = path
+
+    def beat():
+        while _registered_path == path:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                os.utime(path)
+            except OSError:
+                return
+
+    threading.Thread(target=beat, name="task-heartbeat", daemon=True).start()
+    atexit.register(unregister_task)
+    return path
+
+
+def unregister_task():
+    global _registered_path
+    path, _registered_path = _registered_path, None
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _is_stale(entry: Dict, mtime: float) -> bool:
+    return not pid_alive(entry.get('pid')) or time.time() - mtime > STALE_AFTER
+
+
+def running_tasks() -> List[Dict]:
+    """المهام الحية فقط؛ الإدخالات القديمة تُحذف أثناء القراءة"""
+    tasks = []
+    try:
+        names = os.listdir(REGISTRY_DIR)
+    except FileNotFoundError:
+        return tasks
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(REGISTRY_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _is_stale(entry, mtime):
+            logger.info(f"Removing stale task entry {name} ({entry.get('task')})")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        entry['heartbeat_at'] = datetime.utcfromtimestamp(mtime).isoformat()
+        tasks.append(entry)
+    return tasks
+
+
+def is_task_alive(pid: Optional[int]) -> bool:
+    """العملية حية ومسجلة كمهمة (يحمي من إعادة استخدام رقم العملية)"""
+    if not pid_alive(pid):
+        return False
+    try:
+        return time.time() - os.path.getmtime(_entry_path(pid)) <= STALE_AFTER
+    except OSError:
+        return False
+
+
+def stop_tasks(exclude_pids: Sequence[int] = ()) -> int:
+    """إرسال SIGTERM لكل المهام المسجلة الحية عدا exclude_pids؛ يعيد عددها
+
+    A second SIGTERM could interrupt the atexit flush of a task that is
+    already shutting down, so callers pass the PIDs they have signalled.
+    """
+    stopped = 0
+    for entry in running_tasks():
+        if entry.get('pid') in exclude_pids:
+            continue
+        try:
+            os.kill(entry['pid'], signal.SIGTERM)
+            stopped += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return stopped
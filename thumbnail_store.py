@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Thumbnail Store - Content-addressed poster cache on disk
+مخزن الصور المصغرة - تخزين الملصقات على القرص حسب بصمة المحتوى
+
+Each image is stored once under the sha256 of its bytes; the database keeps
+only that 64-character key. Resized variants are generated the first time
+they are needed and kept next to the original; a variant that cannot be
+generated is marked as failed and the original is served instead, without
+trying again. Identical posters (every episode of a series) share one file.
+"""
+
+import io
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+THUMBNAIL_DIR = os.path.join(PROJECT_DIR, "thumbnails")
+
+# العرض والارتفاع الأقصى لكل مقاس، بنسبة الملصقات 2:3
+VARIANTS = {
+    'small': (100, 150),
+    'medium': (300, 450),
+}
+JPEG_QUALITY = 85
+
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    PIL_AVAILABLE = False
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(key and _KEY_RE.match(key))
+
+
+def guess_mimetype(path: str) -> str:
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    if header.startswith(b'\x89PNG'):
+        return 'image/png'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[:3] == b'GIF':
+        return 'image/gif'
+    return 'image/jpeg'
+
+
+class ThumbnailStore:
+    """تخزين واسترجاع الصور حسب بصمة sha256"""
+
+    def __init__(self, root: str = THUMBNAIL_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # (مفتاح, مقاس) تعذر تصغيرها؛ المحتوى ثابت لكل مفتاح فلا فائدة من المحاولة مجدداً
+        self._failed = set()
+
+    def _dir_for(self, key: str) -> str:
+        # مجلدان فرعيان لكي لا يحتوي مجلد واحد على عشرات آلاف الملفات
+        return os.path.join(self.root, key[:2], key[2:4])
+
+    def _path(self, key: str, variant: Optional[str] = None) -> str:
+        suffix = f".{variant}.jpg" if variant else ".orig"
+        return os.path.join(self._dir_for(key), key + suffix)
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, data: bytes, variants=('small',)) -> str:
+        """حفظ الصورة وإرجاع مفتاحها؛ الصورة الموجودة مسبقاً لا تُكتب مرة أخرى"""
+        key = hashlib.sha256(data).hexdigest()
+        original = self._path(key)
+        if not os.path.exists(original):
+            self._write_atomic(original, data)
+        for variant in variants:
+            self.get_path(key, variant)
+        return key
+
+    def exists(self, key: str) -> bool:
+        return is_valid_key(key) and os.path.exists(self._path(key))
+
+    def _failed_marker(self, key: str, variant: str) -> str:
+        return os.path.join(self._dir_for(key), f"{key}.{variant}.failed")
+
+    def _resize_failed(self, key: str, variant: str) -> bool:
+        if (key, variant) in self._failed:
+            return True
+        if os.path.exists(self._failed_marker(key, variant)):
+            self._failed.add((key, variant))
+            return True
+        return False
+
+    def resolve(self, key: str, variant: Optional[str] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """(المسار, المقاس المُقدَّم فعلاً)؛ المقاس None يعني الأصل عندما لا يمكن التصغير"""
+        if not is_valid_key(key):
+            return None
+        original = self._path(key)
+        if not os.path.exists(original):
+            return None
+        if not variant or variant not in VARIANTS or not PIL_AVAILABLE:
+            return original, None
+
+        resized = self._path(key, variant)
+        if os.path.exists(resized):
+            return resized, variant
+        if self._resize_failed(key, variant):
+            return original, None
+        with self._lock:
+            if not os.path.exists(resized):
+                try:
+                    self._write_atomic(resized, self._resize(original, VARIANTS[variant]))
+                except Exception as e:
+                    logger.warning(f"Could not resize thumbnail {key} to {variant}, serving the original: {e}")
+                    self._failed.add((key, variant))
+                    try:
+                        self._write_atomic(self._failed_marker(key, variant), str(e).encode('utf-8'))
+                    except OSError:
+                        pass
+                    return original, None
+        return resized, variant
+
+    def get_path(self, key: str, variant: Optional[str] = None) -> Optional[str]:
+        """مسار الملف للمقاس المطلوب، يُنشأ عند أول طلب؛ الأصل إذا تعذر التصغير"""
+        resolved = self.resolve(key, variant)
+        return resolved[0] if resolved else None
+
+    def _resize(self, path: str, size) -> bytes:
+        with Image.open(path) as image:
+            image = image.convert('RGB')
+            image.thumbnail(size)
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            return buffer.getvalue()
+
+
+_store = None
+
+
+def get_thumbnail_store() -> ThumbnailStore:
+    global _store
+    if _store is None:
+        _store = ThumbnailStore()
+    return _store
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Translation Memory - Segment-level cache for subtitle translations
+ذاكرة الترجمة - تخزين ترجمة كل سطر حواري لإعادة استخدامها بين الحلقات
+
+Entries are keyed by the normalized source text, the Ollama model and the
+target language, so switching models never serves a stale translation.
+"""
+
+import re
+import sys
+import os
+import hashlib
+import logging
+import threading
+import unicodedata
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 100000
+
+# عدادات العملية الحالية، تُعرض في السجل وفي واجهة الإحصائيات
+_counters = {'hits': 0, 'misses': 0}
+_counters_lock = threading.Lock()
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_source(text: str) -> str:
+    """توحيد النص المصدر: NFKC، مسافات موحدة، أحرف صغيرة (العربية لا تفرق بين الحالتين)"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def make_key(text: str, model: str, target_language: str) -> str:
+    payload = f"{model}\x00{target_language}\x00{normalize_source(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_counters() -> Dict[str, int]:
+    with _counters_lock:
+        return dict(_counters)
+
+
+class TranslationMemoryStore:
+    """واجهة قراءة وكتابة ذاكرة الترجمة لنموذج ولغة محددين"""
+
+    def __init__(self, model: str, target_language: str = 'ar', max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.model = model
+        self.target_language = target_language
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, str]):
+        """إنشاء الذاكرة من الإعدادات، أو None إذا كانت معطلة"""
+        if str(settings.get('translation_memory_enabled', 'true')).lower() not in ['true', '1', 'yes']:
+            return None
+        try:
+            max_entries = int(settings.get('translation_memory_max_entries', DEFAULT_MAX_ENTRIES))
+        except (TypeError, ValueError):
+            max_entries = DEFAULT_MAX_ENTRIES
+        return cls(settings.get('ollama_model', 'llama3'), 'ar', max_entries)
+
+    def _key(self, text: str) -> str:
+        return make_key(text, self.model, self.target_language)
+
+    def lookup(self, texts: List[str]) -> Dict[str, str]:
+        """البحث عن ترجمات محفوظة؛ يعيد {النص المصدر: الترجمة} للنصوص الموجودة فقط"""
+        keys = {}
+        for text in texts:
+            if text and text.strip():
+                keys.setdefault(self._key(text), []).append(text)
+        if not keys:
+            return {}
+
+        found = {}
+        try:
+            sys.path.append(os.path.dirname(__file__))
+            from app import app, db
+            from models import TranslationMemory
+
+            with app.app_context():
+                key_list = list(keys)
+                rows = []
+                # تقسيم الاستعلام لتجنب حد عدد المتغيرات في SQLite
+                for i in range(0, len(key_list), 500):
+                    rows.extend(
+                        TranslationMemory.query
+                        .filter(TranslationMemory.source_hash.in_(key_list[i:i + 500]))
+                        .all()
+                    )
+
+                now = datetime.utcnow()
+                for row in rows:
+                    for text in keys[row.source_hash]:
+                        found[text] = row.translated_text
+                    row.hit_count = (row.hit_count or 0) + len(keys[row.source_hash])
+                    row.last_used_at = now
+                db.session.commit()
+        except Exception as e:
+            logger.warning(f"Translation memory lookup failed: {e}")
+            found = {}
+
+        lookups = sum(len(group) for group in keys.values())
+        hits = sum(1 for text in texts if text in found)
+        with _counters_lock:
+            _counters['hits'] += hits
+            _counters['misses'] += lookups - hits
+        return found
+
+    def store(self, pairs: List[Tuple[str, str]]) -> int:
+        """حفظ أزواج (المصدر، الترجمة) الجديدة ثم تطبيق حد الحجم"""
+        entries = {}
+        for source, translated in pairs:
+            if not source or not translated or not source.strip() or not translated.strip():
+                continue
+            # الترجمة المطابقة للأصل تعني غالباً فشل الترجمة، لا تُحفظ
+            if normalize_source(source) == normalize_source(translated):
+                continue
+            entries[self._key(source)] = (source, translated)
+        if not entries:
+            return 0
+
+        try:
+            sys.path.append(os.path.dirname(__file__))
+            from app import app, db
+            from models import TranslationMemory
+
+            with app.app_context():
+                key_list = list(entries)
+                existing = set()
+                for i in range(0, len(key_list), 500):
+                    existing.update(
+                        row.source_hash for row in
+                        db.session.query(TranslationMemory.source_hash)
+                        .filter(TranslationMemory.source_hash.in_(key_list[i:i + 500]))
+                    )
+
+                new_rows = [
+                    {
+                        'source_hash': key,
+                        'source_text': source,
+                        'translated_text': translated,
+                        'model': self.model,
+                        'target_language': self.target_language,
+                        'hit_count': 0,
+                    }
+                    for key, (source, translated) in entries.items() if key not in existing
+                ]
+                # عاملان قد يضيفان المفتاح نفسه بين الاستعلام والإدراج؛ التعارض يُتجاهل بدلاً من فشل الدفعة كلها
+                inserted = self._insert_new(db, TranslationMemory, new_rows) if new_rows else 0
+                db.session.commit()
+                self._evict(db, TranslationMemory)
+                return inserted
+        except Exception as e:
+            logger.warning(f"Translation memory store failed: {e}")
+            return 0
+
+    def _insert_new(self, db, TranslationMemory, rows: List[Dict]) -> int:
+        """INSERT ... ON CONFLICT DO NOTHING على source_hash؛ يعيد عدد الصفوف المضافة فعلاً"""
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            db.session.bulk_insert_mappings(TranslationMemory, rows)
+            return len(rows)
+
+        inserted = 0
+        # 100 صف × 8 أعمدة يبقى تحت حد 999 متغيراً في نسخ SQLite القديمة
+        for i in range(0, len(rows), 100):
+            statement = insert(TranslationMemory.__table__).values(rows[i:i + 100])
+            result = db.session.execute(statement.on_conflict_do_nothing(index_elements=['source_hash']))
+            inserted += max(result.rowcount or 0, 0)
+        return inserted
+
+    def _evict(self, db, TranslationMemory):
+        """حذف الإدخالات الأقل استخداماً مؤخراً عند تجاوز الحد الأقصى"""
+        total = TranslationMemory.query.count()
+        overflow = total - self.max_entries
+        if overflow <= 0:
+            return
+
+        stale_ids = [
+            row.id for row in
+            db.session.query(TranslationMemory.id)
+            .order_by(TranslationMemory.last_used_at.asc())
+            .limit(overflow)
+        ]
+        for i in range(0, len(stale_ids), 500):
+            TranslationMemory.query.filter(
+                TranslationMemory.id.in_(stale_ids[i:i + 500])
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        logger.info(f"Translation memory evicted {len(stale_ids)} entries")
+
+
+def get_translation_memory_stats() -> Dict[str, int]:
+    """إحصائيات الذاكرة: عدد الإدخالات، مجموع مرات الاستخدام، وعدادات العملية الحالية"""
+    from models import db, TranslationMemory
+
+    entries, total_hits = db.session.query(
+        db.func.count(TranslationMemory.id),
+        db.func.coalesce(db.func.sum(TranslationMemory.hit_count), 0)
+    ).one()
+    stats = get_counters()
+    stats.update({'entries': entries, 'total_hits': int(total_hits)})
+    return stats
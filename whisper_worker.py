@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Whisper Worker - Persistent transcription process
+عامل Whisper الدائم - يحمّل النموذج مرة واحدة ويستقبل مهام التفريغ عبر طابور محلي
+
+The worker runs in its own process so a crash in the model runtime cannot take
+down the caller, and keeps `FastWhisperIntegration.model_cache` alive across
+every job submitted during a batch run.
+"""
+
+import os
+import atexit
+import logging
+import itertools
+import importlib.util
+import multiprocessing
+import queue
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from subtitles import Cue, serialize_srt
+
+logger = logging.getLogger(__name__)
+
+# المهلة القصوى لتفريغ ملف واحد (نفس حد أمر whisper السابق)
+DEFAULT_JOB_TIMEOUT = 7200
+
+
+def is_worker_available() -> bool:
+    """فحص توفر faster-whisper دون تحميله في العملية الحالية"""
+    return importlib.util.find_spec("faster_whisper") is not None
+
+
+_cuda_device_count = None
+
+
+def get_cuda_device_count() -> int:
+    """عدد بطاقات CUDA المتاحة لـ ctranslate2؛ يُفحص مرة واحدة لكل عملية"""
+    global _cuda_device_count
+    if _cuda_device_count is None:
+        try:
+            import ctranslate2
+            _cuda_device_count = ctranslate2.get_cuda_device_count()
+        except Exception as e:
+            logger.info(f"CUDA is not available for faster-whisper: {e}")
+            _cuda_device_count = 0
+    return _cuda_device_count
+
+
+def resolve_device(gpu_id: str) -> Tuple[str, int, str]:
+    """تحويل إعداد whisper_gpu_id إلى (device, device_index, compute_type)"""
+    if gpu_id == 'cpu':
+        return 'cpu', 0, 'int8'
+    # بدون بطاقة رسومية يفشل تحميل النموذج على cuda في كل ملف؛ المعالج مباشرة
+    device_count = get_cuda_device_count()
+    if device_count == 0:
+        if gpu_id not in (None, '', 'auto'):
+            logger.warning(f"GPU {gpu_id} requested but no CUDA device is available, using CPU")
+        return 'cpu', 0, 'int8'
+    if gpu_id in (None, '', 'auto'):
+        return 'cuda', 0, 'float16'
+    try:
+        device_index = int(gpu_id)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid GPU ID: {gpu_id}, using auto selection")
+        return 'cuda', 0, 'float16'
+    if not 0 <= device_index < device_count:
+        logger.warning(f"GPU {gpu_id} not found ({device_count} CUDA devices), using GPU 0")
+        return 'cuda', 0, 'float16'
+    return 'cuda', device_index, 'float16'
+
+
+def write_srt(segments: List[Dict[str, Any]], srt_path: str) -> str:
+    """كتابة مقاطع التفريغ إلى ملف SRT"""
+    cues = [
+        Cue(i, int(round(segment['start'] * 1000)), int(round(segment['end'] * 1000)), segment['text'].strip())
+        for i, segment in enumerate((s for s in segments if s.get('text', '').strip()), 1)
+    ]
+    with open(srt_path, 'w', encoding='utf-8') as f:
+        f.write(serialize_srt(cues))
+    return srt_path
+
+
+def _worker_loop(job_queue, result_queue):
+    """حلقة العامل: تحميل النماذج عند الطلب وإبقاؤها في الذاكرة"""
+    from ai_integration_workaround import FastWhisperIntegration
+
+    whisper = FastWhisperIntegration()
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        job_id = job["job_id"]
+        try:
+            result = whisper.transcribe_audio(
+                job["audio_path"],
+                job["model_size"],
+                device=job["device"],
+                device_index=job["device_index"],
+                compute_type=job["compute_type"],
+                language=job.get("language"),
+            )
+            if "error" in result:
+                result_queue.put((job_id, {"error": result["error"]}))
+                continue
+
+            audio_name = os.path.splitext(os.path.basename(job["audio_path"]))[0]
+            srt_path = os.path.join(os.path.dirname(job["audio_path"]), f"{audio_name}.srt")
+            write_srt(result["segments"], srt_path)
+            result_queue.put((job_id, {"success": True, "srt_path": srt_path}))
+        except Exception as e:
+            result_queue.put((job_id, {"error": str(e)}))
+
+
+class WhisperWorker:
+    """عملية تفريغ طويلة العمر تُشارك بين كل ملفات الدفعة"""
+
+    def __init__(self):
+        self._process = None
+        self._job_queue = None
+        self._result_queue = None
+        self._reader = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """تشغيل عملية العامل إذا لم تكن تعمل"""
+        with self._lock:
+            if self.is_running():
+                return
+            self._job_queue = multiprocessing.Queue()
+            self._result_queue = multiprocessing.Queue()
+            self._process = multiprocessing.Process(
+                target=_worker_loop,
+                args=(self._job_queue, self._result_queue),
+                name="whisper-worker",
+                daemon=True,
+            )
+            self._process.start()
+            self._reader = threading.Thread(target=self._read_results, daemon=True)
+            self._reader.start()
+            logger.info(f"✓ Whisper worker started (pid {self._process.pid})")
+
+    def _read_results(self):
+        """توجيه النتائج إلى الطلبات المنتظرة حسب رقم المهمة"""
+        result_queue = self._result_queue
+        process = self._process
+        while True:
+            try:
+                job_id, result = result_queue.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    # stop() يتولى الطلبات المعلقة عند الإيقاف المقصود
+                    if self._process is process:
+                        self._fail_pending("Whisper worker exited unexpectedly")
+                    return
+                continue
+            except (EOFError, OSError):
+                if self._process is process:
+                    self._fail_pending("Whisper worker connection lost")
+                return
+
+            with self._lock:
+                waiter = self._pending.pop(job_id, None)
+            if waiter:
+                waiter["result"] = result
+                waiter["event"].set()
+
+    def _fail_pending(self, message: str):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter["result"] = {"error": message}
+            waiter["event"].set()
+
+    def transcribe(self, audio_path: str, model_size: str, gpu_id: str = 'auto',
+                   language: Optional[str] = 'en', timeout: int = DEFAULT_JOB_TIMEOUT) -> Dict[str, Any]:
+        """إرسال ملف صوتي للعامل وانتظار مسار ملف SRT الناتج"""
+        self.start()
+        device, device_index, compute_type = resolve_device(gpu_id)
+
+        job_id = next(self._job_ids)
+        waiter = {"event": threading.Event(), "result": None}
+        with self._lock:
+            self._pending[job_id] = waiter
+
+        self._job_queue.put({
+            "job_id": job_id,
+            "audio_path": audio_path,
+            "model_size": model_size,
+            "device": device,
+            "device_index": device_index,
+            "compute_type": compute_type,
+            "language": language,
+        })
+
+        if not waiter["event"].wait(timeout):
+            with self._lock:
+                self._pending.pop(job_id, None)
+            # العامل عالق في هذه المهمة، إعادة تشغيله أفضل من حجب بقية الدفعة
+            self.stop(force=True)
+            return {"error": f"Transcription timed out ({timeout} seconds)"}
+
+        return waiter["result"]
+
+    def stop(self, force: bool = False):
+        """إيقاف عملية العامل وتحرير النموذج من الذاكرة"""
+        with self._lock:
+            process, self._process = self._process, None
+            job_queue = self._job_queue
+        if process is None:
+            return
+
+        if not force and process.is_alive():
+            try:
+                job_queue.put(None)
+                process.join(timeout=30)
+            except Exception:
+                pass
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=5)
+
+        self._fail_pending("Whisper worker stopped")
+        logger.info("Whisper worker stopped")
+
+
+# مثيل عام واحد لكل عملية
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_whisper_worker() -> WhisperWorker:
+    """الحصول على مثيل العامل المشترك"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = WhisperWorker()
+        return _worker
+
+
+def shutdown_whisper_worker():
+    """إيقاف العامل المشترك إن كان يعمل"""
+    with _worker_lock:
+        worker = _worker
+    if worker is not None:
+        worker.stop()
+
+
+atexit.register(shutdown_whisper_worker)